@@ -14,8 +14,12 @@
 # limitations under the License.
 # =============================================================================
 import os
+import re
 import shutil
 import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from executor.export import run as run_export
 from scripts.generate_project import run as run_generate_project
@@ -72,68 +76,217 @@ def get_output_directories(output_root_dir):
     return output_directories
 
 
+MAKE_LIST = [
+    ["lm_x86", "lm_x86.elf"],
+    ["lm_arm", "lm_arm.elf"],
+    ["lm_fpga", "lm_fpga.elf"],
+    ["lm_aarch64", "lm_aarch64.elf"],
+    ["lib_x86", "lib_x86.so"],
+    ["lib_arm", "lib_arm.so"],
+    ["lib_fpga", "lib_fpga.so"],
+    ["lib_aarch64", "lib_aarch64.so"],
+    ["ar_x86", "libdlk_x86.a"],
+    ["ar_arm", "libdlk_arm.a"],
+    ["ar_fpga", "libdlk_fpga.a"],
+    ["ar_aarch64", "libdlk_aarch64.a"],
+]
+
+# variables of the Makefile which change compiled objects
+OBJECT_VARIABLES = ["CXX", "FLAGS"]
+
+BUILD_DIR_NAME = "build"
+
+
 def strip_binary(output):
     """Strip binary file.
 
     Args:
-        output: 
+        output: Path to the binary file.
 
     """
 
-    if output == "lm_x86.elf":
+    name = os.path.basename(output)
+    if name == "lm_x86.elf":
         subprocess.run(("strip", output))
-    elif output == "lib_x86.so":
+    elif name == "lib_x86.so":
         subprocess.run(("strip", "-x", "--strip-unneeded", output))
-    elif output in {"lm_arm.elf", "lm_fpga.elf"}:
+    elif name in {"lm_arm.elf", "lm_fpga.elf"}:
         subprocess.run(("arm-linux-gnueabihf-strip", output))
-    elif output in {"lib_arm.so", "lib_fpga.so"}:
+    elif name in {"lib_arm.so", "lib_fpga.so"}:
         subprocess.run(("arm-linux-gnueabihf-strip", "-x", "--strip-unneeded", output))
 
 
-def make_all(project_dir, output_dir):
+def select_targets(targets=None):
+    """Select targets of `MAKE_LIST`.
+
+    Args:
+        targets (list): Target names like `lib_x86`, each of them may be comma separated.
+            (Default value = None, all the targets)
+
+    Returns:
+        list: Pairs of the target and the output file in the order of `MAKE_LIST`.
+
+    """
+
+    if not targets:
+        return list(MAKE_LIST)
+
+    names = {name.strip() for target in targets for name in target.split(",") if name.strip()}
+    unknown = names - {target for target, _ in MAKE_LIST}
+    if unknown:
+        raise ValueError("Unknown targets {}. Targets are {}.".format(
+            sorted(unknown), [target for target, _ in MAKE_LIST]))
+
+    return [[target, output] for target, output in MAKE_LIST if target in names]
+
+
+def target_cxxflags(target, cxxflags=""):
+    """Return CXXFLAGS of the target, `lm_*` targets measure time of each function."""
+
+    if target.startswith("lm_"):
+        return cxxflags + " -DFUNC_TIME_MEASUREMENT"
+    return cxxflags
+
+
+def group_targets(makefile_path, make_list, cxxflags=""):
+    """Group targets which compile the same objects, so the objects are compiled once for the group.
+
+    Args:
+        makefile_path (str): Path to Makefile of the project.
+        make_list (list): Pairs of the target and the output file.
+        cxxflags (str): CXXFLAGS from the environment. (Default value = "")
+
+    Returns:
+        list: Lists of pairs of the target and the output file.
+
+    """
+
+    pattern = re.compile(r"^(\w+):\s+(\w+)\s*\+?=\s*(.*)$")
+    variables = {}
+    with open(makefile_path) as f:
+        for line in f:
+            match = pattern.match(line.strip())
+            if match and match.group(2) in OBJECT_VARIABLES:
+                target, name, value = match.groups()
+                variables.setdefault(target, {})[name] = " ".join(value.split())
+
+    groups = OrderedDict()
+    for target, output in make_list:
+        key = (
+            tuple(variables.get(target, {}).get(name, "") for name in OBJECT_VARIABLES),
+            target_cxxflags(target, cxxflags),
+        )
+        groups.setdefault(key, []).append([target, output])
+
+    return list(groups.values())
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def prepare_build_directory(project_dir, name):
+    """Create an out-of-tree build directory of the project, whose files are hard links to the project files.
+
+    Args:
+        project_dir (str): Path to project directory
+        name (str): Name of the build directory.
+
+    Returns:
+        str: Path to the build directory.
+
+    """
+
+    build_dir = os.path.join(project_dir, BUILD_DIR_NAME, name)
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+
+    def ignore_build_dir(path, names):
+        return [BUILD_DIR_NAME] if os.path.samefile(path, project_dir) else []
+
+    shutil.copytree(project_dir, build_dir, ignore=ignore_build_dir, copy_function=_link_or_copy)
+    return build_dir
+
+
+def make_group(project_dir, output_dir, group, jobs, cxxflags=""):
+    """Make targets of a group one after another in the build directory of the group.
+
+    The objects compiled by the first target are reused by the following targets.
+
+    Args:
+        project_dir (str): Path to project directory
+        output_dir (str): Path to output directory
+        group (list): Pairs of the target and the output file.
+        jobs (int): The number of jobs of make.
+        cxxflags (str): CXXFLAGS from the environment. (Default value = "")
+
+    Returns:
+        list: Tuples of the target, the build time in seconds and if it succeeded.
+
+    """
+
+    build_dir = prepare_build_directory(project_dir, group[0][0])
+    results = []
+    for target, output in group:
+        env = dict(os.environ, CXXFLAGS=target_cxxflags(target, cxxflags))
+
+        start = time.perf_counter()
+        process = subprocess.run(("make", target, "-j{}".format(jobs), "--quiet"), cwd=build_dir, env=env)
+        output_path = os.path.join(build_dir, output)
+        succeeded = process.returncode == 0 and os.path.exists(output_path)
+        if succeeded:
+            strip_binary(output_path)
+            shutil.move(output_path, os.path.join(output_dir, output))
+        results.append((target, time.perf_counter() - start, succeeded))
+
+    return results
+
+
+def make_all(project_dir, output_dir, targets=None, jobs=None):
     """Make each target.
 
+    Targets which compile the same objects are made one after another in their own build directory,
+    and such groups of targets are made concurrently.
+
     Args:
         project_dir (str): Path to project directory
         output_dir (str): Path to output directory
+        targets (list): Target names to be made, like `lib_x86`. (Default value = None, all the targets)
+        jobs (int): The number of jobs of all the makes. (Default value = None, the number of CPUs)
 
     """
 
-    make_list = [
-        ["lm_x86", "lm_x86.elf"],
-        ["lm_arm", "lm_arm.elf"],
-        ["lm_fpga", "lm_fpga.elf"],
-        ["lm_aarch64", "lm_aarch64.elf"],
-        ["lib_x86", "lib_x86.so"],
-        ["lib_arm", "lib_arm.so"],
-        ["lib_fpga", "lib_fpga.so"],
-        ["lib_aarch64", "lib_aarch64.so"],
-        ["ar_x86", "libdlk_x86.a"],
-        ["ar_arm", "libdlk_arm.a"],
-        ["ar_fpga", "libdlk_fpga.a"],
-        ["ar_aarch64", "libdlk_aarch64.a"],
-    ]
+    make_list = select_targets(targets)
     output_dir = os.path.abspath(output_dir)
-    running_dir = os.getcwd()
-    # Change current directory to project directory
-    os.chdir(project_dir)
+    project_dir = os.path.abspath(project_dir)
+    jobs = jobs or os.cpu_count() or 1
 
-    cxxflags_cache = os.getenv("CXXFLAGS", "")
+    cxxflags = os.getenv("CXXFLAGS", "")
+    groups = group_targets(os.path.join(project_dir, "Makefile"), make_list, cxxflags)
 
-    # Make each target and move output files
-    for target, output in make_list:
-        if target in ["lm_x86", "lm_arm", "lm_fpga", "lm_aarch64"]:
-            os.environ["CXXFLAGS"] = cxxflags_cache + " -DFUNC_TIME_MEASUREMENT"
-        else:
-            os.environ["CXXFLAGS"] = cxxflags_cache
+    # share the job budget among the concurrent makes
+    num_workers = max(1, min(len(groups), jobs))
+    jobs_per_make = max(1, jobs // num_workers)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_workers) as executor:
+        futures = [
+            executor.submit(make_group, project_dir, output_dir, group, jobs_per_make, cxxflags) for group in groups
+        ]
+        results = [result for future in futures for result in future.result()]
+
+    shutil.rmtree(os.path.join(project_dir, BUILD_DIR_NAME), ignore_errors=True)
+
+    for target, seconds, succeeded in results:
+        print("{:>12}: {:8.2f} sec{}".format(target, seconds, "" if succeeded else " FAILED"))
+    print("{:>12}: {:8.2f} sec with {} jobs".format("total", time.perf_counter() - start, jobs))
 
-        subprocess.run(("make", "clean", "--quiet"))
-        subprocess.run(("make", target, "-j4", "--quiet"))
-        strip_binary(output)
-        output_file_path = os.path.join(output_dir, output)
-        os.rename(output, output_file_path)
-    # Return running directory
-    os.chdir(running_dir)
+    failed = [target for target, _, succeeded in results if not succeeded]
+    if failed:
+        raise RuntimeError("Failed to make targets {}".format(failed))
 
 
 def run(experiment_id,
@@ -141,7 +294,9 @@ def run(experiment_id,
         output_template_dir=None,
         image_size=(None, None),
         project_name=None,
-        save_npy_for_debug=True):
+        save_npy_for_debug=True,
+        targets=None,
+        jobs=None):
     """Convert from trained model.
 
     Args:
@@ -150,6 +305,8 @@ def run(experiment_id,
         output_template_dir:  (Default value = None)
         image_size: (Default value = (None)
         project_name: (Default value = None)
+        targets: Target names to be made, like `lib_x86`. (Default value = None, all the targets)
+        jobs: The number of jobs to make the targets. (Default value = None, the number of CPUs)
 
     Returns:
         str: Path of exported dir.
@@ -195,7 +352,7 @@ def run(experiment_id,
     # Make
     project_dir_name = "{}.prj".format(project_name)
     project_dir = os.path.join(export_dir, project_dir_name)
-    make_all(project_dir, output_directories.get("library_dir"))
+    make_all(project_dir, output_directories.get("library_dir"), targets, jobs)
 
     return output_root_dir
 
@@ -206,7 +363,9 @@ def convert(
     template=None,
     image_size=(None, None),
     project_name=None,
-    save_npy_for_debug=True
+    save_npy_for_debug=True,
+    targets=None,
+    jobs=None
 ):
     output_dir = os.environ.get('OUTPUT_DIR', 'saved')
 
@@ -215,4 +374,4 @@ def convert(
     else:
         restore_path = os.path.join(output_dir, experiment_id, 'checkpoints', checkpoint)
 
-    return run(experiment_id, restore_path, template, image_size, project_name, save_npy_for_debug)
+    return run(experiment_id, restore_path, template, image_size, project_name, save_npy_for_debug, targets, jobs)
@@ -110,8 +110,22 @@ def train(config, experiment_id=None):
     help="project name which generated by convert",
     default=None,
 )
-def convert(experiment_id, checkpoint, template, image_size, project_name):
-    export_output_root_dir = run_convert(experiment_id, checkpoint, template, image_size, project_name)
+@click.option(
+    "--targets",
+    help="Comma separated targets to be built, e.g. --targets lib_x86,lm_x86. Can be given multiple times. "
+    "If it is not provided, all the targets are built.",
+    multiple=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="The number of jobs to build the targets. If it is not provided, the number of CPUs.",
+    type=int,
+    default=None,
+)
+def convert(experiment_id, checkpoint, template, image_size, project_name, targets, jobs):
+    export_output_root_dir = run_convert(
+        experiment_id, checkpoint, template, image_size, project_name, targets=list(targets), jobs=jobs)
 
     click.echo('Output files are generated in {}'.format(export_output_root_dir))
     click.echo('Please see {}/README.md to run prediction'.format(export_output_root_dir))
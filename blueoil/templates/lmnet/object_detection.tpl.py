@@ -80,6 +80,7 @@ POST_PROCESSOR = Sequence([
         classes=CLASSES,
         anchors=anchors,
         data_format=DATA_FORMAT,
+        score_threshold=score_threshold,
     ),
     ExcludeLowScoreBox(threshold=score_threshold),
     NMS(iou_threshold=nms_iou_threshold, max_output_size=nms_max_output_size, classes=CLASSES,),
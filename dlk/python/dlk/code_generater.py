@@ -14,7 +14,6 @@
 # limitations under the License.
 # =============================================================================
 import shutil
-from collections import defaultdict
 from os import path
 from pathlib import Path
 from typing import cast
@@ -22,6 +21,7 @@ from typing import cast
 import utils
 from core.config import Config
 from core.graph import Graph
+from core.memory_planner import MemoryPlanner
 from core.operators import Conv
 from template import Template
 
@@ -36,12 +36,15 @@ class CodeGenerater(object):
         self.params = params
         self.config = config
         assert len(self.graph.get_inputs()) == 1, 'Codegenerator does not support multiple inputs.'
+        # output buffers of all the operators are placed in a single arena
+        self.memory_plan = MemoryPlanner(self.graph).plan()
         self.template = Template({
             'graph': self.graph,
             'params': self.params,
             'config': self.config,
             'graph_input': self.graph.get_inputs()[0],
             'graph_output': self.graph.non_variables[-1],
+            'memory_plan': self.memory_plan,
         })
         self.src_dir = path.join(self.config.output_pj_path, 'src')
         self.header_dir = path.join(self.config.output_pj_path, 'include')
@@ -116,44 +119,3 @@ class CodeGenerater(object):
         self.template.generate(header_template_path,
                                self.header_dir,
                                quantized_convs=qconvs_convs)
-
-    def reuse_output_buffers(self):
-
-        operations = self.graph.non_variables
-        candidates = defaultdict(set)
-
-        for idx, op in enumerate(operations):
-            prev_ops = operations[:idx]
-            next_ops = operations[idx:]
-
-            next_inputs = []
-            for x in next_ops:
-                for i in x.input_ops.values():
-                    next_inputs.append(i.name)
-
-            aliased = set()
-            for prev_op in prev_ops:
-                if prev_op.op_type in ['Reshape', 'Split']:
-                    aliased.add(prev_op.name)
-                    for i in prev_op.input_ops.values():
-                        aliased.add(i.name)
-                if prev_op.name not in next_inputs and prev_op.size >= op.size and prev_op.dtype == op.dtype:
-                    candidates[op.name].add(prev_op.name)
-
-            candidates[op.name] = candidates[op.name].difference(aliased)
-
-        being_reused = []
-        reusing = []
-        for op in operations:
-            cs = candidates[op.name]
-            if cs:
-                reusable_buffer = None
-                for option in cs:
-                    if option not in being_reused and option not in reusing:
-                        reusable_buffer = option
-                        break
-
-                if reusable_buffer:
-                    op.available_buffer = reusable_buffer
-                    being_reused.append(reusable_buffer)
-                    reusing.append(op.name)
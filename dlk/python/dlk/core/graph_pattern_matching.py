@@ -19,6 +19,9 @@
 def sort_graph(graph):
     """Helper function to topologically sort a given graph.
 
+    The order is cached in the graph and computed again only after the graph or
+    the inputs of an operator are modified.
+
     Args:
         graph (Graph): The input graph to be sorted. It is not modified.
 
@@ -27,21 +30,22 @@ def sort_graph(graph):
             a Operator object.
     
     """
-    exec_list = list()
-    input_nodes = list()
-    for node in graph.operators:
-        input_nodes += [n.name for n in node.input_nodes]
+    return list(graph.sorted_operators)
 
-    output_nodes = list()
-    for node in graph.operators:
-        if node not in input_nodes:
-            output_nodes.append(node)
 
-    visited = {}
-    for node in graph.operators:
-        visited[node.name] = False
+def topological_sort(operators):
+    """Topologically sort operators in depth-first order of their inputs.
+
+    Args:
+        operators (list[Operator]): The starting nodes, visited in this order.
+
+    Returns:
+        list(Operator): A list of Operator, where every operator follows its inputs.
 
-    for node in output_nodes:
+    """
+    exec_list = list()
+    visited = {}
+    for node in operators:
         top_order(node, exec_list, visited)
 
     return exec_list
@@ -50,20 +54,30 @@ def sort_graph(graph):
 def top_order(output_node, exec_list, visited):
     """It topologically sorts a given graph.
 
+    This is iterative instead of recursive, so that deep graphs do not exceed the recursion limit.
+
     Args:
         output_node (Operator): The starting node. First one in the ordered list.
         exec_list (list[operator]): The ordered list. Note that this is an output
             parameter.
-        visited: (list[str]): List of already visited nodes.
+        visited: (dict[str, bool]): Already visited nodes. Note that this is an output
+            parameter.
     
     """
-    if visited[output_node.name]:
+    if visited.get(output_node.name):
         return
-    for input_node in output_node.input_nodes:
-        top_order(input_node, exec_list, visited)
-
-    exec_list.append(output_node)
     visited[output_node.name] = True
+    stack = [(output_node, iter(output_node.input_nodes))]
+    while stack:
+        node, inputs = stack[-1]
+        for input_node in inputs:
+            if not visited.get(input_node.name):
+                visited[input_node.name] = True
+                stack.append((input_node, iter(input_node.input_nodes)))
+                break
+        else:
+            stack.pop()
+            exec_list.append(node)
 
 
 def get_nodes_in_branch(starting_node, stop_node, node_list):
@@ -78,12 +92,15 @@ def get_nodes_in_branch(starting_node, stop_node, node_list):
         stop_node (Operator): The last node in the path. If stop_node is None then this
             function will give us every node above starting_node.
         node_list (list[Operator]): The list of nodes contained in the branch. Note
-            that this is an output parameter.
+            that this is an output parameter. Each node is appended only once.
 
     """
-    if starting_node == stop_node:
-        return
-    node_list.append(starting_node)
-
-    for node in starting_node.input_nodes:
-        get_nodes_in_branch(node, stop_node, node_list)
+    visited = set()
+    stack = [starting_node]
+    while stack:
+        node = stack.pop()
+        if node == stop_node or id(node) in visited:
+            continue
+        visited.add(id(node))
+        node_list.append(node)
+        stack.extend(reversed(node.input_nodes))
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Memory planner module, which places the output buffers of operators in a single arena."""
+from typing import Dict, List
+
+from core.data_types import QUANTIZED_PACKED
+from core.graph import Graph
+from core.operators import Operator
+
+# operators whose outputs may refer to the input buffers, so the inputs are kept alive while the outputs are used.
+ALIAS_TYPES = ['Identity', 'Reshape', 'Split']
+
+# sizes of the types which do not have numpy types
+SPECIAL_TYPE_BYTES = {
+    'int': 4,
+    'unsigned': 4,
+    'float': 4,
+    'double': 8,
+}
+
+
+def buffer_names(op: Operator) -> List[str]:
+    """Return names of the output buffers of the operator, as the generated code names `<name>_raw`."""
+    keys = list(op.output_ops.keys())
+    if len(keys) > 1:
+        return [op.name + '_' + k for k in keys]
+    return [op.name] if keys else []
+
+
+def buffer_bytes(op: Operator) -> int:
+    """Return the byte size of an output buffer of the operator."""
+    if op.dtype == QUANTIZED_PACKED():
+        # the packed words have one bit for each element, regardless of the word size
+        return -(-op.size // 8)
+
+    cpptype = op.dtype.cpptype()
+    if cpptype in SPECIAL_TYPE_BYTES:
+        return op.size * SPECIAL_TYPE_BYTES[cpptype]
+    return op.size * op.dtype.nptype()(0).itemsize
+
+
+class Buffer(object):
+    """Output buffer of an operator, which is live from `start` to `end` (both inclusive) in the execution order."""
+
+    def __init__(self, name: str, op: Operator, size: int, start: int, end: int) -> None:
+        self.name = name
+        self.op = op
+        self.size = size
+        self.start = start
+        self.end = end
+        self.offset = -1
+
+    def overlaps(self, other: 'Buffer') -> bool:
+        """Return if the lifetimes of two buffers overlap."""
+        return self.start <= other.end and other.start <= self.end
+
+    def shares_memory(self, other: 'Buffer') -> bool:
+        """Return if the placed bytes of two buffers overlap in the arena."""
+        return self.offset < other.offset + other.size and other.offset < self.offset + self.size
+
+
+class MemoryPlan(object):
+    """Result of `MemoryPlanner.plan`.
+
+    Args:
+        buffers (list[Buffer]): Placed buffers in the execution order.
+        alignment (int): Alignment of the offsets in bytes.
+
+    """
+
+    def __init__(self, buffers: List[Buffer], alignment: int) -> None:
+        self.buffers = buffers
+        self.alignment = alignment
+        self.__buffer_dict: Dict[str, Buffer] = {b.name: b for b in buffers}
+        self.__shared_names = {b.name for b in buffers for other in buffers
+                               if other is not b and b.shares_memory(other)}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__buffer_dict
+
+    def offset(self, name: str) -> int:
+        """Return the offset in bytes of the buffer in the arena."""
+        return self.__buffer_dict[name].offset
+
+    def shared_buffers(self, op: Operator) -> List[Buffer]:
+        """Return the output buffers of the operator which share bytes of the arena with other buffers.
+
+        They hold data of the other buffers when the operator runs, while separately allocated buffers
+        were zero-initialized. So the generated code clears them before running the operator.
+        """
+        return [b for b in self.buffers if b.op is op and b.name in self.__shared_names]
+
+    @property
+    def arena_size(self) -> int:
+        """Return the size in bytes of the arena."""
+        return max([b.offset + self._aligned(b.size) for b in self.buffers], default=0)
+
+    @property
+    def unplanned_size(self) -> int:
+        """Return the total size in bytes when every buffer is allocated separately."""
+        return sum(self._aligned(b.size) for b in self.buffers)
+
+    @property
+    def live_size(self) -> int:
+        """Return the maximum total size in bytes of the buffers live at the same time, the lower bound of the arena."""
+        num_steps = max([b.end + 1 for b in self.buffers], default=0)
+        return max([sum(self._aligned(b.size) for b in self.buffers if b.start <= t <= b.end)
+                    for t in range(num_steps)], default=0)
+
+    def _aligned(self, size: int) -> int:
+        return -(-size // self.alignment) * self.alignment
+
+
+class MemoryPlanner(object):
+    """Memory planner, which computes lifetimes of the output buffers over the execution order
+    and assigns their offsets in a single arena with the greedy by size algorithm.
+
+    Buffers whose lifetimes overlap never overlap in the arena.
+
+    Args:
+        graph (Graph): The graph to be planned.
+        alignment (int): Alignment of the offsets in bytes.
+
+    """
+
+    def __init__(self, graph: Graph, alignment: int = 64) -> None:
+        self.graph = graph
+        self.alignment = alignment
+
+    def lifetimes(self) -> List[Buffer]:
+        """Compute lifetimes of the output buffers of the operators in `graph.non_variables`.
+
+        Returns:
+            list[Buffer]: Buffers in the execution order, which are not placed yet.
+
+        """
+        operations = self.graph.non_variables
+        order = {op.name: idx for idx, op in enumerate(operations)}
+        last_step = len(operations) - 1
+
+        buffers: Dict[str, List[Buffer]] = {}
+        for idx, op in enumerate(operations):
+            names = buffer_names(op)
+            keys = list(op.output_ops.keys())
+            op_buffers = []
+            for name, key in zip(names, keys):
+                consumers = op.output_ops[key]
+                if idx == last_step or not consumers or any(c.name not in order for c in consumers):
+                    # the network output or consumed by a variable, so kept to the end
+                    end = last_step
+                else:
+                    end = max(order[c.name] for c in consumers)
+                op_buffers.append(Buffer(name, op, buffer_bytes(op), idx, max(end, idx)))
+            buffers[op.name] = op_buffers
+
+        # outputs of aliasing operators keep their inputs alive, in the reverse order for chains of aliases
+        for op in reversed(operations):
+            if op.op_type not in ALIAS_TYPES or not buffers[op.name]:
+                continue
+            end = max(b.end for b in buffers[op.name])
+            for i in op.input_nodes:
+                for b in buffers.get(i.name, []):
+                    b.end = max(b.end, end)
+
+        return [b for op in operations for b in buffers[op.name]]
+
+    def plan(self) -> MemoryPlan:
+        """Assign offsets to the buffers, larger ones first.
+
+        Returns:
+            MemoryPlan: The placed buffers.
+
+        """
+        buffers = self.lifetimes()
+        placed: List[Buffer] = []
+
+        for buf in sorted(buffers, key=lambda b: (-b.size, b.start)):
+            offset = 0
+            for other in sorted((p for p in placed if p.overlaps(buf)), key=lambda p: p.offset):
+                if offset + buf.size <= other.offset:
+                    break
+                offset = max(offset, self._aligned(other.offset + other.size))
+            buf.offset = offset
+            placed.append(buf)
+
+        return MemoryPlan(buffers, self.alignment)
+
+    def _aligned(self, size: int) -> int:
+        return -(-size // self.alignment) * self.alignment
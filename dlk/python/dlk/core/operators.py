@@ -42,6 +42,10 @@ class Operator(object):
     _input_names: List[str] = ['input']
     _output_names: List[str] = ['output']
 
+    # incremented whenever the inputs of any operator are changed, so that graphs can invalidate
+    # the caches derived from the input edges.
+    _input_version: int = 0
+
     def __init__(self,
                  name: str,
                  shape: List[int],
@@ -59,7 +63,6 @@ class Operator(object):
         self.__connect_to_outputs()
         self._check_consistency()
         self._rank = len(shape)
-        self._available_buffer = ''
 
     def update_shape(self, shape: List[int], dimension_format: str) -> None:
         self._shape: List[int] = shape
@@ -232,6 +235,7 @@ class Operator(object):
         """
         self._assert(ident in self._input_names, "Illegal input name")
         self._input_ops[ident] = node
+        Operator._input_version += 1
 
     def add_inputs(self, inputs: Ops) -> None:
         """Add input (possibly multiple) nodes at a once.
@@ -243,6 +247,7 @@ class Operator(object):
         """
         assert set(inputs.keys()).issubset(set(self._input_names)), "Illegal output names included"
         self._input_ops.update(inputs)
+        Operator._input_version += 1
 
     def add_output(self, ident: str, node: 'Operator') -> None:
         """Add output node.
@@ -287,6 +292,7 @@ class Operator(object):
 
         """
         self._input_ops.pop(ident)
+        Operator._input_version += 1
 
     def remove_output(self, ident: str) -> None:
         """Remove an output node.
@@ -388,14 +394,6 @@ class Operator(object):
     def rank(self) -> int:
         return self._rank
 
-    @property
-    def available_buffer(self) -> str:
-        return self._available_buffer
-
-    @available_buffer.setter
-    def available_buffer(self, v: str) -> None:
-        self._available_buffer = v
-
     def transpose(self, perm: List[int]) -> None:
         """Transpose the shape and format. This operation is destructive."""
         self._assert(len(set(perm)) == len(self._shape), "Illegal permutation specified.")
@@ -14,10 +14,12 @@
 # limitations under the License.
 # =============================================================================
 """Module of optimization passes."""
+import heapq
 import math
+import time
 import warnings
 from collections import defaultdict
-from typing import Any, List, cast
+from typing import Any, Dict, List, cast
 
 import numpy as np
 
@@ -86,67 +88,103 @@ def pass_transpose(graph: Graph) -> None:
         m.transpose(permutation)
 
 
-def pass_constant_folding(graph: Graph) -> None:
+# operators whose folded value depends only on their inputs, shape, dtype and dimension format.
+# they are folded once and the value is reused for the same constant inputs.
+CACHEABLE_FOLDING_TYPES = {
+    'Add',
+    'BatchNormalizationOptimized',
+    'Identity',
+    'MatMul',
+    'Mul',
+    'QTZ_binary_channel_wise_mean_scaling',
+    'QTZ_binary_mean_scaling',
+    'QTZ_linear_mid_tread_half',
+    'Reshape',
+    'Softmax',
+}
+
+
+def pass_constant_folding(graph: Graph) -> Dict[str, Any]:
     """Given a node N, if the value of each input of N is known at compilation time then N will be executed.
        The node N and its inputs will be replaced with a Constant node which holds the computed output of N.
 
+       Nodes are visited from a worklist in topological order, so a folded node makes its consumers
+       foldable in the same pass.
+
     Args:
         graph (Graph): The input graph. It will be modified in-place.
-        processed_nodes (list): The list of the processed nodes so far.
+
+    Returns:
+        dict: Statistics of the pass. 'folded' is the number of folded nodes, 'reused' is the number of them
+            whose value was reused from another folded node, 'removed' is the number of removed nodes
+            and 'seconds' is the elapsed time.
     
     """
+    start = time.perf_counter()
 
-    done = False
-    processed_nodes = []
-    while not done:
-        exec_list = sort_graph(graph)
-        processed_before_precompute = len(processed_nodes)
-        to_be_removed = []
-
-        for m in exec_list:
-            if m in processed_nodes:
-                continue
-
-            # We want operators with inputs
-            if not m.input_nodes:
-                continue
-
-            precomputable = True
-            for input_node in m.input_nodes:
-                if input_node.op_type != 'Constant':
-                    precomputable = False
+    def is_foldable(node: Operator) -> bool:
+        # We want operators with inputs
+        return bool(node.input_nodes) and all(i.op_type == 'Constant' for i in node.input_nodes)
 
-            if not precomputable:
-                continue
+    exec_list = sort_graph(graph)
+    order = {id(m): idx for idx, m in enumerate(exec_list)}
+    worklist = [(order[id(m)], m) for m in exec_list if is_foldable(m)]
+    heapq.heapify(worklist)
+    queued = {id(m) for _, m in worklist}
+
+    folded_values: Dict[tuple, np.ndarray] = {}
+    to_be_removed: List[Operator] = []
+    num_folded = 0
+    num_reused = 0
+
+    while worklist:
+        _, m = heapq.heappop(worklist)
+
+        key = None
+        if m.op_type in CACHEABLE_FOLDING_TYPES:
+            key = (m.op_type, tuple(id(i) for i in m.input_nodes), tuple(m.shape), str(m.dtype), m.dimension)
+
+        if key in folded_values:
+            data = np.copy(folded_values[key])
+            num_reused += 1
+        else:
+            data = m.run_forward()
+            if key is not None:
+                folded_values[key] = data
+        num_folded += 1
+
+        new_constant = Constant(
+            m.name + '_new',
+            m.dtype,
+            data,
+            dimension_format=m.dimension
+        )
+        graph.add_op(new_constant)
 
-            processed_nodes += m.input_nodes
-            processed_nodes.append(m)
+        # get nodes to be removed after being disconnected
+        get_nodes_in_branch(m, None, to_be_removed)
 
-            data = m.run_forward()
+        new_constant.add_outputs({'output': m.output_ops.values()})
+        for output_name, consumer_list in m.output_ops.items():
+            for consumer_node in consumer_list:
+                for input_name, input_node in consumer_node.input_ops.items():
+                    if input_node == m:
+                        consumer_node.add_input(input_name, new_constant)
+                        break
 
-            new_constant = Constant(
-                m.name + '_new',
-                m.dtype,
-                data,
-                dimension_format=m.dimension
-            )
-            graph.add_op(new_constant)
-
-            # get nodes to be removed after being disconnected
-            get_nodes_in_branch(m, None, to_be_removed)
-
-            new_constant.add_outputs({'output': m.output_ops.values()})
-            for output_name, consumer_list in m.output_ops.items():
-                for consumer_node in consumer_list:
-                    for input_name, input_node in consumer_node.input_ops.items():
-                        if input_node == m:
-                            consumer_node.add_input(input_name, new_constant)
-                            break
+                # consumers in the graph follow m in the topological order
+                if id(consumer_node) in order and id(consumer_node) not in queued and is_foldable(consumer_node):
+                    heapq.heappush(worklist, (order[id(consumer_node)], consumer_node))
+                    queued.add(id(consumer_node))
 
-        for op in to_be_removed:
-            graph.remove_op(op)
+    graph.remove_ops(to_be_removed)
 
-        done = len(processed_nodes) == processed_before_precompute
+    return {
+        'folded': num_folded,
+        'reused': num_reused,
+        'removed': len({id(op) for op in to_be_removed}),
+        'seconds': time.perf_counter() - start,
+    }
 
 
 def pass_propagate_quantization_details_into_conv(graph: Graph) -> None:
@@ -387,40 +425,19 @@ def pass_pack_weights(graph: Graph) -> None:
             if pad_tensor is not None:
                 padded_data = np.append(padded_data, pad_tensor, axis=axis)
 
-        tca_output = np.copy(padded_data)
         oc, kh, kw, kd = padded_data.shape[:]
-        padded_data = padded_data.flatten()
-        tca_output = tca_output.flatten()
-
-        out_index = 0
-        for g in range(oc // b):
-            for p in range(kd // b):
-                for h in range(kh):
-                    for w in range(kw):
-                        for o in range(b):
-                            for d in range(b):
-                                idx = g * (kw * kh * kd * b) + p * b + h * (kw * kd) + w * kd + o * (kw * kh * kd) + d
-                                tca_output[out_index] = padded_data[idx]
-                                out_index += 1
-                                
-        kn2row_output = np.zeros(oc * kh * kw * kd)
-        out_index = 0
-        for h in range(kh):
-            for w in range(kw):
-                for o in range(oc):
-                    for i in range(kd):
-                        idx = o * kh * kw * kd + h * kw * kd + w * kd + i
-                        kn2row_output[out_index] = padded_data[idx]
-                        out_index += 1
 
+        # binarizers map values element-wise, so the layouts are made from the binarized data
         op_data = weight_quantizer.binarizer(padded_data)
-        data = packer.run(op_data.astype(np.float32), weight_quantizer.dimension)
 
-        tca_binarized_data = weight_quantizer.binarizer(tca_output)
-        tca_packed_data = packer.run(tca_binarized_data.astype(np.float32), weight_quantizer.dimension)
+        # TCA layout: [oc // b, b, kh, kw, kd // b, b] (OhOlHWIhIl) -> OhIhHWOlIl
+        tca_binarized_data = op_data.reshape([oc // b, b, kh, kw, kd // b, b]).transpose([0, 4, 2, 3, 1, 5])
+
+        # kn2row layout: OHWI -> HWOI
+        kn2row_binarized_data = op_data.transpose([1, 2, 0, 3])
 
-        kn2row_binarized_data = weight_quantizer.binarizer(kn2row_output)
-        kn2row_data = packer.run(kn2row_binarized_data.astype(np.float32), weight_quantizer.dimension)
+        data, tca_packed_data, kn2row_data = packer.run_layouts(
+            [op_data, tca_binarized_data, kn2row_binarized_data], weight_quantizer.dimension)
 
         shape = [oc, kh, kw, kd]
         tca_shape = [oc // b, kd // b, kh, kw, b, b]
@@ -430,14 +447,14 @@ def pass_pack_weights(graph: Graph) -> None:
         quantized_constant = Constant(
             weight_quantizer.name + '_new',
             PackedUint32(),
-            data=np.vectorize(lambda k: (~k) & ((0x1 << 32) - 1))(data),
+            data=np.invert(data),
             dimension_format="OHWI",
             transposed_dimension_format="OhIhHWOlIl",
             packed=True,
             actual_shape=shape,
             transposed_shape=tca_shape,
-            transposed_data=[(~k) & ((0x1 << 32) - 1) for k in tca_packed_data.flatten()],
-            kn2row_data=[k for k in kn2row_data.flatten()],
+            transposed_data=np.invert(tca_packed_data.flatten()).tolist(),
+            kn2row_data=list(kn2row_data.flatten()),
             kn2row_shape=kn2row_shape,
             kn2row_dimension_format="HWOI"
         )
@@ -609,16 +626,10 @@ def pass_lookup(graph: Graph) -> None:
         lu_bitwidth = quantizer.nbit
         packer = Packer(lu_bitwidth, word_size)
 
-        lsb = np.zeros((256,), np.uint32)
-        msb = np.zeros((256,), np.uint32)
-
-        idx = 0
-        for p in qtz_data:
-            data = packer.run(p.astype(np.float32), p.shape).flatten()
-            lsb[idx] = data[0]
-            msb[idx] = data[1]
-
-            idx += 1
+        # pack all the 256 entries at once
+        data = np.concatenate(packer.run_layouts(list(qtz_data.astype(np.float32))))
+        lsb = np.ascontiguousarray(data[:, 0])
+        msb = np.ascontiguousarray(data[:, 1])
 
         pe_lsb = Constant('pe_lsb_new', QUANTIZED_PACKED_KERNEL(), lsb,
                           dimension_format='TC', packed=True, actual_shape=[256, word_size])
@@ -22,7 +22,6 @@ from core.data_types import *
 class View(object):
     def __init__(self, op):
         self.op = op
-        self.reuse_buffer_str = ''
 
     @property
     def rank(self):
@@ -44,24 +43,6 @@ class View(object):
         input_ops = op.input_ops
         output_ops = op.output_ops
         inputs_string = self.inputs_to_string(op, input_ops)
-        shape_string = self.shape_to_string(op.shape)
-
-        if op.available_buffer != '':
-            if len(op.output_ops.keys()) > 1:
-                op_name = op.name + '_' + str(list(op.output_ops.keys())[0])
-            else:
-                op_name = op.name
-
-            shape_string = self.shape_to_string(op.shape, channel_active=True)
-
-            self.reuse_buffer_str = (
-                f"""
-                TensorView<{op.dtype.cpptype()}, MemoryLayout::{op.dimension}>::tensor_info_t<std::size_t>"""
-                f""" {op_name}_shape = {{ {shape_string} }};
-                TensorView<{op.dtype.cpptype()}, MemoryLayout::{op.dimension}>"""
-                f""" {op_name}({op.available_buffer}_raw, {op_name}_shape);
-                """
-            )
 
         if self.op.op_type == 'QTZ_binary_mean_scaling':
             if len(input_ops) != 1:
@@ -435,8 +416,6 @@ class View(object):
             in_shape = input_ops['data'].shape
             out_shape = op.shape
 
-            shape_string = self.shape_to_string(op.shape)
-
             return self.format_string(
                 f"""
                 // Reshape from {in_shape} to {out_shape}'
@@ -462,7 +441,6 @@ class View(object):
                 self.raise_invalid_args_exception(op, input_ops, output_ops)
 
             inputs_string = self.inputs_to_string(op, input_ops)
-            shape_string = self.shape_to_string(op.shape)
 
             bs = op.block_size
             x_op = input_ops['input']
@@ -493,7 +471,6 @@ class View(object):
                 self.raise_invalid_args_exception(op, input_ops, output_ops)
 
             inputs_string = self.inputs_to_string(op, input_ops)
-            shape_string = self.shape_to_string(op.shape)
 
             number_of_inputs = len(input_ops)
             concat_input = {}
@@ -610,8 +587,6 @@ class View(object):
 
     def format_string(self, string):
         string = dedent(string)
-        if self.reuse_buffer_str:
-            string = dedent(self.reuse_buffer_str) + '\n' + string
 
         def should_be_indent(line):
             return line != "" and line[0] != "#"
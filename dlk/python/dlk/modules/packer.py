@@ -14,35 +14,104 @@
 # limitations under the License.
 # =============================================================================
 """Packer module."""
+from typing import List
+
 import numpy as np
 
 
 class Packer:
-    """Packer class packs small integer values to dense unsigned integer (uint8 or uint32)."""
+    """Packer class packs small integer values to dense unsigned integer (uint8, uint32 or uint64).
+
+    Two arrangements of the packed words are supported, as `tools/debug.py::QuantizedMatrix` describes.
+
+    - 'WordInterleaving' (default): each chunk of `wordsize` values is packed into `bitwidth` words,
+      where the i-th word has the i-th bits of the values (bit planes).
+    - 'BitInterleaving': the bits of each value are contiguous, the values are packed one after another.
+
+    In both arrangements, the first value goes to the least significant bits.
+    """
+
+    ARRANGEMENTS = ['WordInterleaving', 'BitInterleaving']
 
     def __init__(self,
                  bitwidth: int,
-                 wordsize: int) -> None:
+                 wordsize: int,
+                 dtype: type = np.uint32,
+                 arrangement: str = 'WordInterleaving') -> None:
         """Initialize packer object.
 
         Args:
             bitwidth (int): Bitwidth of a kernel
             wordsize (int): Wordsize
+            dtype (type): Type of the packed words, np.uint8, np.uint32 or np.uint64.
+                Bits beyond the size of the type are discarded.
+            arrangement (str): 'WordInterleaving' or 'BitInterleaving'.
 
         """
         super().__init__()
 
+        if np.dtype(dtype) not in [np.dtype(np.uint8), np.dtype(np.uint32), np.dtype(np.uint64)]:
+            raise ValueError("dtype must be one of np.uint8, np.uint32 or np.uint64, but got {}".format(dtype))
+        if arrangement not in self.ARRANGEMENTS:
+            raise ValueError("arrangement must be one of {}, but got {}".format(self.ARRANGEMENTS, arrangement))
+        if not 0 < wordsize <= 64:
+            raise ValueError("wordsize must be in 1 to 64, but got {}".format(wordsize))
+
         self.bitwidth = bitwidth
         self.wordsize = wordsize
+        self.dtype = np.dtype(dtype)
+        self.arrangement = arrangement
         # generate powers of 2 (1,2,4,8....) here to pack binary values fast
-        self.powers = np.power(2, np.arange(wordsize)).astype(np.uint32)
+        self.powers = np.left_shift(np.uint64(1), np.arange(wordsize, dtype=np.uint64))
 
-    def _pack_to_word(self, v):
+    def _num_words(self, size: int) -> int:
+        if self.arrangement == 'BitInterleaving':
+            return -(-(size * self.bitwidth) // self.wordsize)
+        return -(-size // self.wordsize) * self.bitwidth
+
+    def _pack_bits(self, bits: np.ndarray) -> np.ndarray:
+        """Pack bits of [..., wordsize] into words of [...]."""
         wordsize = self.wordsize
-        powers = self.powers
-        if v.size != wordsize:
-            powers = np.power(2, np.arange(v.size)).astype(np.uint32)
-        return np.dot(v, powers).astype(np.uint32)
+        if wordsize == self.dtype.itemsize * 8:
+            # reverse the bits in each byte, then the bytes are a little endian word
+            shape = bits.shape[:-1]
+            bits = bits.astype(np.uint8).reshape(shape + (wordsize // 8, 8))
+            packed_bytes = np.packbits(bits[..., ::-1], axis=-1).reshape(shape + (wordsize // 8,))
+            return packed_bytes.view(self.dtype.newbyteorder('<')).reshape(shape).astype(self.dtype)
+
+        return np.dot(bits.astype(np.uint64), self.powers).astype(self.dtype)
+
+    def _unpack_bits(self, words: np.ndarray) -> np.ndarray:
+        """Unpack words of [...] into bits of [..., wordsize]."""
+        return (words.astype(np.uint64)[..., np.newaxis] >> np.arange(self.wordsize, dtype=np.uint64)) & 1
+
+    def _pack_2d(self, tensors: np.ndarray) -> np.ndarray:
+        """Pack 2D tensor of [N, size] into [N, output_size] words at once, without loops over words."""
+        wordsize = self.wordsize
+        bitwidth = self.bitwidth
+        num, size = tensors.shape
+        shifts = np.arange(bitwidth, dtype=np.uint32)
+
+        if self.arrangement == 'BitInterleaving':
+            # [N, size, bitwidth] -> a bit stream of [N, size * bitwidth]
+            bits = (tensors[:, :, np.newaxis] >> shifts) & 1
+            stream = np.zeros([num, self._num_words(size) * wordsize], dtype=np.uint8)
+            stream[:, :size * bitwidth] = bits.reshape([num, -1])
+            return self._pack_bits(stream.reshape([num, -1, wordsize]))
+
+        # zeros in the tail of the last word does not change the packed values
+        num_chunks = -(-size // wordsize)
+        padded = np.zeros([num, num_chunks * wordsize], dtype=np.uint32)
+        padded[:, :size] = tensors
+        chunks = padded.reshape([num, num_chunks, 1, wordsize])
+
+        # [N, chunks, bitwidth, wordsize]
+        bit_planes = (chunks >> shifts.reshape([-1, 1])) & 1
+        return self._pack_bits(bit_planes).reshape([num, num_chunks * bitwidth])
+
+    def _check_range(self, tensor: np.ndarray) -> None:
+        if (tensor >= (2 ** self.bitwidth)).any():
+            raise ValueError("all value of input tensor must be less than bit width ({})".format(self.bitwidth))
 
     def run(self, tensor: np.ndarray, data_format: str = 'NHWC') -> np.ndarray:
         """Pack a tensor.
@@ -57,28 +126,53 @@ class Packer:
             np.ndarray: Quantized tensor.
         
         """
+        self._check_range(tensor)
 
-        wordsize = self.wordsize
+        tensor_flat = tensor.flatten(order='C').astype(np.uint32)
+        output = self._pack_2d(tensor_flat.reshape([1, -1]))
+        return output.reshape([1, -1])
 
-        if (tensor >= (2 ** self.bitwidth)).any():
-            raise ValueError("all value of input tensor must be less than bit width ({})".format(self.bitwidth))
+    def run_layouts(self, tensors: List[np.ndarray], data_format: str = 'NHWC') -> List[np.ndarray]:
+        """Pack tensors of the same size, for example different layouts of a kernel, at once.
 
-        output_size = tensor.size // wordsize
-        output_size += 1 if tensor.size % wordsize != 0 else 0
-        output_size *= self.bitwidth
+        Args:
+            tensors (list[np.ndarray]): Input tensors, which have the same number of elements.
+            data_format (str): Order of dimension. See `run`.
 
-        tensor_flat = tensor.flatten(order='C').astype(np.uint32)
-        output = np.zeros(output_size, dtype=np.uint32)
-        oi = 0
-        for i in range(0, tensor.size, wordsize):
-            if i + wordsize < tensor.size:
-                sliced_tensor = tensor_flat[i:i + wordsize]
-            else:
-                sliced_tensor = tensor_flat[i:]
-
-            for _ in range(0, self.bitwidth):
-                output[oi] = self._pack_to_word(np.bitwise_and(sliced_tensor, 1))
-                oi += 1
-                sliced_tensor = np.right_shift(sliced_tensor, 1)
-
-        return output.reshape([1, output_size])
+        Returns:
+            list[np.ndarray]: Quantized tensors, each of them is the same as the result of `run`.
+
+        """
+        stacked = np.stack([np.ravel(tensor) for tensor in tensors])
+        self._check_range(stacked)
+
+        output = self._pack_2d(stacked.astype(np.uint32))
+        return [word.reshape([1, -1]) for word in output]
+
+    def unpack(self, packed: np.ndarray, size: int) -> np.ndarray:
+        """Unpack words packed by `run`, mainly for verification.
+
+        Args:
+            packed (np.ndarray): Packed words.
+            size (int): The number of the original values.
+
+        Returns:
+            np.ndarray: 1D array of the original values in np.uint32.
+
+        """
+        words = np.asarray(packed).flatten()
+        if words.size != self._num_words(size):
+            raise ValueError("{} words cannot be unpacked into {} values".format(words.size, size))
+
+        bits = self._unpack_bits(words)
+        weights = np.left_shift(np.uint64(1), np.arange(self.bitwidth, dtype=np.uint64))
+
+        if self.arrangement == 'BitInterleaving':
+            # a bit stream of [words * wordsize] -> [size, bitwidth]
+            values = bits.flatten()[:size * self.bitwidth].reshape([size, self.bitwidth])
+            return np.dot(values, weights).astype(np.uint32)
+
+        # [chunks, bitwidth, wordsize] -> [chunks, wordsize]
+        bit_planes = bits.reshape([-1, self.bitwidth, self.wordsize])
+        values = np.einsum('cbw,b->cw', bit_planes, weights)
+        return values.flatten()[:size].astype(np.uint32)
@@ -67,7 +67,9 @@ def optimize_graph_step(graph: Graph, config: Config) -> None:
     pass_propagate_datatypes(graph)
     pass_propagate_format(graph)
 
-    pass_constant_folding(graph)
+    stats = pass_constant_folding(graph)
+    click.echo(f'constant folding: {stats["folded"]} nodes folded ({stats["reused"]} reused), '
+               f'{stats["removed"]} nodes removed in {stats["seconds"]:.3f} sec')
     pass_simplify_batchnorm(graph)
 
 
@@ -85,7 +87,9 @@ def generate_code_step(graph: Graph, config: Config) -> None:
                             params,
                             config)
 
-    builder.reuse_output_buffers()
+    plan = builder.memory_plan
+    click.echo(f'memory plan: {plan.unplanned_size} bytes of {len(plan.buffers)} buffers are placed in '
+               f'{plan.arena_size} bytes (live peak {plan.live_size} bytes)')
     builder.generate_files_from_template()
     builder.generate_inputs()
 
@@ -18,12 +18,28 @@ import ctypes as ct
 import numpy as np
 from numpy.ctypeslib import ndpointer
 
+BUFFER_ALIGNMENT = 64
+
+
+def aligned_empty(shape, dtype=np.float32, alignment=BUFFER_ALIGNMENT):
+    """Return an uninitialized C contiguous array whose data address is aligned to `alignment` bytes."""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + alignment, np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes].view(dtype).reshape(shape)
+
 
 class NNLib(object):
 
     def __init__(self):
         self.lib = None
         self.nnlib = None
+        self.input_shape = None
+        self.output_shape = None
+        self._input_size = None
+        self._output_size = None
+        self._network_run = None
 
     def load(self, libpath):
         self.lib = ct.cdll.LoadLibrary(libpath)
@@ -60,17 +76,31 @@ class NNLib(object):
         ]
         self.lib.network_run.restype = None
 
+        # another function object of network_run taking raw addresses. `run` and `run_batch` check buffers
+        # by themselves and pass the addresses without `ndpointer` conversions on each call.
+        self._network_run = self.lib["network_run"]
+        self._network_run.argtypes = [ct.c_void_p, ct.c_void_p, ct.c_void_p]
+        self._network_run.restype = None
+
         self.nnlib = self.lib.network_create()
         return True
 
     def init(self):
-        return self.lib.network_init(self.nnlib)
+        initialized = self.lib.network_init(self.nnlib)
+        if initialized:
+            # shapes don't change after init, cache them not to call the library on each run.
+            self.input_shape = self.get_input_shape()
+            self.output_shape = self.get_output_shape()
+            self._input_size = int(np.prod(self.input_shape))
+            self._output_size = int(np.prod(self.output_shape))
+        return initialized
 
     def delete(self):
         if self.nnlib:
             self.lib.network_delete(self.nnlib)
             self.nnlib = None
             self.lib = None
+            self._network_run = None
 
     def __del__(self):
         self.delete()
@@ -95,13 +125,108 @@ class NNLib(object):
 
         return tuple(s)
 
-    def run(self, tensor):
-        input = tensor.flatten().astype(np.float32)
-        output = np.zeros((self.get_output_shape()), np.float32)
-
-        self.lib.network_run(
-            self.nnlib,
-            input,
-            output)
+    def _get_input_shape(self):
+        return self.input_shape if self.input_shape is not None else self.get_input_shape()
+
+    def _get_output_shape(self):
+        return self.output_shape if self.output_shape is not None else self.get_output_shape()
+
+    def _get_input_size(self):
+        return self._input_size if self._input_size is not None else int(np.prod(self.get_input_shape()))
+
+    def _get_output_size(self):
+        return self._output_size if self._output_size is not None else int(np.prod(self.get_output_shape()))
+
+    def new_input_buffer(self, batch_size=None):
+        """Return an aligned float32 buffer for the input.
+
+        Args:
+            batch_size (int): If given, the buffer has `batch_size` frames, for `run_batch`.
+        """
+        shape = self._get_input_shape()
+        if batch_size is not None:
+            shape = (batch_size,) + shape
+        return aligned_empty(shape, np.float32)
+
+    def new_output_buffer(self, batch_size=None):
+        """Return an aligned float32 buffer for the output.
+
+        Args:
+            batch_size (int): If given, the buffer has `batch_size` frames, for `run_batch`.
+        """
+        shape = self._get_output_shape()
+        if batch_size is not None:
+            shape = (batch_size,) + shape
+        return aligned_empty(shape, np.float32)
+
+    @staticmethod
+    def _check_buffer(buffer, size, name):
+        flags = buffer.flags
+        if buffer.dtype != np.float32 or not flags.c_contiguous or not flags.writeable:
+            raise ValueError("{} buffer must be a writeable C contiguous float32 array.".format(name))
+        if buffer.size != size:
+            raise ValueError("{} buffer has {} elements, expected {}.".format(name, buffer.size, size))
+
+    def run(self, tensor, output=None):
+        """Run the network on one input.
+
+        The input is passed without a copy when it is already a C contiguous float32 array.
+
+        Args:
+            tensor (np.ndarray): input of the input shape.
+            output (np.ndarray): If given, the output is written into this C contiguous float32 buffer
+                of the output shape, such as the one of `new_output_buffer`. It is re-used instead of a new array.
+
+        Returns:
+            np.ndarray: output.
+        """
+        input = np.ascontiguousarray(tensor, dtype=np.float32)
+        if input.size != self._get_input_size():
+            raise ValueError("Input has {} elements, expected {}.".format(input.size, self._get_input_size()))
+        if output is None:
+            output = np.zeros(self._get_output_shape(), np.float32)
+        else:
+            self._check_buffer(output, self._get_output_size(), "Output")
+
+        self._network_run(self.nnlib, input.ctypes.data, output.ctypes.data)
 
         return output
+
+    def run_batch(self, tensors, outputs=None):
+        """Run the network on each frame of `tensors` in a loop.
+
+        Buffers are checked once, then each frame is run with the addresses in the buffers,
+        so no array is allocated nor copied per frame.
+
+        Args:
+            tensors (np.ndarray): inputs of [N] + input shape. A C contiguous float32 array, such as the one of
+                `new_input_buffer(N)`, is used without a copy.
+            outputs (np.ndarray): If given, the outputs are written into this C contiguous float32 buffer
+                of [N] + output shape, such as the one of `new_output_buffer(N)`.
+
+        Returns:
+            np.ndarray: outputs of [N] + output shape.
+        """
+        input_size = self._get_input_size()
+        output_size = self._get_output_size()
+
+        inputs = np.ascontiguousarray(tensors, dtype=np.float32)
+        num_frames = inputs.shape[0] if inputs.ndim > 0 else 0
+        if inputs.size != num_frames * input_size:
+            raise ValueError("Input has {} elements, expected {} frames of {} elements.".format(
+                inputs.size, num_frames, input_size))
+
+        if outputs is None:
+            outputs = np.zeros((num_frames,) + self._get_output_shape(), np.float32)
+        else:
+            self._check_buffer(outputs, num_frames * output_size, "Output")
+
+        network_run = self._network_run
+        input_address = inputs.ctypes.data
+        output_address = outputs.ctypes.data
+        input_stride = input_size * inputs.itemsize
+        output_stride = output_size * outputs.itemsize
+        for i in range(num_frames):
+            network_run(self.nnlib, input_address + i * input_stride, output_address + i * output_stride)
+
+        return outputs
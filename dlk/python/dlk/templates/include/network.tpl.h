@@ -16,6 +16,7 @@ limitations under the License.
 #ifndef NETWORK_H_INCLUDED
 #define NETWORK_H_INCLUDED
 
+#include <cstdlib>
 #include <memory>
 #include "global.h"
 #include "dma_buffer.h"
@@ -40,23 +41,17 @@ public:
 
 private:
     // declarations
-    {% for node in graph.non_variables %}
-    {% if node.available_buffer == '' %}
-    {% for out_k in node.output_ops.keys() -%}
-    {% if node.output_ops.keys()|length > 1 %}
-    {{ node.dtype.cpptype() }} *{{ node.name + '_' + out_k }}_raw = 0;
-    {% else %}
-    {{ node.dtype.cpptype() }} *{{ node.name }}_raw = 0;
-    {% endif %}
-    {%- endfor %}
-    {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
-    {% for out_k in node.output_ops.keys() -%}
-    {% if out_k != node.output_ops.keys()|list|first %}
-    {{ node.dtype.cpptype() }} *{{ node.name + '_' + out_k }}_raw = 0;
-    {% endif %}
-    {%- endfor %}
-    {% endif %}
-    {%- endfor %}
+    {% for buffer in memory_plan.buffers -%}
+    {{ buffer.op.dtype.cpptype() }} *{{ buffer.name }}_raw = 0;
+    {% endfor %}
+
+    // the arena is allocated by posix_memalign
+    struct FreeDeleter {
+        void operator()(void *p) const { std::free(p); }
+    };
+
+    // all the buffers above are placed in this arena by the memory planner
+    std::unique_ptr<BYTE, FreeDeleter> activation_arena;
 
     QUANTIZED_PACKED *device_input_buf = 0;
     BIN_CONV_OUTPUT *device_output_buf = 0;
@@ -143,25 +143,6 @@ Network::Network()
 
 Network::~Network()
 {
-  {% for node in graph.non_variables -%}
-  {% if node.available_buffer == '' -%}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if node.output_ops.keys()|length > 1 %}
-  delete []{{ node.name + '_' + out_k }}_raw;
-  {% else %}
-  delete []{{ node.name }}_raw;
-  {% endif %}
-  {%- endfor %}
-  {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if out_k != node.output_ops.keys()|list|first %}
-  delete []{{ node.name + '_' + out_k }}_raw;
-  {% endif %}
-  {%- endfor %}
-  {% endif %}
-  {%- endfor %}
-  {{ '\n' -}}
-
 #if defined RUN_ON_FPGA
 #else
   delete [] device_input_buf;
@@ -244,23 +225,19 @@ bool Network::init()
       MAX_SIZE_INPUTS_PER_LAYER * sizeof(QUANTIZED_NOT_PACKED)
   );
 
-  {% for node in graph.non_variables -%}
-  {% if node.available_buffer == '' %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if node.output_ops.keys()|length > 1 %}
-  {{ node.name + '_' + out_k }}_raw = new {{ node.dtype.cpptype() }}[{{ node.view.size_in_words_as_cpp }}]();
-  {% else %}
-  {{ node.name }}_raw = new {{ node.dtype.cpptype() }}[{{ node.view.size_in_words_as_cpp }}]();
-  {% endif %}
-  {%- endfor %}
-  {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if out_k != node.output_ops.keys()|list|first %}
-  {{ node.name + '_' + out_k }}_raw = new {{ node.dtype.cpptype() }}[{{ node.view.size_in_words_as_cpp }}]();
-  {% endif %}
-  {%- endfor %}
-  {% endif %}
-  {%- endfor %}
+  // {{ memory_plan.unplanned_size }} bytes of buffers are placed in the arena of {{ memory_plan.arena_size }} bytes.
+  // the base is aligned as the offsets are, and the buffers are zero-initialized as separate buffers were.
+  void *arena = nullptr;
+  if (posix_memalign(&arena, {{ memory_plan.alignment }}, std::max<std::size_t>({{ memory_plan.arena_size }}, 1)) != 0) {
+    return false;
+  }
+  std::memset(arena, 0, {{ memory_plan.arena_size }});
+  activation_arena.reset(static_cast<BYTE*>(arena));
+  {% for buffer in memory_plan.buffers -%}
+  static_assert(sizeof({{ buffer.op.dtype.cpptype() }}) * ({{ buffer.op.view.size_in_words_as_cpp }}) <= {{ buffer.size }},
+                "{{ buffer.name }} exceeds the planned size");
+  {{ buffer.name }}_raw = reinterpret_cast<{{ buffer.op.dtype.cpptype() }}*>(activation_arena.get() + {{ buffer.offset }});
+  {% endfor %}
   {{ '\n' -}}
 
 #if defined RUN_ON_FPGA
@@ -338,7 +315,6 @@ bool Network::run(float *network_input, float *network_output)
   {{ '\n' -}}
 
   {% for node in graph.non_variables -%}
-  {% if node.available_buffer == '' %}
   {% for out_k in node.output_ops.keys() -%}
   {% if node.output_ops.keys()|length > 1 %}
   TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>::tensor_info_t<std::size_t> {{ node.name + '_' + out_k }}_shape = {
@@ -357,22 +333,14 @@ bool Network::run(float *network_input, float *network_output)
   TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ node.name }}({{ node.name }}_raw, {{ node.name }}_shape);
   {% endif %}
   {%- endfor %}
-  {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if out_k != node.output_ops.keys()|list|first %}
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>::tensor_info_t<std::size_t> {{ node.name + '_' + out_k }}_shape = {
-    {% for len in node.shape -%}
-    {{- len -}},
-    {%- endfor %}
-  };
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ node.name + '_' + out_k }}({{ node.name + '_' + out_k }}_raw, {{ node.name + '_' + out_k }}_shape);
-  {% endif %}
-  {%- endfor %}
-  {% endif %}
   {%- endfor %}
   {{ '\n' -}}
 
   {%- for node in graph.non_variables %}
+  {% for buffer in memory_plan.shared_buffers(node) -%}
+  // {{ buffer.name }} shares the arena with other buffers, clear it as a zero-initialized buffer
+  std::memset({{ buffer.name }}_raw, 0, {{ buffer.size }});
+  {% endfor -%}
   {{- node.view.run() }}
 
   {% if config.debug -%}
@@ -19,6 +19,21 @@ from pathlib import Path
 import click
 import numpy as np
 
+ARCHIVE_NAME = 'activations.npz'
+
+
+def load_expected_output(e_output, ptrn_ex):
+    """Return a dict of names to loaders of the expected outputs, from .npy files or an archive of lmnet export."""
+    if e_output.is_dir() and (e_output / ARCHIVE_NAME).exists():
+        e_output = e_output / ARCHIVE_NAME
+
+    if e_output.suffix == '.npz':
+        archive = np.load(str(e_output))
+        return {name: (lambda name=name: archive[name]) for name in archive.files if ptrn_ex.match(name)}
+
+    return {e.stem: (lambda e=e: np.load(e))
+            for e in e_output.iterdir() if e.suffix == '.npy' and ptrn_ex.match(e.stem)}
+
 
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
 @click.option(
@@ -31,7 +46,7 @@ import numpy as np
     "-e",
     "--expected_data_path",
     type=click.Path(exists=True),
-    help="Directory containing the .npy files with the expected output",
+    help="Directory containing the .npy files with the expected output, or the .npz archive of them",
 )
 def main(debug_data_path, expected_data_path):
     if not debug_data_path or not expected_data_path:
@@ -45,7 +60,7 @@ def main(debug_data_path, expected_data_path):
 
     ptrn_ex = re.compile(r'(\d{3})_(.*):(\d+)')
     ptrn_dbg = re.compile(r'(.*)(\d+)')
-    expected_output = [e for e in e_output.iterdir() if e.suffix == '.npy' and ptrn_ex.match(e.stem)]
+    expected_output = load_expected_output(e_output, ptrn_ex)
     debug_output = [e for e in d_output.iterdir() if e.suffix == '.npy' and ptrn_dbg.match(e.stem)]
 
     if not debug_output:
@@ -59,12 +74,12 @@ def main(debug_data_path, expected_data_path):
     for o in debug_output:
         name_dbg = ptrn_dbg.match(o.stem).group(1)
         output_id_dbg = ptrn_dbg.match(o.stem).group(2)
-        for eo in expected_output:
-            name_ex = ptrn_ex.match(eo.stem).group(2)
-            output_id_ex = ptrn_ex.match(eo.stem).group(3)
+        for eo, load_ex in expected_output.items():
+            name_ex = ptrn_ex.match(eo).group(2)
+            output_id_ex = ptrn_ex.match(eo).group(3)
             if name_ex == name_dbg and output_id_ex == output_id_dbg:
                 data_dbg = np.load(o)
-                data_ex = np.load(eo)
+                data_ex = load_ex()
 
                 r_tol = 0.0001
                 a_tol = 0.0001
@@ -73,11 +88,11 @@ def main(debug_data_path, expected_data_path):
                                               rtol=r_tol, atol=a_tol)
 
                 if np.all(within_tolerance):
-                    results[ptrn_ex.match(eo.stem).group(1)] = f"[OK]   {name_ex}:{output_id_ex}"
+                    results[ptrn_ex.match(eo).group(1)] = f"[OK]   {name_ex}:{output_id_ex}"
                 else:
-                    results[ptrn_ex.match(eo.stem).group(1)] = f"[FAIL] {name_ex}:{output_id_ex}"
+                    results[ptrn_ex.match(eo).group(1)] = f"[FAIL] {name_ex}:{output_id_ex}"
 
-                diffs[ptrn_ex.match(eo.stem).group(1)] = data_ex.flatten().size - np.count_nonzero(within_tolerance)
+                diffs[ptrn_ex.match(eo).group(1)] = data_ex.flatten().size - np.count_nonzero(within_tolerance)
 
     sorted_results = [val for key, val in sorted(results.items())]
     sorted_diffs = [val for key, val in sorted(diffs.items())]
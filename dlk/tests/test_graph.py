@@ -20,7 +20,8 @@ import numpy as np
 
 from core.data_types import Float32
 from core.graph import Graph
-from core.operators import Constant, Conv, Input, Output
+from core.graph_pattern_matching import sort_graph
+from core.operators import Add, Constant, Conv, Identity, Input, Output
 
 
 class TestGraph(unittest.TestCase):
@@ -69,6 +70,56 @@ class TestGraph(unittest.TestCase):
         self.assertTrue(graph.check_nodes(), "All inputs of operators must match their outputs.")
         print("Graph test passed!")
 
+    def test_sort_deep_graph(self) -> None:
+        """Test that a graph deeper than the recursion limit is sorted."""
+        graph = Graph()
+        shape = [1, 4, 4, 3]
+        x = Input('input', shape, Float32())
+        graph.add_op(x)
+
+        prev = x
+        ops = [x]
+        for i in range(5000):
+            prev = Identity(f'identity{i}', shape, Float32(), {'input': prev})
+            ops.append(prev)
+
+        y = Output('output', shape, Float32(), {'input': prev})
+        ops.append(y)
+
+        # inputs are added iteratively as well
+        graph.add_op_and_inputs(y)
+
+        self.assertEqual([op.name for op in sort_graph(graph)], [op.name for op in ops])
+        self.assertEqual(graph.get_consumers(x), [ops[1]])
+        self.assertTrue(x in graph)
+
+    def test_sort_graph_cache(self) -> None:
+        """Test that the cached order follows modifications of the graph."""
+        graph = Graph()
+        shape = [1, 4, 4, 3]
+        x = Input('input', shape, Float32())
+        c = Constant('const', Float32(), np.zeros(shape))
+        add = Add('add', shape, Float32(), {'A': x, 'B': c})
+        y = Output('output', shape, Float32(), {'input': add})
+
+        # registered in the reverse order, inputs come first anyway
+        for op in [y, add, c, x]:
+            graph.add_op(op)
+
+        self.assertEqual([op.name for op in sort_graph(graph)], ['input', 'const', 'add', 'output'])
+        self.assertEqual(graph.get_consumers(c), [add])
+
+        # rewire the input of add
+        c2 = Constant('const2', Float32(), np.ones(shape))
+        graph.add_op(c2)
+        add.add_input('B', c2)
+        graph.remove_op(c)
+
+        self.assertEqual([op.name for op in sort_graph(graph)], ['input', 'const2', 'add', 'output'])
+        self.assertEqual(graph.get_consumers(c), [])
+        self.assertEqual(graph.get_consumers(c2), [add])
+        self.assertFalse(c in graph)
+
 
 if __name__ == '__main__':
     unittest.main()
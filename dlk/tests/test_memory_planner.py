@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Test file for MemoryPlanner."""
+import unittest
+
+import numpy as np
+
+from core.data_types import Float32, Int32
+from core.graph import Graph
+from core.memory_planner import MemoryPlanner
+from core.operators import Add, Constant, Input, Output, Reshape
+
+
+class TestMemoryPlanner(unittest.TestCase):
+    """Test class for MemoryPlanner."""
+
+    def test_plan_chain(self) -> None:
+        """Test that buffers of a chain are reused after their last use."""
+        shape = [1, 4, 4, 3]
+        graph = Graph()
+        x = Input('input', shape, Float32())
+        c = Constant('const', Float32(), np.zeros(shape))
+
+        prev = x
+        for i in range(6):
+            prev = Add(f'add{i}', shape, Float32(), {'A': prev, 'B': c})
+        y = Output('output', shape, Float32(), {'input': prev})
+        graph.add_op_and_inputs(y)
+
+        plan = MemoryPlanner(graph).plan()
+
+        self.assertEqual([b.name for b in plan.buffers], [f'add{i}' for i in range(6)])
+        self.assertEqual([(b.start, b.end) for b in plan.buffers], [(i, i + 1) for i in range(5)] + [(5, 5)])
+        # only two buffers are live at the same time
+        self.assertEqual(plan.arena_size, 2 * 192)
+        self.assertEqual(plan.unplanned_size, 6 * 192)
+        self.assertEqual(plan.live_size, plan.arena_size)
+        self.assert_no_conflict(plan)
+
+        # every buffer reuses the memory of another buffer, so it is cleared before its operator runs.
+        for buffer in plan.buffers:
+            self.assertEqual(plan.shared_buffers(buffer.op), [buffer])
+        self.assertEqual(plan.shared_buffers(x), [])
+
+    def test_plan_without_reuse(self) -> None:
+        """Test that buffers live at the same time don't share memory and are not cleared."""
+        shape = [1, 4, 4, 3]
+        graph = Graph()
+        x = Input('input', shape, Float32())
+        c = Constant('const', Float32(), np.zeros(shape))
+        add0 = Add('add0', shape, Float32(), {'A': x, 'B': c})
+        add1 = Add('add1', shape, Float32(), {'A': add0, 'B': c})
+        y = Output('output', shape, Float32(), {'input': add1})
+        graph.add_op_and_inputs(y)
+
+        plan = MemoryPlanner(graph).plan()
+
+        self.assertEqual(plan.arena_size, 2 * 192)
+        self.assertEqual(plan.shared_buffers(add0), [])
+        self.assertEqual(plan.shared_buffers(add1), [])
+        self.assert_no_conflict(plan)
+
+    def test_plan_reshape_alias(self) -> None:
+        """Test that the input of Reshape is kept alive while the output of Reshape is used."""
+        graph = Graph()
+        x = Input('input', [1, 4, 4, 4], Float32())
+        c = Constant('const', Float32(), np.zeros([1, 4, 4, 4]))
+        add1 = Add('add1', [1, 4, 4, 4], Float32(), {'A': x, 'B': c})
+        shape = Constant('shape', Int32(), np.array([1, 64]))
+        reshape = Reshape('reshape', [1, 64], Float32(), {'data': add1, 'shape': shape}, dimension_format='NC')
+        c2 = Constant('const2', Float32(), np.zeros([1, 64]))
+        add2 = Add('add2', [1, 64], Float32(), {'A': reshape, 'B': c2}, dimension_format='NC')
+        add3 = Add('add3', [1, 64], Float32(), {'A': add2, 'B': c2}, dimension_format='NC')
+        y = Output('output', [1, 64], Float32(), {'input': add3}, dimension_format='NC')
+        graph.add_op_and_inputs(y)
+
+        plan = MemoryPlanner(graph).plan()
+        lifetimes = {b.name: (b.start, b.end) for b in plan.buffers}
+
+        self.assertEqual(lifetimes['add1'], (0, 2))
+        self.assertEqual(lifetimes['reshape'], (1, 2))
+        self.assert_no_conflict(plan)
+
+    def assert_no_conflict(self, plan) -> None:
+        for a in plan.buffers:
+            self.assertEqual(a.offset % plan.alignment, 0)
+            for b in plan.buffers:
+                if a is not b and a.overlaps(b):
+                    self.assertTrue(a.offset + a.size <= b.offset or b.offset + b.size <= a.offset,
+                                    f'{a.name} and {b.name} are live at the same time in the same memory.')
+
+
+if __name__ == '__main__':
+    unittest.main()
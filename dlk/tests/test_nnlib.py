@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Test file for NNLib buffers and batch runs."""
+import ctypes as ct
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from scripts.pylib.nnlib import BUFFER_ALIGNMENT, NNLib, aligned_empty
+
+INPUT_SHAPE = (2, 3, 4)
+OUTPUT_SHAPE = (5,)
+
+
+class FakeFunction(object):
+    """Stand-in of a ctypes function object, which accepts `argtypes` and `restype`."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+
+class FakeLibrary(object):
+    """Stand-in of the generated library.
+
+    `network_run` writes `output[j] = (j + 1) * sum(input)` through raw addresses like the C function does.
+    """
+
+    def __init__(self):
+        self.num_runs = 0
+        self.network_create = FakeFunction(lambda: 1)
+        self.network_init = FakeFunction(lambda handle: True)
+        self.network_delete = FakeFunction(lambda handle: None)
+        self.network_get_input_rank = FakeFunction(lambda handle: len(INPUT_SHAPE))
+        self.network_get_output_rank = FakeFunction(lambda handle: len(OUTPUT_SHAPE))
+        self.network_get_input_shape = FakeFunction(lambda handle, s: s.__setitem__(slice(None), INPUT_SHAPE))
+        self.network_get_output_shape = FakeFunction(lambda handle, s: s.__setitem__(slice(None), OUTPUT_SHAPE))
+        self.network_run = FakeFunction(self._network_run)
+
+    def __getitem__(self, name):
+        return FakeFunction(getattr(self, name).func)
+
+    def _network_run(self, handle, input_address, output_address):
+        input_size = int(np.prod(INPUT_SHAPE))
+        output_size = int(np.prod(OUTPUT_SHAPE))
+        input = np.frombuffer((ct.c_float * input_size).from_address(input_address), np.float32)
+        output = np.frombuffer((ct.c_float * output_size).from_address(output_address), np.float32)
+        output[:] = np.arange(1, output_size + 1, dtype=np.float32) * input.sum(dtype=np.float32)
+        self.num_runs += 1
+
+
+class TestAlignedEmpty(unittest.TestCase):
+    """Test class for aligned_empty."""
+
+    def test_aligned_empty(self) -> None:
+        """Test that buffers are aligned C contiguous arrays of the requested shape and dtype."""
+        for shape, dtype in [((7,), np.float32), ((3, 5, 7), np.float32), ((2, 3), np.uint8), ((1,), np.int64)]:
+            buffer = aligned_empty(shape, dtype)
+
+            self.assertEqual(buffer.shape, shape)
+            self.assertEqual(buffer.dtype, np.dtype(dtype))
+            self.assertTrue(buffer.flags.c_contiguous)
+            self.assertTrue(buffer.flags.writeable)
+            self.assertEqual(buffer.ctypes.data % BUFFER_ALIGNMENT, 0)
+
+            # the whole buffer is usable.
+            buffer[...] = 1
+            self.assertEqual(int(buffer.sum()), int(np.prod(shape)))
+
+    def test_aligned_empty_alignment(self) -> None:
+        """Test that a custom alignment is honored."""
+        for alignment in [16, 128, 4096]:
+            buffer = aligned_empty((3, 5), np.float32, alignment=alignment)
+
+            self.assertEqual(buffer.shape, (3, 5))
+            self.assertEqual(buffer.ctypes.data % alignment, 0)
+
+
+class TestNNLib(unittest.TestCase):
+    """Test class for NNLib with a fake library."""
+
+    def setUp(self) -> None:
+        self.fake_lib = FakeLibrary()
+        self.nnlib = NNLib()
+        with mock.patch.object(ct.cdll, "LoadLibrary", return_value=self.fake_lib):
+            self.assertTrue(self.nnlib.load("libfake.so"))
+        self.assertTrue(self.nnlib.init())
+
+        rng = np.random.RandomState(0)
+        self.inputs = rng.rand(3, *INPUT_SHAPE).astype(np.float32)
+
+    def tearDown(self) -> None:
+        self.nnlib.delete()
+
+    def test_shapes(self) -> None:
+        """Test that shapes are read from the library on init."""
+        self.assertEqual(self.nnlib.input_shape, INPUT_SHAPE)
+        self.assertEqual(self.nnlib.output_shape, OUTPUT_SHAPE)
+
+    def test_run(self) -> None:
+        """Test that run computes the output of one input."""
+        output = self.nnlib.run(self.inputs[0])
+
+        expected = np.arange(1, 6, dtype=np.float32) * self.inputs[0].sum(dtype=np.float32)
+        self.assertEqual(output.shape, OUTPUT_SHAPE)
+        self.assertEqual(output.dtype, np.float32)
+        np.testing.assert_allclose(output, expected, rtol=1e-6)
+
+    def test_run_with_output(self) -> None:
+        """Test that a preallocated output gives the same result as a plain run and is returned."""
+        output = self.nnlib.new_output_buffer()
+        self.assertEqual(output.ctypes.data % BUFFER_ALIGNMENT, 0)
+
+        for input in self.inputs:
+            expected = self.nnlib.run(input)
+            result = self.nnlib.run(input, output=output)
+
+            self.assertIs(result, output)
+            np.testing.assert_array_equal(output, expected)
+
+    def test_run_with_non_contiguous_input(self) -> None:
+        """Test that a non C contiguous input is copied before the run."""
+        input = np.asfortranarray(self.inputs[1])
+
+        np.testing.assert_array_equal(self.nnlib.run(input), self.nnlib.run(self.inputs[1]))
+
+    def test_run_batch(self) -> None:
+        """Test that a batch run gives the same results as plain runs of each frame."""
+        expected = np.stack([self.nnlib.run(input) for input in self.inputs])
+
+        outputs = self.nnlib.run_batch(self.inputs)
+
+        self.assertEqual(outputs.shape, (3,) + OUTPUT_SHAPE)
+        np.testing.assert_array_equal(outputs, expected)
+
+    def test_run_batch_with_buffers(self) -> None:
+        """Test that a batch run into preallocated buffers gives the same results as plain runs."""
+        expected = np.stack([self.nnlib.run(input) for input in self.inputs])
+
+        inputs = self.nnlib.new_input_buffer(3)
+        outputs = self.nnlib.new_output_buffer(3)
+        inputs[...] = self.inputs
+        num_runs = self.fake_lib.num_runs
+        result = self.nnlib.run_batch(inputs, outputs=outputs)
+
+        self.assertIs(result, outputs)
+        self.assertEqual(self.fake_lib.num_runs - num_runs, 3)
+        np.testing.assert_array_equal(outputs, expected)
+
+    def test_run_batch_empty(self) -> None:
+        """Test that a batch of no frames runs nothing."""
+        outputs = self.nnlib.run_batch(np.zeros((0,) + INPUT_SHAPE, np.float32))
+
+        self.assertEqual(outputs.shape, (0,) + OUTPUT_SHAPE)
+        self.assertEqual(self.fake_lib.num_runs, 0)
+
+    def test_invalid_buffers(self) -> None:
+        """Test that inputs and outputs of wrong sizes or types are rejected."""
+        with self.assertRaises(ValueError):
+            self.nnlib.run(np.zeros(7, np.float32))
+        with self.assertRaises(ValueError):
+            self.nnlib.run(self.inputs[0], output=np.zeros(4, np.float32))
+        with self.assertRaises(ValueError):
+            self.nnlib.run(self.inputs[0], output=np.zeros(OUTPUT_SHAPE, np.float64))
+        with self.assertRaises(ValueError):
+            self.nnlib.run(self.inputs[0], output=np.zeros((5, 2), np.float32)[:, 0])
+        with self.assertRaises(ValueError):
+            self.nnlib.run_batch(self.inputs, outputs=self.nnlib.new_output_buffer(2))
+        with self.assertRaises(ValueError):
+            self.nnlib.run_batch(self.inputs[:, :1])
+        self.assertEqual(self.fake_lib.num_runs, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,8 @@
 # =============================================================================
 """Test file for Optimizer."""
 import unittest
+from typing import List
+
 from core.data_types import Float32, PackedUint32, Int32, QUANTIZED_PACKED
 from core.optimizer import pass_remove_identities, pass_transpose, pass_constant_folding, \
     pass_propagate_quantization_details_into_conv, pass_compute_thresholds, pass_pack_weights, \
@@ -23,6 +25,7 @@ from core.graph import Graph
 from core.operators import Add, AveragePool, BatchNormalization, Constant, Conv, Identity, Input, \
     MaxPool, Operator, Output, Transpose, QTZ_binary_mean_scaling, QTZ_linear_mid_tread_half, Reshape, Softmax, \
     SpaceToDepth
+from modules.packer import Packer
 
 import numpy as np
 
@@ -260,6 +263,86 @@ class TestPassPackWeights(unittest.TestCase):
 
         print("Test pass #4 pack_weights passed!")
 
+    def test_pass_pack_weights_layouts(self) -> None:
+        """Test that the packed layouts are the same as the ones made element by element."""
+        for kernel_shape in [[1, 2, 2, 3], [40, 3, 3, 70]]:
+            data = np.float32(np.random.rand(*kernel_shape) - 0.5)
+
+            graph = self.create_sample_graph_3(data)
+            weight_quantizer = graph.get_op('kqtz1')
+            pass_pack_weights(graph)
+            packed = graph.get_op('conv2').input_ops['W']
+
+            expected_data, expected_tca, expected_kn2row = self.pack_weights_reference(weight_quantizer)
+
+            self.assertEqual(packed.data.tobytes(), expected_data.tobytes())
+            self.assertEqual(np.array(packed.transposed_data, dtype=np.uint32).tobytes(), expected_tca.tobytes())
+            self.assertEqual(np.array(packed.kn2row_data, dtype=np.uint32).tobytes(), expected_kn2row.tobytes())
+
+    @staticmethod
+    def create_sample_graph_3(data: np.ndarray) -> Graph:
+        graph = Graph()
+        oc, kh, kw, kd = data.shape
+
+        # input and activation quantizer
+        x = Input('placeholder', [1, 5, 5, kd], Float32())
+        s1 = Constant('aq_const1', Float32(), np.array(1))
+        s2 = Constant('aq_const2', Float32(), np.array(2))
+        aq = QTZ_linear_mid_tread_half('aqtz1', [1, 5, 5, kd], Float32(), {'X': x, 'Y': s1, 'Z': s2})
+
+        # Conv with the quantized kernel
+        w = Constant('weight', Float32(), data)
+        kq = QTZ_binary_mean_scaling('kqtz1', [oc, kh, kw, kd], Float32(), {'input': w})
+        conv = Conv('conv2', [1, 6 - kh, 6 - kw, oc], Float32(), {'X': aq, 'W': kq}, kernel_shape=[kh, kw])
+        conv.a_quantizer = [aq]
+        conv.quantizer = kq
+
+        y = Output('output', [1, 6 - kh, 6 - kw, oc], Float32(), {'input': conv})
+        graph.add_op_and_inputs(y)
+
+        return graph
+
+    @staticmethod
+    def pack_weights_reference(weight_quantizer) -> List[np.ndarray]:
+        """Pack a kernel into the three layouts element by element, as the former pass_pack_weights did."""
+        b = 32
+        packer = Packer(1, 32)
+
+        padded_data = np.copy(weight_quantizer.data)
+        for axis in [0, 3]:
+            shape = list(padded_data.shape)
+            shape[axis] = (-shape[axis]) % b
+            padded_data = np.append(padded_data, np.zeros(shape), axis=axis)
+
+        oc, kh, kw, kd = padded_data.shape
+        padded_data = padded_data.flatten()
+
+        tca_output = np.zeros(padded_data.size)
+        out_index = 0
+        for g in range(oc // b):
+            for p in range(kd // b):
+                for h in range(kh):
+                    for w in range(kw):
+                        for o in range(b):
+                            for d in range(b):
+                                idx = g * (kw * kh * kd * b) + p * b + h * (kw * kd) + w * kd + o * (kw * kh * kd) + d
+                                tca_output[out_index] = padded_data[idx]
+                                out_index += 1
+
+        kn2row_output = np.zeros(padded_data.size)
+        out_index = 0
+        for h in range(kh):
+            for w in range(kw):
+                for o in range(oc):
+                    for i in range(kd):
+                        kn2row_output[out_index] = padded_data[o * kh * kw * kd + h * kw * kd + w * kd + i]
+                        out_index += 1
+
+        def pack(data):
+            return packer.run(weight_quantizer.binarizer(data).astype(np.float32)).astype(np.uint32)
+
+        return [~pack(padded_data), ~pack(tca_output).flatten(), pack(kn2row_output).flatten()]
+
     @staticmethod
     def create_sample_graph(data1: np.ndarray, data2: np.ndarray) -> Graph:
         graph = Graph()
@@ -527,6 +610,28 @@ class TestPassConstantFolding(unittest.TestCase):
 
         print("Test pass #9 constant folding passed!")
 
+    def test_pass_constant_folding_chain(self) -> None:
+        """Test that a chain of constant nodes is folded in one pass and same values are reused."""
+        graph = Graph()
+
+        x = Input('placeholder', [2], Float32())
+        s1 = Constant('potato_1', Float32(), np.array([1, 2]))
+        s2 = Constant('potato_2', Float32(), np.array([1, 3]))
+        add1 = Add('potatoes', [2], Float32(), {'A': s1, 'B': s2})
+        add2 = Add('same_potatoes', [2], Float32(), {'A': s1, 'B': s2})
+        add3 = Add('twice_potatoes', [2], Float32(), {'A': add1, 'B': add2})
+        add4 = Add('more_potatoes', [2], Float32(), {'A': x, 'B': add3})
+        y = Output('output', [2], Float32(), {'input': add4})
+        graph.add_op_and_inputs(y)
+
+        stats = pass_constant_folding(graph)
+
+        self.assertEqual(stats['folded'], 3)
+        self.assertEqual(stats['reused'], 1)
+        self.assertEqual(list(graph.get_op('twice_potatoes_new').data), [4, 10])
+        self.assertIs(add4.input_ops['B'], graph.get_op('twice_potatoes_new'))
+        self.assertEqual([op.name for op in graph.consts], ['twice_potatoes_new'])
+
     @staticmethod
     def create_sample_graph() -> Graph:
         graph = Graph()
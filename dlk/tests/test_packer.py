@@ -95,6 +95,48 @@ class TestPacker(unittest.TestCase):
         with self.assertRaises(ValueError):
             packer.run(test_input)
 
+    def test_word_types(self):
+        """Test for packing into uint8, uint32 and uint64 words."""
+        test_input = np.zeros([64], dtype=np.float32)
+        test_input[0:6] = [0, 1, 0, 1, 0, 1]
+        test_input[-1] = 1
+
+        np.testing.assert_array_equal(Packer(1, 8, np.uint8).run(test_input)[0], [42, 0, 0, 0, 0, 0, 0, 128])
+        np.testing.assert_array_equal(Packer(1, 32, np.uint32).run(test_input)[0], [42, 2 ** 31])
+        np.testing.assert_array_equal(Packer(1, 64, np.uint64).run(test_input)[0], [42 + 2 ** 63])
+        self.assertEqual(Packer(1, 64, np.uint64).run(test_input).dtype, np.uint64)
+
+    def test_bw2_bit_interleaving(self):
+        """Test for packing the bits of each value contiguously (2 bit version)."""
+        packer = Packer(2, 8, np.uint8, arrangement='BitInterleaving')
+
+        test_input = np.array([3, 0, 1, 2, 1], dtype=np.float32)
+
+        test_output = packer.run(test_input)
+        expected_output = [0b10010011, 0b00000001]
+
+        np.testing.assert_array_equal(test_output[0], expected_output)
+
+    def test_unpack(self):
+        """Test that unpacking restores the packed values."""
+        test_input = np.random.randint(0, 4, size=[3, 3, 37])
+
+        for dtype, wordsize in [(np.uint8, 8), (np.uint32, 32), (np.uint64, 37), (np.uint64, 64)]:
+            for arrangement in Packer.ARRANGEMENTS:
+                packer = Packer(2, wordsize, dtype, arrangement)
+                test_output = packer.unpack(packer.run(test_input), test_input.size)
+
+                np.testing.assert_array_equal(test_output, test_input.flatten())
+
+    def test_run_layouts(self):
+        """Test that packing tensors at once is the same as packing them one by one."""
+        packer = Packer(2, 32)
+
+        test_inputs = [np.random.randint(0, 4, size=[2, 3, 50]) for _ in range(3)]
+
+        for test_output, test_input in zip(packer.run_layouts(test_inputs), test_inputs):
+            np.testing.assert_array_equal(test_output, packer.run(test_input))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import time
+
+import click
+import numpy as np
+
+from lmnet.metrics.mean_average_precision import _mean_average_precision, mean_average_precision
+
+
+def _random_boxes(rng, num_images, num_classes, num_gt_boxes, num_pred_boxes, image_size=416):
+    """Random ground truth boxes and predicted boxes around them, like a validation set."""
+    all_gt_boxes = np.concatenate([
+        rng.uniform(0, image_size, size=(num_images, num_gt_boxes, 2)),
+        rng.uniform(8, image_size / 4, size=(num_images, num_gt_boxes, 2)),
+        rng.randint(0, num_classes, size=(num_images, num_gt_boxes, 1)),
+    ], axis=2)
+
+    all_predict_boxes = []
+    for gt_boxes in all_gt_boxes:
+        base_boxes = gt_boxes[rng.randint(0, num_gt_boxes, size=num_pred_boxes), :4]
+        all_predict_boxes.append(np.concatenate([
+            base_boxes + rng.normal(0, 8, size=base_boxes.shape),
+            # some predictions have the class of the base ground truth box.
+            np.where(
+                rng.uniform(size=(num_pred_boxes, 1)) < 0.5,
+                gt_boxes[rng.randint(0, num_gt_boxes, size=(num_pred_boxes, 1)), 4],
+                rng.randint(0, num_classes, size=(num_pred_boxes, 1)),
+            ),
+            rng.uniform(0, 1, size=(num_pred_boxes, 1)),
+        ], axis=1))
+
+    return all_predict_boxes, all_gt_boxes
+
+
+def _is_same_result(result, expected):
+    if result["MeanAveragePrecision"] != expected["MeanAveragePrecision"]:
+        return False
+    for key in ["AveragePrecision", "Precision", "Recall", "OrderedPrecision", "OrderedRecall"]:
+        if not all(np.array_equal(value, expected_value) for value, expected_value in zip(result[key], expected[key])):
+            return False
+    return True
+
+
+def run(num_images, num_classes, num_gt_boxes, num_pred_boxes, num_workers_list, skip_reference, seed):
+    rng = np.random.RandomState(seed)
+    all_predict_boxes, all_gt_boxes = _random_boxes(rng, num_images, num_classes, num_gt_boxes, num_pred_boxes)
+    classes = ["class_{}".format(i) for i in range(num_classes)]
+
+    print("{} images, {} classes, {} ground truth boxes and {} predicted boxes per image".format(
+        num_images, num_classes, num_gt_boxes, num_pred_boxes))
+
+    expected = None
+    if not skip_reference:
+        start = time.perf_counter()
+        expected = _mean_average_precision(all_predict_boxes, all_gt_boxes, classes)
+        reference_time = time.perf_counter() - start
+        print("{:>24}: {:10.3f} sec, mAP {:.6f}".format(
+            "_mean_average_precision", reference_time, expected["MeanAveragePrecision"]))
+
+    for num_workers in num_workers_list:
+        start = time.perf_counter()
+        result = mean_average_precision(all_predict_boxes, all_gt_boxes, classes, num_workers=num_workers or None)
+        elapsed = time.perf_counter() - start
+
+        line = "{:>24}: {:10.3f} sec, mAP {:.6f}".format(
+            "workers={}".format(num_workers), elapsed, result["MeanAveragePrecision"])
+        if expected is not None:
+            line += ", {:.1f}x, identical: {}".format(reference_time / elapsed, _is_same_result(result, expected))
+        print(line)
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option(
+    "--num_images",
+    type=int,
+    default=5000,
+)
+@click.option(
+    "--num_classes",
+    type=int,
+    default=500,
+)
+@click.option(
+    "--num_gt_boxes",
+    help="The number of ground truth boxes per image.",
+    type=int,
+    default=10,
+)
+@click.option(
+    "--num_pred_boxes",
+    help="The number of predicted boxes per image.",
+    type=int,
+    default=100,
+)
+@click.option(
+    "-w",
+    "--num_workers",
+    "num_workers_list",
+    help="The number of processes of `mean_average_precision`, 0 is no process. Can be given multiple times.",
+    type=int,
+    multiple=True,
+    default=[0, 4],
+)
+@click.option(
+    "--skip_reference",
+    help="Don't run the former `_mean_average_precision`, it is slow on large sets.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+)
+def main(num_images, num_classes, num_gt_boxes, num_pred_boxes, num_workers_list, skip_reference, seed):
+    """Benchmark `mean_average_precision` against `_mean_average_precision` on random boxes."""
+    run(num_images, num_classes, num_gt_boxes, num_pred_boxes, list(num_workers_list), skip_reference, seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import time
+
+import click
+import numpy as np
+
+from lmnet.post_processor import NMS
+from lmnet.utils.box import iou
+
+
+def _loop_nms(boxes, iou_threshold, max_output_size):
+    """The former `NMS._nms`, which calculates IoU box by box."""
+    scores = boxes[:, 5]
+    order_indices = np.argsort(-scores)
+    keep_indices = []
+
+    while order_indices.size > 0:
+        i = order_indices[0]
+        keep_indices.append(i)
+        if order_indices.size == 1:
+            break
+        ious = iou(boxes[order_indices[1:], :], boxes[i, :])
+        remain_boxes = np.where(ious < iou_threshold)[0] + 1
+        order_indices = order_indices[remain_boxes]
+
+    return boxes[keep_indices, :][:max_output_size, :]
+
+
+def _loop_nms_per_class(outputs, num_classes, iou_threshold, max_output_size, per_class):
+    results = []
+    for boxes in outputs:
+        if per_class:
+            results.append(np.concatenate([
+                _loop_nms(boxes[boxes[:, 4] == class_id], iou_threshold, max_output_size)
+                for class_id in range(num_classes)
+            ]))
+        else:
+            results.append(_loop_nms(boxes, iou_threshold, max_output_size))
+    return results
+
+
+def _random_boxes(rng, num_boxes, num_classes, image_size):
+    """Random candidate boxes like the outputs of `FormatYoloV2` and `ExcludeLowScoreBox`."""
+    left_top = rng.uniform(0, 1, size=(num_boxes, 2)) * image_size
+    width_height = rng.uniform(0.02, 0.3, size=(num_boxes, 2)) * image_size
+    class_ids = rng.randint(0, num_classes, size=(num_boxes, 1))
+    scores = rng.uniform(0, 1, size=(num_boxes, 1))
+    return np.concatenate([left_top, width_height, class_ids, scores], axis=1)
+
+
+def _measure(func, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed.append(time.perf_counter() - start)
+    return np.median(elapsed), result
+
+
+def run(num_boxes_list, num_classes, iou_threshold, max_output_size, repeat, seed):
+    rng = np.random.RandomState(seed)
+    image_size = np.array([416, 416])
+
+    print("{:>8} {:>10} {:>10} {:>12} {:>12} {:>10}".format(
+        "boxes", "per_class", "soft_nms", "loop [ms]", "nms [ms]", "speedup"))
+    for num_boxes in num_boxes_list:
+        outputs = [_random_boxes(rng, num_boxes, num_classes, image_size)]
+
+        for per_class in [True, False]:
+            loop_time, expected = _measure(
+                lambda: _loop_nms_per_class(outputs, num_classes, iou_threshold, max_output_size, per_class),
+                repeat,
+            )
+
+            for soft_nms in [None, "linear", "gaussian"]:
+                nms = NMS(
+                    classes=range(num_classes),
+                    iou_threshold=iou_threshold,
+                    max_output_size=max_output_size,
+                    per_class=per_class,
+                    soft_nms=soft_nms,
+                )
+                nms_time, result = _measure(lambda: nms(outputs)["outputs"], repeat)
+
+                if soft_nms is None:
+                    assert all(np.allclose(a, b) for a, b in zip(expected, result)), "NMS results are different."
+
+                print("{:>8} {:>10} {:>10} {:>12.2f} {:>12.2f} {:>10}".format(
+                    num_boxes,
+                    str(per_class),
+                    str(soft_nms),
+                    loop_time * 1000,
+                    nms_time * 1000,
+                    "{:.1f}x".format(loop_time / nms_time) if soft_nms is None else "-",
+                ))
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option(
+    "-n",
+    "--num_boxes",
+    "num_boxes_list",
+    help="The number of candidate boxes per image. Can be given multiple times.",
+    type=int,
+    multiple=True,
+    default=[1000, 5000, 20000],
+)
+@click.option(
+    "--num_classes",
+    help="The number of classes.",
+    type=int,
+    default=20,
+)
+@click.option(
+    "--iou_threshold",
+    type=float,
+    default=0.5,
+)
+@click.option(
+    "--max_output_size",
+    type=int,
+    default=100,
+)
+@click.option(
+    "-r",
+    "--repeat",
+    help="The number of measurements, the median is reported.",
+    type=int,
+    default=3,
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+)
+def main(num_boxes_list, num_classes, iou_threshold, max_output_size, repeat, seed):
+    """Benchmark `lmnet.post_processor.NMS` against the former box by box implementation."""
+    run(list(num_boxes_list), num_classes, iou_threshold, max_output_size, repeat, seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import time
+
+import click
+import numpy as np
+import tensorflow as tf
+
+from lmnet.networks.object_detection.yolo_v2 import YoloV2
+
+ANCHORS = [(1.3221, 1.73145), (3.19275, 4.00944), (5.05587, 8.09892), (9.47112, 4.84053), (11.2364, 10.0071)]
+
+
+def _random_gt_boxes(rng, batch_size, num_max_boxes, num_classes, image_size):
+    """Random ground truth boxes [batch_size, num_max_boxes, 5(x, y, w, h, class_id)], padded by dummy boxes."""
+    gt_boxes = np.zeros((batch_size, num_max_boxes, 5), dtype=np.float32)
+    gt_boxes[:, :, 4] = -1
+    for gt_boxes_per_image in gt_boxes:
+        num_boxes = rng.randint(1, num_max_boxes + 1)
+        w = rng.uniform(8, image_size[1] / 2, num_boxes)
+        h = rng.uniform(8, image_size[0] / 2, num_boxes)
+        gt_boxes_per_image[:num_boxes, 0] = rng.uniform(0, image_size[1] - w)
+        gt_boxes_per_image[:num_boxes, 1] = rng.uniform(0, image_size[0] - h)
+        gt_boxes_per_image[:num_boxes, 2] = w
+        gt_boxes_per_image[:num_boxes, 3] = h
+        gt_boxes_per_image[:num_boxes, 4] = rng.randint(0, num_classes, num_boxes)
+    return gt_boxes
+
+
+def _steps_per_sec(batch_size, num_max_boxes, num_classes, image_size, global_step, steps, seed):
+    """Measure steps/sec of the loss of random outputs, which includes the target assignment of `YoloV2Loss`."""
+    rng = np.random.RandomState(seed)
+    graph = tf.Graph()
+    with graph.as_default():
+        model = YoloV2(
+            classes=["class_{}".format(i) for i in range(num_classes)],
+            image_size=image_size,
+            batch_size=batch_size,
+            num_max_boxes=num_max_boxes,
+            anchors=ANCHORS,
+        )
+        num_cell_y, num_cell_x = model.num_cell
+        output_shape = [batch_size, num_cell_y, num_cell_x, model.boxes_per_cell * (num_classes + 5)]
+
+        output_placeholder = tf.compat.v1.placeholder(tf.float32, shape=output_shape)
+        _, labels_placeholder = model.placeholders()
+        global_step_placeholder = tf.compat.v1.placeholder(tf.int64, shape=())
+        # the weight decay loss needs a kernel.
+        tf.compat.v1.get_variable("conv/kernel", shape=[3, 3, 3, 8])
+        loss = model.loss(output_placeholder, labels_placeholder, global_step_placeholder)
+
+        init_op = tf.compat.v1.global_variables_initializer()
+
+    feed_dicts = [{
+        output_placeholder: rng.normal(0, 1, size=output_shape).astype(np.float32),
+        labels_placeholder: _random_gt_boxes(rng, batch_size, num_max_boxes, num_classes, image_size),
+        global_step_placeholder: global_step,
+    } for _ in range(4)]
+
+    session_config = tf.compat.v1.ConfigProto(device_count={"GPU": 0})
+    with tf.compat.v1.Session(graph=graph, config=session_config) as sess:
+        sess.run(init_op)
+        # warm up
+        sess.run(loss, feed_dict=feed_dicts[0])
+
+        start = time.perf_counter()
+        for step in range(steps):
+            sess.run(loss, feed_dict=feed_dicts[step % len(feed_dicts)])
+        elapsed = time.perf_counter() - start
+
+    return steps / elapsed
+
+
+def run(batch_sizes, num_max_boxes, num_classes, image_size, global_step, steps, seed):
+    print("image size {}, {} classes, {} max boxes, {} anchors, global step {}".format(
+        image_size, num_classes, num_max_boxes, len(ANCHORS), global_step))
+
+    for batch_size in batch_sizes:
+        steps_per_sec = _steps_per_sec(batch_size, num_max_boxes, num_classes, image_size, global_step, steps, seed)
+        print("{:>24}: {:10.2f} steps/sec, {:10.1f} images/sec".format(
+            "batch_size={}".format(batch_size), steps_per_sec, steps_per_sec * batch_size))
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option(
+    "-b",
+    "--batch_size",
+    "batch_sizes",
+    help="Batch size. Can be given multiple times.",
+    type=int,
+    multiple=True,
+    default=[8, 16, 32, 64],
+)
+@click.option(
+    "--num_max_boxes",
+    type=int,
+    default=20,
+)
+@click.option(
+    "--num_classes",
+    type=int,
+    default=20,
+)
+@click.option(
+    "--image_size",
+    help="Image size [height, width], which can be divided by 32.",
+    type=(int, int),
+    default=(416, 416),
+)
+@click.option(
+    "--global_step",
+    help="Global step of the loss. The steps less than the loss warmup steps add the coordinate loss of anchors.",
+    type=int,
+    default=1000,
+)
+@click.option(
+    "--steps",
+    help="The number of measured steps per batch size.",
+    type=int,
+    default=20,
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+)
+def main(batch_sizes, num_max_boxes, num_classes, image_size, global_step, steps, seed):
+    """Benchmark steps/sec of the YOLOv2 loss on CPU, with random outputs and ground truth boxes."""
+    run(list(batch_sizes), num_max_boxes, num_classes, list(image_size), global_step, steps, seed)
+
+
+if __name__ == "__main__":
+    main()
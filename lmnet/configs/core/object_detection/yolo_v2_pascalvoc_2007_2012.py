@@ -54,6 +54,8 @@ SAVE_CHECKPOINT_STEPS = 50000
 KEEP_CHECKPOINT_MAX = 5
 TEST_STEPS = 10000
 SUMMARISE_STEPS = 1000
+# numpy mean average precisions of the post-processed boxes, they slow down the validation.
+# NUMPY_DETECTION_METRICS = True
 
 
 # for debug
@@ -242,3 +244,5 @@ DATASET.AUGMENTOR = Sequence([
     SSDRandomCrop(min_crop_ratio=0.7),
 ])
 DATASET.ENABLE_PREFETCH = True
+# DATASET.PREFETCH_KWARGS = {"engine": "shared_memory", "num_workers": 32, "queue_size": 200, "num_in_flight": 16}
+# DATASET.INPUT_MODE = "tf_data"
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+import shutil
+
+import click
+
+from lmnet.datasets.shards import ShardMixin, write_shards
+from lmnet.datasets.tfds import TFDSMixin
+from lmnet.utils import config as config_util
+
+
+def _get_shard_settings(config_file):
+    config = config_util.load(config_file)
+    dataset_class = config.DATASET_CLASS
+    dataset_kwargs = {key.lower(): val for key, val in config.DATASET.items()}
+
+    if "shard_kwargs" not in dataset_kwargs:
+        raise ValueError("The given config file does not contain settings for building shards.\n"
+                         "Please see help messages (python executor/build_shards.py -h) for detail.")
+
+    if issubclass(dataset_class, (TFDSMixin, ShardMixin)):
+        raise ValueError("You cannot use dataset classes which is already a TFDS or shard format.")
+
+    shard_kwargs = dataset_kwargs.pop("shard_kwargs")
+    dataset_kwargs.pop("tfds_kwargs", None)
+
+    # samples are stored before augmentation and pre-processing.
+    dataset_kwargs.pop("augmentor", None)
+    dataset_kwargs.pop("pre_processor", None)
+
+    return dataset_class, dataset_kwargs, shard_kwargs
+
+
+def run(config_file, overwrite, subsets=None):
+    """Build packed shards from config file"""
+    dataset_class, dataset_kwargs, shard_kwargs = _get_shard_settings(config_file)
+    shard_dir = os.path.expanduser(shard_kwargs["shard_dir"])
+    shard_bytes = shard_kwargs.get("shard_bytes", 256 * 1024 ** 2)
+    image_format = shard_kwargs.get("image_format", "png")
+
+    if not overwrite and os.path.exists(shard_dir):
+        raise ValueError("Output path already exists: {}\n"
+                         "Please use --overwrite if you want to overwrite.".format(shard_dir))
+
+    subsets = subsets or dataset_class.available_subsets
+    for subset in subsets:
+        output_dir = os.path.join(shard_dir, subset)
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+
+        dataset = dataset_class(subset=subset, **dataset_kwargs)
+        num_records = write_shards(dataset, output_dir, shard_bytes=shard_bytes, image_format=image_format)
+        print("{} records of {} subset were packed into {}.".format(num_records, subset, output_dir))
+
+    print("Done!!")
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option(
+    "-c",
+    "--config_file",
+    help="A path to config file",
+    required=True,
+)
+@click.option(
+    "-o",
+    "--overwrite",
+    help="Overwrite if the output directory already exists.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "-s",
+    "--subset",
+    "subsets",
+    help="Subset to be packed. Can be given multiple times. Default is all the available subsets.",
+    multiple=True,
+)
+def main(config_file, overwrite, subsets):
+    """
+    A script to pack datasets into large binary shard files
+
+    \b
+    This script packs existing dataset classes into a few large shard files, which are read with large sequential
+    reads instead of opening each small image file. It is useful for datasets on network filesystems.
+    The following settings are required in the config file.
+
+    \b
+    ```
+    DATASET_CLASS = <dataset class>
+    DATASET.SHARD_KWARGS = {
+        "shard_dir": "<a directory path to output shards>",
+        "shard_bytes": <optional, size of a shard file. default is 256MB>,
+        "image_format": <optional, "png" or "jpeg". default is "png">,
+    }
+    ```
+
+    \b
+    If you have a training config file with the settings above,
+    you can execute this script and the training script with the same config file.
+    Then the packed shards will be used for training.
+
+    \b
+    ```
+    python executor/build_shards.py -c common_config_file.py
+    python executor/train.py        -c common_config_file.py
+    ```
+    """
+
+    run(os.path.expanduser(config_file), overwrite, list(subsets))
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ import tensorflow as tf
 from lmnet import environment
 from lmnet.datasets.base import ObjectDetectionBase
 from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.shards import shard_dataset_class
 from lmnet.datasets.tfds import TFDSClassification, TFDSObjectDetection
 from lmnet.utils import config as config_util
 from lmnet.utils import executor, module_loader
@@ -39,15 +40,21 @@ def setup_dataset(config, subset, seed):
 
     # If there is a settings for TFDS, TFDS dataset class will be used.
     tfds_kwargs = dataset_kwargs.pop("tfds_kwargs", {})
+    prefetch_kwargs = dataset_kwargs.pop("prefetch_kwargs", {})
     if tfds_kwargs:
         if issubclass(DatasetClass, ObjectDetectionBase):
             DatasetClass = TFDSObjectDetection
         else:
             DatasetClass = TFDSClassification
 
-    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs)
+    # If there is a settings for packed shards, shard dataset class will be used.
+    shard_kwargs = dataset_kwargs.pop("shard_kwargs", {})
+    if shard_kwargs:
+        DatasetClass = shard_dataset_class(DatasetClass)
+
+    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs, **shard_kwargs)
     enable_prefetch = dataset_kwargs.pop("enable_prefetch", False)
-    return DatasetIterator(dataset, seed=seed, enable_prefetch=enable_prefetch)
+    return DatasetIterator(dataset, seed=seed, enable_prefetch=enable_prefetch, prefetch_kwargs=prefetch_kwargs)
 
 
 def evaluate(config, restore_path, output_dir):
@@ -105,6 +112,7 @@ def evaluate(config, restore_path, output_dir):
         summary_op = tf.compat.v1.summary.merge_all()
 
         metrics_summary_op, metrics_placeholders = executor.prepare_metrics(metrics_ops_dict)
+        detection_metrics = executor.prepare_detection_metrics(config, validation_dataset.classes)
 
         init_op = tf.global_variables_initializer()
         reset_metrics_op = tf.local_variables_initializer()
@@ -134,11 +142,18 @@ def evaluate(config, restore_path, output_dir):
         }
 
         # Summarize at only last step.
+        # the output is only needed by the numpy detection metrics.
+        detection_fetches = [output] if detection_metrics else []
         if test_step == test_step_size - 1:
-            summary, _ = sess.run([summary_op, metrics_update_op], feed_dict=feed_dict)
+            summary, _, *detection_values = sess.run(
+                [summary_op, metrics_update_op] + detection_fetches, feed_dict=feed_dict
+            )
             validation_writer.add_summary(summary, last_step)
         else:
-            sess.run([metrics_update_op], feed_dict=feed_dict)
+            _, *detection_values = sess.run([metrics_update_op] + detection_fetches, feed_dict=feed_dict)
+
+        if detection_metrics:
+            executor.update_detection_metrics(detection_metrics, config, *detection_values, labels)
 
     metrics_values = sess.run(list(metrics_ops_dict.values()))
     metrics_feed_dict = {
@@ -150,6 +165,11 @@ def evaluate(config, restore_path, output_dir):
     )
     validation_writer.add_summary(metrics_summary, last_step)
 
+    detection_metrics_values = {}
+    if detection_metrics:
+        detection_metrics_values, detection_metrics_summary = executor.detection_metrics_summary(detection_metrics)
+        validation_writer.add_summary(detection_metrics_summary, last_step)
+
     is_tfds = "TFDS_KWARGS" in config.DATASET
     dataset_name = config.DATASET.TFDS_KWARGS["name"] if is_tfds else config.DATASET_CLASS.__name__
     dataset_path = config.DATASET.TFDS_KWARGS["data_dir"] if is_tfds else ""
@@ -163,6 +183,9 @@ def evaluate(config, restore_path, output_dir):
         # TODO: Fix to avoid the implementation depended on the order of dict implicitly
         'metrics': {k: float(v) for k, v in zip(list(metrics_ops_dict.keys()), metrics_values)},
     }
+    metrics_dict['metrics'].update(
+        {"numpy_metrics/{}".format(k): v for k, v in detection_metrics_values.items()}
+    )
     save_json(output_dir, json.dumps(metrics_dict, indent=4,), metrics_dict["last_step"])
 
 
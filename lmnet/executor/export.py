@@ -13,8 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import json
 import os
+import re
 import shutil
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import click
 import PIL
@@ -40,7 +45,11 @@ def _pre_process(raw_image, pre_processor, data_format):
     return image
 
 
-def _save_all_operation_outputs(image_path, output_dir, image, raw_image, all_outputs, image_size):
+CAPTURE_FORMATS = ["npy", "archive"]
+CAPTURE_ARCHIVE_NAME = "activations.npz"
+
+
+def _save_input_images(image_path, output_dir, image, raw_image):
     shutil.copy(image_path, os.path.join(output_dir))
     tmp_image = PIL.Image.open(image_path)
     tmp_image.save(os.path.join(output_dir, "raw_image.png"))
@@ -48,8 +57,98 @@ def _save_all_operation_outputs(image_path, output_dir, image, raw_image, all_ou
 
     np.save(os.path.join(output_dir, "preprocessed_image.npy"), image)
 
-    for _output in all_outputs:
-        np.save(os.path.join(output_dir, "{}.npy".format(_output['name'])), _output['val'])
+
+def _capture_targets(all_ops, name_pattern=None, op_types=None):
+    """List up the output tensors to be captured.
+
+    Returns:
+        list: tuples of the file name and the tensor name. The file name has the index in all the outputs,
+            so it does not change with the filters.
+    """
+    targets = []
+    index = 0
+    for op in all_ops:
+        for op_output in op.outputs:
+            name = '%03d' % index + '_' + op_output.name.replace('/', '_')
+            index += 1
+
+            if op_types and op.type not in op_types:
+                continue
+            if name_pattern and not re.search(name_pattern, op_output.name):
+                continue
+            targets.append((name, op_output.name))
+
+    return targets
+
+
+class _NpyWriter(object):
+    """Save each output as a `.npy` file."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def write(self, name, value):
+        np.save(os.path.join(self.output_dir, "{}.npy".format(name)), value)
+
+    def close(self):
+        pass
+
+
+class _ArchiveWriter(object):
+    """Save outputs into a single `.npz` archive, which is streamed one by one.
+
+    The archive can be read with `np.load`. `index.json` in the archive has the name, shape and dtype of outputs
+    in the captured order.
+    """
+
+    def __init__(self, output_dir):
+        self.archive = zipfile.ZipFile(os.path.join(output_dir, CAPTURE_ARCHIVE_NAME), "w", allowZip64=True)
+        self.index = []
+
+    def write(self, name, value):
+        value = np.asanyarray(value)
+        with self.archive.open("{}.npy".format(name), "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, value, allow_pickle=False)
+        self.index.append({"name": name, "shape": list(value.shape), "dtype": value.dtype.str})
+
+    def close(self):
+        self.archive.writestr("index.json", json.dumps(self.index, indent=2))
+        self.archive.close()
+
+
+def _capture_operation_outputs(sess, feed_dict, targets, output_dir, chunk_size=0, capture_format="npy"):
+    """Fetch the target tensors with a few `sess.run` and save them in a writer thread.
+
+    Args:
+        sess: session.
+        feed_dict (dict): feed dict of the inference.
+        targets (list): tuples of the file name and the tensor name from `_capture_targets`.
+        output_dir (str): output directory.
+        chunk_size (int): the number of tensors fetched by a `sess.run`. 0 is all the tensors at once.
+        capture_format (str): "npy" saves `.npy` files, "archive" saves a `.npz` archive.
+    """
+    chunk_size = chunk_size or max(len(targets), 1)
+    writer = _ArchiveWriter(output_dir) if capture_format == "archive" else _NpyWriter(output_dir)
+
+    def write_chunk(names, values):
+        for name, value in zip(names, values):
+            writer.write(name, value)
+
+    # at most two chunks are waiting for the writer, the next chunk is computed while they are written.
+    write_futures = deque()
+    with ThreadPoolExecutor(1) as write_pool:
+        for start in range(0, len(targets), chunk_size):
+            chunk = targets[start:start + chunk_size]
+            values = sess.run([tensor_name for _, tensor_name in chunk], feed_dict=feed_dict)
+            write_futures.append(write_pool.submit(write_chunk, [name for name, _ in chunk], values))
+
+            while len(write_futures) > 2:
+                write_futures.popleft().result()
+
+        while write_futures:
+            write_futures.popleft().result()
+
+    writer.close()
 
 
 def _minimal_operations(sess):
@@ -63,7 +162,8 @@ def _minimal_operations(sess):
     return ops
 
 
-def _export(config, restore_path, image_path):
+def _export(config, restore_path, image_path, capture_pattern=None, capture_op_types=None,
+            capture_chunk_size=0, capture_format="npy"):
     if restore_path is None:
         restore_file = executor.search_restore_filename(environment.CHECKPOINTS_DIR)
         restore_path = os.path.join(environment.CHECKPOINTS_DIR, restore_file)
@@ -124,17 +224,11 @@ def _export(config, restore_path, image_path):
             images_placeholder: images,
         }
 
-        all_outputs = []
-        index = 0
-        for op in all_ops:
-            for op_output in op.outputs:
-                val = sess.run(op_output.name, feed_dict=feed_dict)
-                name = '%03d' % index + '_' + op_output.name.replace('/', '_')
-                all_outputs.append({'val': val, 'name': name})
-                index += 1
+        targets = _capture_targets(all_ops, capture_pattern, capture_op_types)
+        _capture_operation_outputs(
+            sess, feed_dict, targets, inference_values_output_dir, capture_chunk_size, capture_format)
 
-        _save_all_operation_outputs(
-            image_path, inference_values_output_dir, image, raw_image, all_outputs, config.IMAGE_SIZE)
+        _save_input_images(image_path, inference_values_output_dir, image, raw_image)
 
     yaml_names = config_util.save_yaml(main_output_dir, config)
     pb_name = executor.save_pb_file(sess, main_output_dir)
@@ -149,7 +243,11 @@ yaml: {}, {}
 
     if image_path:
         message += "Create npy files in under `inference_test_data` folder \n"
-        message += "npy: {}".format([d["name"] for d in all_outputs] + ["raw_image", "preprocessed_image", ])
+        if capture_format == "archive":
+            message += "npy: {}\n".format(["raw_image", "preprocessed_image", ])
+            message += "archive: {} has {}".format(CAPTURE_ARCHIVE_NAME, [name for name, _ in targets])
+        else:
+            message += "npy: {}".format([name for name, _ in targets] + ["raw_image", "preprocessed_image", ])
 
     print(message)
     print("finish")
@@ -161,7 +259,11 @@ def run(experiment_id,
         restore_path=None,
         image_size=(None, None),
         image=DEFAULT_INFERENCE_TEST_DATA_IMAGE,
-        config_file=None):
+        config_file=None,
+        capture_pattern=None,
+        capture_op_types=None,
+        capture_chunk_size=0,
+        capture_format="npy"):
     environment.init(experiment_id)
 
     config = config_util.load_from_experiment()
@@ -190,7 +292,7 @@ def run(experiment_id,
     executor.init_logging(config)
     config_util.display(config)
 
-    return _export(config, restore_path, image)
+    return _export(config, restore_path, image, capture_pattern, capture_op_types, capture_chunk_size, capture_format)
 
 
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
@@ -224,13 +326,40 @@ def run(experiment_id,
     "--config_file",
     help="config file path. override saved experiment config.",
 )
-def main(experiment_id, restore_path, image_size, image, config_file):
+@click.option(
+    "--capture_pattern",
+    help="regular expression of tensor names. Only matched tensors are saved in `inference_test_data`.",
+    default=None,
+)
+@click.option(
+    "--capture_op_type",
+    "capture_op_types",
+    help="operation type like `Conv2D`. Only outputs of the type are saved. Can be given multiple times.",
+    multiple=True,
+)
+@click.option(
+    "--capture_chunk_size",
+    help="the number of tensors fetched by a session run. 0 is all the tensors at once.",
+    type=int,
+    default=0,
+)
+@click.option(
+    "--capture_format",
+    help="`npy` saves each tensor as a npy file, `archive` saves all the tensors in `{}`.".format(
+        CAPTURE_ARCHIVE_NAME),
+    type=click.Choice(CAPTURE_FORMATS),
+    default="npy",
+)
+def main(experiment_id, restore_path, image_size, image, config_file,
+         capture_pattern, capture_op_types, capture_chunk_size, capture_format):
     """Exporting a trained model to proto buffer files and meta config yaml.
 
     In the case with `image` option, create each layer output value npy files into
     `export/{restore_path}/{image_size}/inference_test_data/**.npy` as expected value for inference test and debug.
+    All the outputs are computed by a single session run (or a few with `--capture_chunk_size`).
     """
-    run(experiment_id, restore_path, image_size, image, config_file)
+    run(experiment_id, restore_path, image_size, image, config_file,
+        capture_pattern, list(capture_op_types), capture_chunk_size, capture_format)
 
 
 if __name__ == '__main__':
@@ -13,9 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import collections
 import imghdr
 import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 
 import click
@@ -52,6 +55,35 @@ def _get_images(filenames, pre_processor, data_format):
     return np.array(images), np.array(raw_images)
 
 
+def _load_images(image_files, pre_processor, data_format):
+    start = time.perf_counter()
+    images, raw_images = _get_images(image_files, pre_processor, data_format)
+    return images, raw_images, time.perf_counter() - start
+
+
+def _write_outputs(writer, output_dir, outputs, raw_images, image_files, step, save_images):
+    start = time.perf_counter()
+    writer.write(
+        output_dir,
+        outputs,
+        raw_images,
+        image_files,
+        step,
+        save_material=save_images
+    )
+    return time.perf_counter() - start
+
+
+def _print_throughput(num_images, stage_seconds, wait_seconds, total_seconds):
+    """Print images per second of each stage, decode and write are the sum over the workers."""
+    for stage, seconds in stage_seconds.items():
+        print("{:>10}: {:10.1f} images/sec, {:8.2f} sec".format(stage, num_images / max(seconds, 1e-9), seconds))
+    print("inference waited for decoded images {:.2f} sec and for written outputs {:.2f} sec.".format(
+        wait_seconds["decode"], wait_seconds["write"]))
+    print("{:>10}: {:10.1f} images/sec, {:8.2f} sec".format(
+        "total", num_images / max(total_seconds, 1e-9), total_seconds))
+
+
 def _all_image_files(directory):
     all_image_files = []
     for file_path in glob(os.path.join(directory, "*")):
@@ -61,7 +93,13 @@ def _all_image_files(directory):
     return all_image_files
 
 
-def _run(input_dir, output_dir, config, restore_path, save_images):
+def _run(input_dir, output_dir, config, restore_path, save_images,
+         decode_workers=4, write_workers=2, queue_size=4, output_format="json"):
+    """Predict all the images in the input directory with a three stages pipeline.
+
+    Batches are decoded and pre-processed by `decode_workers` threads, run by the session in this thread,
+    then written by `write_workers` threads. At most `queue_size` batches are waiting for each stage.
+    """
     ModelClass = config.NETWORK_CLASS
     network_kwargs = dict((key.lower(), val) for key, val in config.NETWORK.items())
 
@@ -95,10 +133,11 @@ def _run(input_dir, output_dir, config, restore_path, save_images):
         task=config.TASK,
         classes=config.CLASSES,
         image_size=config.IMAGE_SIZE,
-        data_format=config.DATA_FORMAT
+        data_format=config.DATA_FORMAT,
+        output_format=output_format,
     )
 
-    results = []
+    batches = []
     for step in range(step_size):
         start_index = (step) * config.BATCH_SIZE
         end_index = (step + 1) * config.BATCH_SIZE
@@ -109,30 +148,61 @@ def _run(input_dir, output_dir, config, restore_path, save_images):
             # add dummy image.
             image_files.append(DUMMY_FILENAME)
 
-        images, raw_images = _get_images(
-            image_files, config.DATASET.PRE_PROCESSOR, config.DATA_FORMAT)
+        batches.append(image_files)
 
-        feed_dict = {images_placeholder: images}
-        outputs = sess.run(output_op, feed_dict=feed_dict)
+    stage_seconds = collections.OrderedDict([("decode", 0.), ("inference", 0.), ("write", 0.)])
+    wait_seconds = {"decode": 0., "write": 0.}
+    pipeline_start = time.perf_counter()
 
-        if config.POST_PROCESSOR:
-            outputs = config.POST_PROCESSOR(outputs=outputs)["outputs"]
+    results = []
+    with ThreadPoolExecutor(decode_workers) as decode_pool, ThreadPoolExecutor(write_workers) as write_pool:
+        decode_futures = collections.deque()
+        write_futures = collections.deque()
+        next_step = 0
 
-        results.append(outputs)
+        for step, image_files in enumerate(batches):
+            while next_step < step_size and len(decode_futures) < queue_size:
+                decode_futures.append(decode_pool.submit(
+                    _load_images, batches[next_step], config.DATASET.PRE_PROCESSOR, config.DATA_FORMAT))
+                next_step += 1
 
-        writer.write(
-            output_dir,
-            outputs,
-            raw_images,
-            image_files,
-            step,
-            save_material=save_images
-        )
+            start = time.perf_counter()
+            images, raw_images, seconds = decode_futures.popleft().result()
+            wait_seconds["decode"] += time.perf_counter() - start
+            stage_seconds["decode"] += seconds
+
+            start = time.perf_counter()
+            feed_dict = {images_placeholder: images}
+            outputs = sess.run(output_op, feed_dict=feed_dict)
+
+            if config.POST_PROCESSOR:
+                outputs = config.POST_PROCESSOR(outputs=outputs)["outputs"]
+                if isinstance(outputs, np.ndarray):
+                    # post processors can return a buffer re-used on the next call, keep it for the writer.
+                    outputs = outputs.copy()
+            stage_seconds["inference"] += time.perf_counter() - start
+
+            results.append(outputs)
+
+            write_futures.append(write_pool.submit(
+                _write_outputs, writer, output_dir, outputs, raw_images, image_files, step, save_images))
+
+            start = time.perf_counter()
+            while len(write_futures) > queue_size:
+                stage_seconds["write"] += write_futures.popleft().result()
+            wait_seconds["write"] += time.perf_counter() - start
+
+        while write_futures:
+            stage_seconds["write"] += write_futures.popleft().result()
+
+    _print_throughput(
+        len(all_image_files), stage_seconds, wait_seconds, time.perf_counter() - pipeline_start)
 
     return results
 
 
-def run(input_dir, output_dir, experiment_id, config_file, restore_path, save_images):
+def run(input_dir, output_dir, experiment_id, config_file, restore_path, save_images,
+        decode_workers=4, write_workers=2, output_format="json"):
     environment.init(experiment_id)
     config = config_util.load_from_experiment()
     if config_file:
@@ -152,7 +222,8 @@ def run(input_dir, output_dir, experiment_id, config_file, restore_path, save_im
 
     print("---- start predict ----")
 
-    _run(input_dir, output_dir, config, restore_path, save_images)
+    _run(input_dir, output_dir, config, restore_path, save_images, decode_workers, write_workers,
+         output_format=output_format)
 
     print("---- end predict ----")
 
@@ -191,15 +262,36 @@ def run(input_dir, output_dir, experiment_id, config_file, restore_path, save_im
     help="Flag of saving images. Default is True.",
     default=True,
 )
-def main(input_dir, output_dir, experiment_id, config_file, restore_path, save_images):
+@click.option(
+    "--decode_workers",
+    help="The number of threads to decode and pre-process images. Default is 4.",
+    type=int,
+    default=4,
+)
+@click.option(
+    "--write_workers",
+    help="The number of threads to write predicted results. Default is 2.",
+    type=int,
+    default=2,
+)
+@click.option(
+    "--output_format",
+    help="Format of predicted results. \"binary\" saves arrays into a `.npz` container instead of npy and json.",
+    type=click.Choice(["json", "binary"]),
+    default="json",
+)
+def main(input_dir, output_dir, experiment_id, config_file, restore_path, save_images, decode_workers, write_workers,
+         output_format):
     """Make predictions from input dir images by using trained model.
         Save the predictions npy, json, images results to output dir.
         npy: `{output_dir}/npy/{batch number}.npy`
         json: `{output_dir}/json/{batch number}.json`
+        binary: `{output_dir}/binary/{batch number}.npz` instead of npy and json with `--output_format binary`
         images: `{output_dir}/images/{some type}/{input image file name}`
     """
 
-    run(input_dir, output_dir, experiment_id, config_file, restore_path, save_images)
+    run(input_dir, output_dir, experiment_id, config_file, restore_path, save_images, decode_workers, write_workers,
+        output_format)
 
 
 if __name__ == '__main__':
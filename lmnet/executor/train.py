@@ -25,6 +25,7 @@ from lmnet import environment
 from lmnet.common import Tasks
 from lmnet.datasets.base import ObjectDetectionBase
 from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.shards import shard_dataset_class
 from lmnet.datasets.tfds import TFDSClassification, TFDSObjectDetection
 from lmnet.utils import config as config_util
 from lmnet.utils import executor
@@ -47,15 +48,21 @@ def setup_dataset(config, subset, rank):
 
     # If there is a settings for TFDS, TFDS dataset class will be used.
     tfds_kwargs = dataset_kwargs.pop("tfds_kwargs", {})
+    prefetch_kwargs = dataset_kwargs.pop("prefetch_kwargs", {})
     if tfds_kwargs:
         if issubclass(DatasetClass, ObjectDetectionBase):
             DatasetClass = TFDSObjectDetection
         else:
             DatasetClass = TFDSClassification
 
-    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs)
+    # If there is a settings for packed shards, shard dataset class will be used.
+    shard_kwargs = dataset_kwargs.pop("shard_kwargs", {})
+    if shard_kwargs:
+        DatasetClass = shard_dataset_class(DatasetClass)
+
+    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs, **shard_kwargs)
     enable_prefetch = dataset_kwargs.pop("enable_prefetch", False)
-    return DatasetIterator(dataset, seed=rank, enable_prefetch=enable_prefetch)
+    return DatasetIterator(dataset, seed=rank, enable_prefetch=enable_prefetch, prefetch_kwargs=prefetch_kwargs)
 
 
 def start_training(config):
@@ -108,23 +115,31 @@ def start_training(config):
 
         images_placeholder, labels_placeholder = model.placeholders()
 
-        output = model.inference(images_placeholder, is_training_placeholder)
+        datasets = {"train": train_dataset, "validation": validation_dataset}
+        if use_train_validation_saving:
+            datasets["train_validation_saving"] = train_validation_saving_dataset
+        input_mode = config.DATASET.get("INPUT_MODE", "feed_dict")
+        input_pipeline = executor.InputPipeline(datasets, images_placeholder, labels_placeholder, input_mode)
+        images, labels = input_pipeline.images, input_pipeline.labels
+
+        output = model.inference(images, is_training_placeholder)
         if config.TASK == Tasks.OBJECT_DETECTION:
-            loss = model.loss(output, labels_placeholder, global_step)
+            loss = model.loss(output, labels, global_step)
         else:
-            loss = model.loss(output, labels_placeholder)
+            loss = model.loss(output, labels)
         opt = model.optimizer(global_step)
         if use_horovod:
             # add Horovod Distributed Optimizer
             opt = hvd.DistributedOptimizer(opt)
         train_op = model.train(loss, opt, global_step)
-        metrics_ops_dict, metrics_update_op = model.metrics(output, labels_placeholder)
+        metrics_ops_dict, metrics_update_op = model.metrics(output, labels)
         # TODO(wakisaka): Deal with many networks.
-        model.summary(output, labels_placeholder)
+        model.summary(output, labels)
 
         summary_op = tf.compat.v1.summary.merge_all()
 
         metrics_summary_op, metrics_placeholders = executor.prepare_metrics(metrics_ops_dict)
+        detection_metrics = executor.prepare_detection_metrics(config, validation_dataset.classes)
 
         init_op = tf.global_variables_initializer()
         reset_metrics_op = tf.local_variables_initializer()
@@ -169,6 +184,7 @@ def start_training(config):
 
     sess = tf.Session(graph=graph, config=session_config)
     sess.run([init_op, reset_metrics_op])
+    input_pipeline.init(sess)
 
     if rank == 0:
         train_writer = tf.summary.FileWriter(environment.TENSORBOARD_DIR + "/train", sess.graph)
@@ -213,13 +229,7 @@ def start_training(config):
         progbar.update(last_step)
     for step in range(last_step, max_steps):
 
-        images, labels = train_dataset.feed()
-
-        feed_dict = {
-            is_training_placeholder: True,
-            images_placeholder: images,
-            labels_placeholder: labels,
-        }
+        feed_dict = input_pipeline.feed_dict("train", {is_training_placeholder: True})
 
         if step * ((step + 1) % config.SUMMARISE_STEPS) == 0 and rank == 0:
             # Runtime statistics for develop.
@@ -242,6 +252,14 @@ def start_training(config):
                 [metrics_summary_op], feed_dict=metrics_feed_dict,
             )
             train_writer.add_summary(metrics_summary, step + 1)
+
+            prefetch_stats = train_dataset.prefetch_stats()
+            if prefetch_stats:
+                prefetch_summary = tf.compat.v1.Summary(value=[
+                    tf.compat.v1.Summary.Value(tag="prefetch/{}".format(key), simple_value=value)
+                    for key, value in prefetch_stats.items()
+                ])
+                train_writer.add_summary(prefetch_summary, step + 1)
             train_writer.flush()
         else:
             sess.run([train_op], feed_dict=feed_dict)
@@ -261,12 +279,7 @@ def start_training(config):
                 for train_validation_saving_step in range(train_validation_saving_step_size):
                     print("train_validation_saving_step", train_validation_saving_step)
 
-                    images, labels = train_validation_saving_dataset.feed()
-                    feed_dict = {
-                        is_training_placeholder: False,
-                        images_placeholder: images,
-                        labels_placeholder: labels,
-                    }
+                    feed_dict = input_pipeline.feed_dict("train_validation_saving", {is_training_placeholder: False})
 
                     if train_validation_saving_step % config.SUMMARISE_STEPS == 0:
                         summary, _ = sess.run([summary_op, metrics_update_op], feed_dict=feed_dict)
@@ -311,24 +324,29 @@ def start_training(config):
         if step == 0 or (step + 1) % config.TEST_STEPS == 0:
             # init metrics values
             sess.run(reset_metrics_op)
+            if detection_metrics:
+                for accumulator in detection_metrics.values():
+                    accumulator.reset()
             test_step_size = int(math.ceil(validation_dataset.num_per_epoch / config.BATCH_SIZE))
 
             for test_step in range(test_step_size):
 
-                images, labels = validation_dataset.feed()
-                feed_dict = {
-                    is_training_placeholder: False,
-                    images_placeholder: images,
-                    labels_placeholder: labels,
-                }
+                feed_dict = input_pipeline.feed_dict("validation", {is_training_placeholder: False})
 
+                # the output and the labels are only needed by the numpy detection metrics.
+                detection_fetches = [output, labels] if detection_metrics else []
                 if test_step % config.SUMMARISE_STEPS == 0:
-                    summary, _ = sess.run([summary_op, metrics_update_op], feed_dict=feed_dict)
+                    summary, _, *detection_values = sess.run(
+                        [summary_op, metrics_update_op] + detection_fetches, feed_dict=feed_dict
+                    )
                     if rank == 0:
                         val_writer.add_summary(summary, step + 1)
                         val_writer.flush()
                 else:
-                    sess.run([metrics_update_op], feed_dict=feed_dict)
+                    _, *detection_values = sess.run([metrics_update_op] + detection_fetches, feed_dict=feed_dict)
+
+                if detection_metrics:
+                    executor.update_detection_metrics(detection_metrics, config, *detection_values)
 
             metrics_values = sess.run(list(metrics_ops_dict.values()))
             metrics_feed_dict = {
@@ -339,11 +357,16 @@ def start_training(config):
             )
             if rank == 0:
                 val_writer.add_summary(metrics_summary, step + 1)
+                if detection_metrics:
+                    _, detection_metrics_summary = executor.detection_metrics_summary(detection_metrics)
+                    val_writer.add_summary(detection_metrics_summary, step + 1)
                 val_writer.flush()
 
         if rank == 0:
             progbar.update(step + 1)
     # training loop end.
+    # close the session first, the "tf_data" input may be reading the datasets.
+    sess.close()
     train_dataset.close()
     validation_dataset.close()
     if use_train_validation_saving:
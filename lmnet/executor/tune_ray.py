@@ -25,6 +25,7 @@ from easydict import EasyDict
 import ray
 from lmnet.datasets.base import ObjectDetectionBase
 from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.shards import shard_dataset_class
 from lmnet.datasets.tfds import TFDSClassification, TFDSObjectDetection
 from lmnet.utils import config as config_util
 from lmnet.utils import executor
@@ -143,18 +144,24 @@ def setup_dataset(config, subset, rank):
 
     # If there is a settings for TFDS, TFDS dataset class will be used.
     tfds_kwargs = dataset_kwargs.pop("tfds_kwargs", {})
+    prefetch_kwargs = dataset_kwargs.pop("prefetch_kwargs", {})
     if tfds_kwargs:
         if issubclass(dataset_class, ObjectDetectionBase):
             dataset_class = TFDSObjectDetection
         else:
             dataset_class = TFDSClassification
 
-    dataset = dataset_class(subset=subset, **dataset_kwargs, **tfds_kwargs)
+    # If there is a settings for packed shards, shard dataset class will be used.
+    shard_kwargs = dataset_kwargs.pop("shard_kwargs", {})
+    if shard_kwargs:
+        dataset_class = shard_dataset_class(dataset_class)
+
+    dataset = dataset_class(subset=subset, **dataset_kwargs, **tfds_kwargs, **shard_kwargs)
 
     # TODO (Neil): Enable both train and validation
     # For some reasons processes are not terminated cleanly, enable prefetch ONLY for the train dataset.
     enable_prefetch = dataset_kwargs.pop("enable_prefetch", False) if subset == 'train' else False
-    return DatasetIterator(dataset, seed=rank, enable_prefetch=enable_prefetch)
+    return DatasetIterator(dataset, seed=rank, enable_prefetch=enable_prefetch, prefetch_kwargs=prefetch_kwargs)
 
 
 class TrainTunable(Trainable):
@@ -194,17 +201,22 @@ class TrainTunable(Trainable):
 
         self.global_step = tf.Variable(0, name="global_step", trainable=False)
         self.is_training_placeholder = tf.compat.v1.placeholder(tf.bool, name="is_training_placeholder")
-        self.images_placeholder, self.labels_placeholder = model.placeholders()
+        images_placeholder, labels_placeholder = model.placeholders()
+
+        datasets = {"train": self.train_dataset, "validation": self.validation_dataset}
+        input_mode = self.lm_config.DATASET.get("INPUT_MODE", "feed_dict")
+        self.input_pipeline = executor.InputPipeline(datasets, images_placeholder, labels_placeholder, input_mode)
+        images, labels = self.input_pipeline.images, self.input_pipeline.labels
 
-        output = model.inference(self.images_placeholder, self.is_training_placeholder)
+        output = model.inference(images, self.is_training_placeholder)
         if model_class.__module__.startswith("lmnet.networks.object_detection"):
-            loss = model.loss(output, self.labels_placeholder, self.is_training_placeholder)
+            loss = model.loss(output, labels, self.is_training_placeholder)
         else:
-            loss = model.loss(output, self.labels_placeholder)
+            loss = model.loss(output, labels)
         opt = model.optimizer(self.global_step)
 
         train_op = model.train(loss, opt, self.global_step)
-        metrics_ops_dict, metrics_update_op = model.metrics(output, self.labels_placeholder)
+        metrics_ops_dict, metrics_update_op = model.metrics(output, labels)
 
         self.train_op = train_op
         self.metrics_ops_dict = metrics_ops_dict
@@ -217,6 +229,7 @@ class TrainTunable(Trainable):
             gpu_options=tf.GPUOptions(allow_growth=True))
         self.sess = tf.Session(config=session_config)
         self.sess.run([init_op, self.reset_metrics_op])
+        self.input_pipeline.init(self.sess)
         self.iterations = 0
         self.saver = tf.compat.v1.train.Saver()
 
@@ -224,25 +237,14 @@ class TrainTunable(Trainable):
         step_per_epoch = int(self.train_dataset.num_per_epoch / self.lm_config.BATCH_SIZE)
 
         for _ in range(step_per_epoch):
-            images, labels = self.train_dataset.feed()
-
-            feed_dict = {
-                self.is_training_placeholder: True,
-                self.images_placeholder: images,
-                self.labels_placeholder: labels,
-            }
+            feed_dict = self.input_pipeline.feed_dict("train", {self.is_training_placeholder: True})
 
             self.sess.run([self.train_op], feed_dict=feed_dict)
 
         self.sess.run(self.reset_metrics_op)
         test_step_size = int(math.ceil(self.validation_dataset.num_per_epoch / self.lm_config.BATCH_SIZE))
         for _ in range(test_step_size):
-            images, labels = self.validation_dataset.feed()
-            feed_dict = {
-                self.is_training_placeholder: False,
-                self.images_placeholder: images,
-                self.labels_placeholder: labels,
-            }
+            feed_dict = self.input_pipeline.feed_dict("validation", {self.is_training_placeholder: False})
 
             self.sess.run([self.metrics_update_op], feed_dict=feed_dict)
 
@@ -25,6 +25,85 @@ from lmnet import data_processor, pre_processor
 from lmnet.utils.box import fill_dummy_boxes, crop_boxes, iou
 
 
+def _batch_random_uniform(min_value, max_value, batch_size):
+    """Per sample random values which broadcast to images of shape [batch_size, height, width, channel]."""
+    return np.random.uniform(min_value, max_value, size=(batch_size, 1, 1, 1))
+
+
+def _batch_grayscale(images):
+    """Vectorized `PIL.Image.convert("L")`. images shape is [batch_size, height, width, 3] and dtype is uint8."""
+    images = images.astype(np.uint32)
+    gray = (images[..., 0] * 19595 + images[..., 1] * 38470 + images[..., 2] * 7471 + 0x8000) >> 16
+    return gray.astype(np.uint8)
+
+
+def _batch_blend(degenerate, images, factors):
+    """Vectorized `PIL.Image.blend` used by `PIL.ImageEnhance`, the result is truncated into uint8 as PIL."""
+    degenerate = np.float32(degenerate)
+    blended = degenerate + np.float32(factors) * (images.astype(np.float32) - degenerate)
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+
+def _batch_rgb_to_hsv(images):
+    """Vectorized `PIL.Image.convert("HSV")`. images shape is [batch_size, height, width, 3] and dtype is uint8."""
+    # single precision as PIL.
+    images = images.astype(np.float32)
+    r, g, b = images[..., 0], images[..., 1], images[..., 2]
+    maxc = images.max(axis=-1)
+    minc = images.min(axis=-1)
+    chroma = maxc - minc
+    is_gray = chroma == 0
+    safe_chroma = np.where(is_gray, np.float32(1), chroma)
+
+    rc = (maxc - r) / safe_chroma
+    gc = (maxc - g) / safe_chroma
+    bc = (maxc - b) / safe_chroma
+    rc, gc, bc = rc.astype(np.float64), gc.astype(np.float64), bc.astype(np.float64)
+    h = np.where(r == maxc, (bc - gc).astype(np.float32), np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.fmod(h.astype(np.float32).astype(np.float64) / 6.0 + 1.0, 1.0).astype(np.float32)
+    s = chroma / np.where(maxc == 0, np.float32(1), maxc)
+
+    h = np.where(is_gray, 0, np.clip(np.trunc(h.astype(np.float64) * 255.0), 0, 255))
+    s = np.where(is_gray, 0, np.clip(np.trunc(s.astype(np.float64) * 255.0), 0, 255))
+    return np.stack([h, s, maxc], axis=-1).astype(np.uint8)
+
+
+def _batch_hsv_to_rgb(hsv):
+    """Vectorized `PIL.Image.convert("RGB")` from HSV mode. hsv dtype is uint8."""
+    hsv = hsv.astype(np.float64)
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    i = np.floor(h * 6.0 / 255.0)
+    f = (h * 6.0 / 255.0 - i).astype(np.float32).astype(np.float64)
+    fs = (s / 255.0).astype(np.float32).astype(np.float64)
+    # C round(), half away from zero.
+    p = np.clip(np.floor(v * (1.0 - fs) + 0.5), 0, 255)
+    q = np.clip(np.floor(v * (1.0 - fs * f) + 0.5), 0, 255)
+    t = np.clip(np.floor(v * (1.0 - fs * (1.0 - f)) + 0.5), 0, 255)
+
+    i = i.astype(np.int64) % 6
+    choices = [
+        np.stack([v, t, p], axis=-1),
+        np.stack([q, v, p], axis=-1),
+        np.stack([p, v, t], axis=-1),
+        np.stack([p, q, v], axis=-1),
+        np.stack([t, p, v], axis=-1),
+        np.stack([v, p, q], axis=-1),
+    ]
+    rgb = np.choose(i[..., np.newaxis], choices)
+    rgb = np.where((s == 0)[..., np.newaxis], v[..., np.newaxis], rgb)
+    return rgb.astype(np.uint8)
+
+
+def _batch_rectangle_masks(image_shape, x1, y1, w, h):
+    """Boolean masks of shape [batch_size, height, width] which are True in each sample's rectangle."""
+    height, width = image_shape
+    ys = np.arange(height)[np.newaxis, :, np.newaxis]
+    xs = np.arange(width)[np.newaxis, np.newaxis, :]
+    x1, y1 = x1[:, np.newaxis, np.newaxis], y1[:, np.newaxis, np.newaxis]
+    w, h = w[:, np.newaxis, np.newaxis], h[:, np.newaxis, np.newaxis]
+    return (ys >= y1) & (ys < y1 + h) & (xs >= x1) & (xs < x1 + w)
+
+
 class Blur(data_processor.Processor):
     """Gaussian blur filter.
 
@@ -74,6 +153,8 @@ class Brightness(data_processor.Processor):
             A factor of 1.0 gives the original image.
     """
 
+    supports_batch = True
+
     def __init__(self, value=(0.75, 1.25)):
 
         if type(value) in [int, float]:
@@ -102,6 +183,12 @@ class Brightness(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def process_batch(self, image, **kwargs):
+        factors = _batch_random_uniform(self.min_value, self.max_value, len(image))
+        image = _batch_blend(0, np.uint8(image), factors)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Color(data_processor.Processor):
     """Adjust image color.
@@ -114,6 +201,8 @@ class Color(data_processor.Processor):
             A factor of 1.0 gives the original image.
     """
 
+    supports_batch = True
+
     def __init__(self, value=(0.75, 1.25)):
 
         if type(value) in [int, float]:
@@ -142,6 +231,14 @@ class Color(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def process_batch(self, image, **kwargs):
+        image = np.uint8(image)
+        factors = _batch_random_uniform(self.min_value, self.max_value, len(image))
+        gray = _batch_grayscale(image)[..., np.newaxis].astype(np.float64)
+        image = _batch_blend(gray, image, factors)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Contrast(data_processor.Processor):
     """Adjust image contrast.
@@ -154,6 +251,8 @@ class Contrast(data_processor.Processor):
             A factor of 1.0 gives the original image.
     """
 
+    supports_batch = True
+
     def __init__(self, value=(0.75, 1.25)):
 
         if type(value) in [int, float]:
@@ -182,6 +281,14 @@ class Contrast(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def process_batch(self, image, **kwargs):
+        image = np.uint8(image)
+        factors = _batch_random_uniform(self.min_value, self.max_value, len(image))
+        mean = np.floor(_batch_grayscale(image).mean(axis=(1, 2)) + 0.5).reshape([-1, 1, 1, 1])
+        image = _batch_blend(mean, image, factors)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Crop(data_processor.Processor):
     """Crop image.
@@ -274,6 +381,8 @@ class FlipLeftRight(data_processor.Processor):
         probability (number): Probability for flipping.
     """
 
+    supports_batch = True
+
     def __init__(self, probability=0.5):
         self.probability = probability
 
@@ -293,6 +402,22 @@ class FlipLeftRight(data_processor.Processor):
 
         return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
 
+    def process_batch(self, image, mask=None, gt_boxes=None, **kwargs):
+        flags = np.random.random(len(image)) > self.probability
+
+        image = np.where(flags.reshape([-1, 1, 1, 1]), image[:, :, ::-1, :], image)
+        if mask is not None:
+            if np.ndim(mask) not in (3, 4):
+                raise RuntimeError('Number of dims in mask should be 2 or 3 but get {}.'.format(np.ndim(mask) - 1))
+            mask = np.where(flags.reshape([-1] + [1] * (np.ndim(mask) - 1)), mask[:, :, ::-1, ...], mask)
+        if gt_boxes is not None and gt_boxes.size > 0:
+            width = image.shape[2]
+            gt_boxes = gt_boxes.copy()
+            flipped_x = width - gt_boxes[:, :, 0] - gt_boxes[:, :, 2]
+            gt_boxes[:, :, 0] = np.where(flags[:, np.newaxis], flipped_x, gt_boxes[:, :, 0])
+
+        return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
+
 
 def _flip_top_bottom_boundingbox(img, boxes):
     """Flip top bottom only bounding box.
@@ -315,6 +440,8 @@ class FlipTopBottom(data_processor.Processor):
         probability (number): Probability for flipping.
     """
 
+    supports_batch = True
+
     def __init__(self, probability=0.5):
         self.probability = probability
 
@@ -343,6 +470,22 @@ class FlipTopBottom(data_processor.Processor):
 
         return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
 
+    def process_batch(self, image, mask=None, gt_boxes=None, **kwargs):
+        flags = np.random.random(len(image)) > self.probability
+
+        image = np.where(flags.reshape([-1, 1, 1, 1]), image[:, ::-1, :, :], image)
+        if mask is not None:
+            if np.ndim(mask) not in (3, 4):
+                raise RuntimeError('Number of dims in mask should be 2 or 3 but get {}.'.format(np.ndim(mask) - 1))
+            mask = np.where(flags.reshape([-1] + [1] * (np.ndim(mask) - 1)), mask[:, ::-1, ...], mask)
+        if gt_boxes is not None and gt_boxes.size > 0:
+            height = image.shape[1]
+            gt_boxes = gt_boxes.copy()
+            flipped_y = height - gt_boxes[:, :, 1] - gt_boxes[:, :, 3]
+            gt_boxes[:, :, 1] = np.where(flags[:, np.newaxis], flipped_y, gt_boxes[:, :, 1])
+
+        return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
+
 
 class Hue(data_processor.Processor):
     """Change image hue.
@@ -351,6 +494,8 @@ class Hue(data_processor.Processor):
         value (int | list | tuple): Assume the value in -255, 255. When the value is 0, nothing to do.
     """
 
+    supports_batch = True
+
     def __init__(self, value=(-10, 10)):
 
         if type(value) in [int, float]:
@@ -381,6 +526,17 @@ class Hue(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def process_batch(self, image, **kwargs):
+        values = np.random.uniform(self.min_value, self.max_value, size=(len(image), 1, 1))
+
+        hsv = _batch_rgb_to_hsv(np.uint8(image))
+        # hue wraps around as uint8.
+        hsv[..., 0] = np.trunc(hsv[..., 0] + values).astype(np.int64) % 256
+
+        image = _batch_hsv_to_rgb(hsv)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Pad(data_processor.Processor):
     """Add padding to images.
@@ -450,6 +606,8 @@ class RandomPatchCut(data_processor.Processor):
         square (bool): force square aspect ratio for patch shape
     """
 
+    supports_batch = True
+
     def __init__(self, num_patch=1, max_size=10, square=True):
         self.num_patch = int(num_patch)
         self.max_size = max_size / 100
@@ -483,6 +641,26 @@ class RandomPatchCut(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def process_batch(self, image, **kwargs):
+        batch_size, image_h, image_w, _ = image.shape
+        patch_max = int(min(image_w * self.max_size, image_h * self.max_size))
+        patch_min = (patch_max + 9) // 10
+
+        masks = np.zeros((batch_size, image_h, image_w), dtype=np.bool_)
+        for _ in range(self.num_patch):
+            patch_x = np.random.randint(0, image_w - patch_max, size=batch_size)
+            patch_y = np.random.randint(0, image_h - patch_max, size=batch_size)
+            patch_w = np.random.randint(patch_min, patch_max + 1, size=batch_size)
+            if self.square:
+                patch_h = patch_w
+            else:
+                patch_h = np.random.randint(patch_min, patch_max + 1, size=batch_size)
+            masks |= _batch_rectangle_masks((image_h, image_w), patch_x, patch_y, patch_w, patch_h)
+
+        image = np.where(masks[..., np.newaxis], 0, image).astype(image.dtype)
+
+        return dict({'image': image}, **kwargs)
+
 
 class RandomErasing(data_processor.Processor):
     """
@@ -498,6 +676,8 @@ class RandomErasing(data_processor.Processor):
         mean (list): erasing value if you use "mean" mode (mean ImageNet pixel value)
     """
 
+    supports_batch = True
+
     def __init__(self, probability=0.5, sl=0.02, sh=0.4, r1=0.3, content_type="mean", mean=[125, 122, 114]):
         self.hyper_params = {'probability': probability, 'sl': sl,
                              'sh': sh, 'r1': r1, 'content_type': content_type, 'mean': mean}
@@ -518,6 +698,42 @@ class RandomErasing(data_processor.Processor):
 
         return dict({'image': processed_image}, **kwargs)
 
+    def process_batch(self, image, **kwargs):
+        """Random Erasing in entire images.
+
+        All 100 trials of `_random_erasing_in_box` are drawn at once and the first valid one is used for each sample.
+        """
+        params = self.hyper_params
+        batch_size, image_h, image_w, _ = image.shape
+        num_trials = 100
+
+        target_area = np.random.uniform(params['sl'], params['sh'], size=(batch_size, num_trials)) * image_h * image_w
+        aspect_ratio = np.random.uniform(params['r1'], 1 / params['r1'], size=(batch_size, num_trials))
+        h = np.round(np.sqrt(target_area * aspect_ratio)).astype(np.int64)
+        w = np.round(np.sqrt(target_area / aspect_ratio)).astype(np.int64)
+
+        valid = (h < image_h) & (w < image_w)
+        first = valid.argmax(axis=1)
+        h = h[np.arange(batch_size), first]
+        w = w[np.arange(batch_size), first]
+        erased = valid.any(axis=1) & (np.random.uniform(0, 1, size=batch_size) <= params['probability'])
+
+        # same as random.randint(0, image_w - w) for each sample.
+        x1 = np.floor(np.random.uniform(0, 1, size=batch_size) * (image_w - w + 1)).astype(np.int64)
+        y1 = np.floor(np.random.uniform(0, 1, size=batch_size) * (image_h - h + 1)).astype(np.int64)
+
+        masks = _batch_rectangle_masks((image_h, image_w), x1, y1, w, h) & erased[:, np.newaxis, np.newaxis]
+        if params['content_type'] == "mean":
+            content = np.array(params['mean'])
+        elif params['content_type'] == "random":
+            content = np.random.randint(255, size=image.shape)
+        else:
+            return dict({'image': image}, **kwargs)
+
+        processed_image = np.where(masks[..., np.newaxis], content, image).astype(image.dtype)
+
+        return dict({'image': processed_image}, **kwargs)
+
 
 class RandomErasingForDetection(data_processor.Processor):
     """
@@ -41,6 +41,24 @@ class Sequence:
             kwargs = processor(**kwargs)
         return kwargs
 
+    @property
+    def supports_batch(self):
+        """True when every processor has the vectorized batch path."""
+        return all(getattr(processor, "supports_batch", False) for processor in self.processors)
+
+    def process_batch(self, **kwargs):
+        """Call processors for a batch of data. Each argument has the batch dimension at first.
+
+        Dispatch to the vectorized batch path of processors when all of them support it,
+        otherwise the processors are called for each sample.
+        """
+        if not self.supports_batch:
+            return process_per_sample(self, **kwargs)
+
+        for processor in self.processors:
+            kwargs = processor.process_batch(**kwargs)
+        return kwargs
+
     def __repr__(self):
         return pprint.saferepr(self.processors)
 
@@ -67,6 +85,9 @@ class Sequence:
 
 class Processor(metaclass=ABCMeta):
 
+    # processors which override `process_batch` with vectorized implementation set True.
+    supports_batch = False
+
     @abstractmethod
     def __call__(self, **kwargs):
         """Call processor method for each a element of data.
@@ -75,10 +96,32 @@ class Processor(metaclass=ABCMeta):
         """
         return kwargs
 
+    def process_batch(self, **kwargs):
+        """Call processor method for a batch of data. Each argument has the batch dimension at first.
+
+        e.g. image shape is [batch_size, height, width, channel].
+        Return batch of image and labels etc.
+        """
+        return process_per_sample(self, **kwargs)
+
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, self.__dict__)
 
 
+def process_per_sample(processor, **kwargs):
+    """Call `processor` for each sample of batched arguments and stack the results."""
+    batch_size = len(kwargs["image"])
+    results = []
+    for i in range(batch_size):
+        sample = {key: None if value is None else value[i] for key, value in kwargs.items()}
+        results.append(processor(**sample))
+
+    return {
+        key: None if results[0][key] is None else np.stack([result[key] for result in results])
+        for key in results[0]
+    }
+
+
 # TODO(wakisaka): move to somewhere.
 def binarize(labels, num_classes):
     """Return numpy array binarized labels."""
@@ -19,6 +19,8 @@ from abc import ABCMeta, abstractmethod
 import numpy as np
 
 from lmnet import environment
+from lmnet.utils.image import load_image
+from lmnet.utils.image_cache import ImageCache
 
 
 class Base(metaclass=ABCMeta):
@@ -32,6 +34,7 @@ class Base(metaclass=ABCMeta):
             pre_processor=None,
             data_format='NHWC',
             seed=None,
+            image_cache_kwargs=None,
             **kwargs
     ):
         assert subset in self.available_subsets, self.available_subsets
@@ -41,6 +44,14 @@ class Base(metaclass=ABCMeta):
         self.pre_processor = pre_processor
         self.data_format = data_format
         self.seed = seed or 0
+        # opt-in decoded image cache, see `lmnet.utils.image_cache.ImageCache` for the options.
+        self.image_cache = ImageCache(**image_cache_kwargs) if image_cache_kwargs else None
+
+    def _load_image(self, filename, convert_rgb=True):
+        """Returns numpy array of an image, through the decoded image cache when it is enabled."""
+        if self.image_cache is None:
+            return load_image(filename, convert_rgb=convert_rgb)
+        return self.image_cache.load_image(filename, convert_rgb=convert_rgb)
 
     @property
     def data_dir(self):
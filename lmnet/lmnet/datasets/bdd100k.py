@@ -7,7 +7,6 @@ import os
 import numpy as np
 
 from lmnet.datasets.base import ObjectDetectionBase, SegmentationBase
-from lmnet.utils.image import load_image
 
 
 class BDD100KObjectDetection(ObjectDetectionBase):
@@ -142,7 +141,7 @@ class BDD100KObjectDetection(ObjectDetectionBase):
     def __getitem__(self, i, type=None):
         image_file_path = self.paths[i]
 
-        image = load_image(image_file_path)
+        image = self._load_image(image_file_path)
 
         gt_boxes = self.bboxs[i]
         gt_boxes = np.array(gt_boxes)
@@ -283,8 +282,8 @@ class BDD100KSegmentation(SegmentationBase):
 
     def __getitem__(self, i):
         imgs, labels = self.files_and_annotations()
-        img = load_image(imgs[i])
-        label = load_image(labels[i])
+        img = self._load_image(imgs[i])
+        label = self._load_image(labels[i])
 
         return img, label
 
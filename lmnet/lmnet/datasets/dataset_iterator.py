@@ -13,17 +13,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import functools
+import itertools
 import os
 import queue
 import threading
 import time
-from multiprocessing import Pool
+import traceback
+from collections import deque
+from multiprocessing import Pool, Process, Queue, RawArray
 
 import numpy as np
 import tensorflow as tf
 
+from lmnet.data_augmentor import FlipLeftRight, FlipTopBottom
+from lmnet.data_processor import Sequence
 from lmnet.datasets.base import ObjectDetectionBase, SegmentationBase, KeypointDetectionBase
+from lmnet.datasets.shards import ShardMixin
 from lmnet.datasets.tfds import TFDSMixin
+from lmnet.pre_processor import (
+    DivideBy255,
+    PerImageStandardization,
+    Resize,
+    ResizeWithGtBoxes,
+    ResizeWithJoints,
+    ResizeWithMask,
+)
 
 _dataset = None
 
@@ -37,22 +52,25 @@ def _prefetch_setup(dataset, seed, do_shuffle):
         _dataset._shuffle()
 
 
-def _apply_augmentations(dataset, image, label):
-    augmentor = dataset.augmentor
-    pre_processor = dataset.pre_processor
-
-    sample = {'image': image}
-
+def _label_key(dataset):
+    """Return the key of the label in the sample dict given to the augmentor and the pre-processor."""
     if issubclass(dataset.__class__, SegmentationBase):
-        sample['mask'] = label
+        return 'mask'
     elif issubclass(dataset.__class__, ObjectDetectionBase):
-        sample['gt_boxes'] = label
+        return 'gt_boxes'
     elif issubclass(dataset.__class__, KeypointDetectionBase):
-        sample['joints'] = label
+        return 'joints'
     else:
-        sample['label'] = label
+        return 'label'
+
 
-    if callable(augmentor) and dataset.subset == 'train':
+def _apply_augmentations(dataset, image, label, augment=True):
+    augmentor = dataset.augmentor
+    pre_processor = dataset.pre_processor
+
+    sample = {'image': image, _label_key(dataset): label}
+
+    if augment and callable(augmentor) and dataset.subset == 'train':
         sample = augmentor(**sample)
 
     if callable(pre_processor):
@@ -60,14 +78,10 @@ def _apply_augmentations(dataset, image, label):
 
     image = sample['image']
 
-    if issubclass(dataset.__class__, SegmentationBase):
-        label = sample['mask']
-    elif issubclass(dataset.__class__, ObjectDetectionBase):
-        label = sample['gt_boxes']
-    elif issubclass(dataset.__class__, KeypointDetectionBase):
+    if issubclass(dataset.__class__, KeypointDetectionBase):
         label = sample['heatmap']
     else:
-        label = sample['label']
+        label = sample[_label_key(dataset)]
 
     # FIXME(tokunaga): dataset should not have their own data format
     if dataset.data_format == "NCHW":
@@ -76,6 +90,29 @@ def _apply_augmentations(dataset, image, label):
     return (image, label)
 
 
+def _apply_batch_augmentations(dataset, data_list):
+    """Apply augmentations and pre-processing to a list of samples and return a batch.
+
+    When the augmentor supports the vectorized batch path and all the samples have the same shape,
+    the whole batch is augmented at once and only the pre-processor is applied for each sample.
+    """
+    augmentor = dataset.augmentor
+    images, labels = zip(*data_list)
+
+    use_batch = callable(augmentor) and dataset.subset == 'train' and getattr(augmentor, "supports_batch", False)
+    use_batch = use_batch and len({np.shape(image) for image in images}) == 1
+    use_batch = use_batch and len({np.shape(label) for label in labels}) == 1
+    if not use_batch:
+        return _concat_data([_apply_augmentations(dataset, image, label) for image, label in data_list])
+
+    key = _label_key(dataset)
+    sample = augmentor.process_batch(**{'image': np.stack(images), key: np.stack(labels)})
+    return _concat_data([
+        _apply_augmentations(dataset, image, label, augment=False)
+        for image, label in zip(sample['image'], sample[key])
+    ])
+
+
 def _process_one_data(i):
     image, label = _dataset[i]
     return _apply_augmentations(_dataset, image, label)
@@ -88,6 +125,43 @@ def _concat_data(data_list):
     return (images, labels)
 
 
+def _shared_memory_worker(dataset, seed, do_shuffle, task_queue, done_queue, buffers):
+    """Process tasks and write the results into the shared batch buffers.
+
+    Each task is a tuple of `(slot, position, data_id)`. The processed sample is written to
+    `buffers[slot, position]` and only `(slot, position, error)` is sent back, so the image itself is never pickled.
+    """
+    _prefetch_setup(dataset, seed, do_shuffle)
+    images, labels = [np.frombuffer(raw, dtype=dtype).reshape(shape) for raw, dtype, shape in buffers]
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        slot, position, data_id = task
+        try:
+            image, label = _process_one_data(data_id)
+            images[slot, position] = image
+            labels[slot, position] = label
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        done_queue.put((slot, position, error))
+
+
+class _PrefetchError:
+    """Error of a prefetch thread, which is put into the result queue instead of a batch."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put_error(result_queue, error):
+    """Hand the error to the trainer, `DatasetIterator.__next__` raises it instead of waiting for batches forever."""
+    result_queue.put(_PrefetchError(error))
+
+
 def _xorshift32(r):
     r = r ^ (r << 13 & 0xFFFFFFFF)
     r = r ^ (r >> 17 & 0xFFFFFFFF)
@@ -95,19 +169,39 @@ def _xorshift32(r):
     return r & 0xFFFFFFFF
 
 
+class _ThroughputMeter:
+    """Count the number of prefetched samples to report the prefetch throughput."""
+
+    def __init__(self):
+        self.num_samples = 0
+        self.start_time = time.time()
+
+    def update(self, num_samples):
+        self.num_samples += num_samples
+
+    @property
+    def samples_per_sec(self):
+        elapsed = time.time() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.num_samples / elapsed
+
+
 class _MultiProcessDatasetPrefetchThread(threading.Thread):
-    def __init__(self, dataset, result_queue, seed):
+    def __init__(self, dataset, result_queue, seed, num_workers=8, num_in_flight=8):
         super().__init__()
-        # TODO(tokunaga): the number of processes should be configurable
         self.seed = seed + 1  # seed must not be 0 because using xorshift32.
         self.support_getitem = hasattr(dataset, "__getitem__")
-        self.pool = Pool(processes=8, initializer=_prefetch_setup,
+        self.num_workers = num_workers
+        self.num_in_flight = num_in_flight
+        self.pool = Pool(processes=self.num_workers, initializer=_prefetch_setup,
                          initargs=(dataset, self.seed, not self.support_getitem))
         self.result_queue = result_queue
         self.batch_size = dataset.batch_size
         self.dataset = dataset
         self.data_ids = []
         self.terminate = False
+        self.meter = _ThroughputMeter()
         self.setDaemon(True)
 
     def gen_ids(self):
@@ -137,12 +231,20 @@ class _MultiProcessDatasetPrefetchThread(threading.Thread):
     def refresh_pool(self):
         self.pool.close()
         self.seed += 1
-        self.pool = Pool(processes=8, initializer=_prefetch_setup,
+        self.pool = Pool(processes=self.num_workers, initializer=_prefetch_setup,
                          initargs=(self.dataset, self.seed, not self.support_getitem))
 
+    def stats(self):
+        return {
+            "samples_per_sec": self.meter.samples_per_sec,
+            "queue_size": self.result_queue.qsize(),
+            "queue_capacity": self.result_queue.maxsize,
+        }
+
     def loop_body(self):
-        task_list = self.gen_task(self.dataset.batch_size * 8)
+        task_list = self.gen_task(self.dataset.batch_size * self.num_in_flight)
         fetch_result = self.pool.map(_process_one_data, task_list)
+        self.meter.update(len(fetch_result))
         for fetch_result_chunk in self.chunks(fetch_result, self.batch_size):
             data_batch = _concat_data(fetch_result_chunk)
             put_ok = False
@@ -168,11 +270,212 @@ class _MultiProcessDatasetPrefetchThread(threading.Thread):
                 self.loop_body()
 
                 count += 1
+        except Exception as e:
+            _put_error(self.result_queue, e)
         finally:
             self.pool.close()
             self.pool.join()
 
 
+class _StreamingDatasetPrefetchThread(_MultiProcessDatasetPrefetchThread):
+    """Prefetch batches with a sliding window of `num_in_flight` batches submitted to the pool.
+
+    Each batch is submitted as its own task group, so a batch is put into `result_queue` as soon as its own samples
+    are processed and the freed window slot is refilled immediately. One slow sample only delays its own batch.
+
+    With `ordered=True` batches come out in the order of the `_xorshift32` id stream, so the data is the same as
+    `_SimpleDatasetReader` under the same seed. With `ordered=False` any completed batch is handed out first.
+    """
+
+    def __init__(self, dataset, result_queue, seed, num_workers=8, num_in_flight=8, ordered=True):
+        super().__init__(dataset, result_queue, seed, num_workers=num_workers, num_in_flight=num_in_flight)
+        self.ordered = ordered
+        self.pending = deque()
+
+    def submit(self):
+        task_list = self.gen_task(self.batch_size)
+        self.pending.append(self.pool.map_async(_process_one_data, task_list, chunksize=1))
+
+    def pop_ready(self, timeout=1):
+        """Pop a completed batch task from the window, return None when nothing completes in `timeout`."""
+        if self.ordered:
+            self.pending[0].wait(timeout)
+            if self.pending[0].ready():
+                return self.pending.popleft()
+            return None
+
+        start = time.time()
+        while time.time() - start < timeout:
+            for task in self.pending:
+                if task.ready():
+                    self.pending.remove(task)
+                    return task
+            self.pending[0].wait(0.01)
+        return None
+
+    def run(self):
+        try:
+            while not self.terminate:
+                while len(self.pending) < self.num_in_flight:
+                    self.submit()
+
+                task = self.pop_ready()
+                if task is None:
+                    continue
+
+                data_batch = _concat_data(task.get())
+                self.meter.update(self.batch_size)
+                put_ok = False
+                while not put_ok:
+                    try:
+                        self.result_queue.put(data_batch, 1)
+                        put_ok = True
+                    except queue.Full:
+                        if self.terminate:
+                            break
+        except Exception as e:
+            _put_error(self.result_queue, e)
+        finally:
+            self.pool.close()
+            self.pool.join()
+
+
+class _SharedMemoryPrefetchThread(threading.Thread):
+    """Prefetch batches with worker processes which write into a ring of shared memory batch buffers.
+
+    `num_in_flight` batch buffers are allocated once in shared memory. Each of them is split into `batch_size`
+    tasks which are consumed by `num_workers` processes as soon as they are free, so there is no barrier
+    between rounds. Batches are put into `result_queue` in the same order as the data ids are generated.
+    """
+
+    def __init__(self, dataset, result_queue, seed, num_workers=8, num_in_flight=8):
+        super().__init__()
+        self.seed = seed + 1  # seed must not be 0 because using xorshift32.
+        self.support_getitem = hasattr(dataset, "__getitem__")
+        self.result_queue = result_queue
+        self.batch_size = dataset.batch_size
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.num_in_flight = num_in_flight
+        self.data_ids = []
+        self.terminate = False
+        self.meter = _ThroughputMeter()
+        self.setDaemon(True)
+
+        self.buffers = self._allocate_buffers()
+        self.images, self.labels = [
+            np.frombuffer(raw, dtype=dtype).reshape(shape) for raw, dtype, shape in self.buffers
+        ]
+
+        self.task_queue = Queue()
+        self.done_queue = Queue()
+        self.workers = [
+            Process(
+                target=_shared_memory_worker,
+                args=(dataset, self.seed + i, not self.support_getitem, self.task_queue, self.done_queue, self.buffers),
+                daemon=True,
+            )
+            for i in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def _allocate_buffers(self):
+        """Allocate `num_in_flight` batch buffers for images and labels in shared memory.
+
+        Shapes and dtypes are taken from the first sample after augmentation and pre-processing.
+        """
+        image, label = _apply_augmentations(self.dataset, *self.dataset[0])
+        buffers = []
+        for sample in (np.asarray(image), np.asarray(label)):
+            shape = (self.num_in_flight, self.batch_size) + sample.shape
+            raw = RawArray("b", int(np.prod(shape)) * sample.dtype.itemsize)
+            buffers.append((raw, sample.dtype, shape))
+        return buffers
+
+    def gen_ids(self):
+        if hasattr(self.dataset, "__len__"):
+            length = len(self.dataset)
+        else:
+            length = self.dataset.num_per_epoch
+        return list(range(0, length))
+
+    def gen_task(self, task_batch_size):
+        task_list = []
+        for i in range(0, task_batch_size):
+            if len(self.data_ids) == 0:
+                self.data_ids = self.gen_ids()
+                self.seed = _xorshift32(self.seed)
+                random_state = np.random.RandomState(self.seed)
+                random_state.shuffle(self.data_ids)
+            data_id = self.data_ids.pop()
+            task_list.append(data_id)
+        return task_list
+
+    def dispatch(self, slot):
+        for position, data_id in enumerate(self.gen_task(self.batch_size)):
+            self.task_queue.put((slot, position, data_id))
+
+    def stats(self):
+        return {
+            "samples_per_sec": self.meter.samples_per_sec,
+            "queue_size": self.result_queue.qsize(),
+            "queue_capacity": self.result_queue.maxsize,
+        }
+
+    def run(self):
+        remaining = [0] * self.num_in_flight
+        pending = deque()
+        for slot in range(self.num_in_flight):
+            self.dispatch(slot)
+            remaining[slot] = self.batch_size
+            pending.append(slot)
+
+        try:
+            while not self.terminate:
+                oldest = pending[0]
+                while remaining[oldest] > 0:
+                    try:
+                        slot, _, error = self.done_queue.get(timeout=1)
+                    except queue.Empty:
+                        if self.terminate:
+                            return
+                        continue
+                    if error is not None:
+                        raise RuntimeError("prefetch worker failed.\n{}".format(error))
+                    remaining[slot] -= 1
+
+                pending.popleft()
+                # copy out of the ring, the slot is refilled right after this.
+                data_batch = (self.images[oldest].copy(), self.labels[oldest].copy())
+                self.meter.update(self.batch_size)
+
+                self.dispatch(oldest)
+                remaining[oldest] = self.batch_size
+                pending.append(oldest)
+
+                put_ok = False
+                while not put_ok:
+                    try:
+                        self.result_queue.put(data_batch, 1)
+                        put_ok = True
+                    except queue.Full:
+                        if self.terminate:
+                            break
+        except Exception as e:
+            _put_error(self.result_queue, e)
+        finally:
+            self.close()
+
+    def close(self):
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+
+
 class _SimpleDatasetReader:
 
     def __init__(self, dataset, seed, shuffle=True):
@@ -196,12 +499,36 @@ class _SimpleDatasetReader:
 
     def read(self):
         """Return batch size data."""
-        result = []
-        for i in self._gen_ids(self.dataset.batch_size):
-            image, label = self.dataset[i]
-            image, label = _apply_augmentations(self.dataset, image, label)
-            result.append((image, label))
-        return _concat_data(result)
+        result = [self.dataset[i] for i in self._gen_ids(self.dataset.batch_size)]
+        return _apply_batch_augmentations(self.dataset, result)
+
+
+class _ShardReader:
+    """Read batches from the streaming `iterate` of shard datasets, each shard is read with one sequential read.
+
+    Each epoch is shuffled at the shard and the buffer level with a new seed of the `_xorshift32` stream.
+    """
+
+    def __init__(self, dataset, seed, shuffle=True):
+        self.dataset = dataset
+        self.seed = seed + 1  # seed must not be 0 because using xorshift32.
+        self.shuffle = shuffle
+        self.samples = self._gen_samples()
+
+    def _gen_samples(self):
+        """Generate samples endlessly, epoch by epoch."""
+        while True:
+            seed = None
+            if self.shuffle:
+                self.seed = _xorshift32(self.seed)
+                seed = self.seed
+            for sample in self.dataset.iterate(seed=seed):
+                yield sample
+
+    def read(self):
+        """Return batch size data."""
+        result = list(itertools.islice(self.samples, self.dataset.batch_size))
+        return _apply_batch_augmentations(self.dataset, result)
 
 
 class _TFDSReader:
@@ -221,33 +548,230 @@ class _TFDSReader:
 
     def read(self):
         """Return batch size data."""
-        result = []
         batch = self.session.run(self.next_batch)
-        for image, label in zip(batch['image'], batch['label']):
-            image, label = _apply_augmentations(self.dataset, image, label)
-            result.append((image, label))
-        return _concat_data(result)
+        return _apply_batch_augmentations(self.dataset, list(zip(batch['image'], batch['label'])))
+
+
+def _tf_flip(processor, image, label, label_key, axis):
+    """Graph version of `FlipLeftRight` (axis=1) and `FlipTopBottom` (axis=0)."""
+    def flip():
+        flipped_label = label
+        if label_key == 'mask':
+            flipped_label = tf.reverse(label, [axis])
+        elif label_key == 'gt_boxes':
+            # x and w for the width (axis=1), y and h for the height (axis=0) of [x, y, w, h, class_id].
+            coord = 1 - axis
+            size = tf.cast(tf.shape(image)[axis], label.dtype)
+            flipped = size - label[:, coord] - label[:, coord + 2]
+            flipped_label = tf.concat([label[:, :coord], flipped[:, tf.newaxis], label[:, coord + 1:]], axis=1)
+        return tf.reverse(image, [axis]), flipped_label
+
+    return tf.cond(tf.random.uniform([]) > processor.probability, flip, lambda: (image, label))
+
+
+def _tf_divide_by_255(processor, image, label, label_key):
+    """Graph version of `DivideBy255`."""
+    return tf.cast(image, tf.float32) / 255.0, label
+
+
+def _tf_per_image_standardization(processor, image, label, label_key):
+    """Graph version of `PerImageStandardization`."""
+    return tf.image.per_image_standardization(image), label
+
+
+# processors which have equivalent tf ops, the others are run by `tf.py_function`.
+_GRAPH_PROCESSORS = {
+    FlipLeftRight: functools.partial(_tf_flip, axis=1),
+    FlipTopBottom: functools.partial(_tf_flip, axis=0),
+    DivideBy255: _tf_divide_by_255,
+    PerImageStandardization: _tf_per_image_standardization,
+}
+
+
+# processors whose output image has a fixed size whatever the input size is.
+_FIXED_SIZE_PROCESSORS = (Resize, ResizeWithGtBoxes, ResizeWithJoints, ResizeWithMask)
+
+
+def _flatten_processors(processor):
+    """Return the list of processors with nested `Sequence` expanded."""
+    if not callable(processor):
+        return []
+    if isinstance(processor, Sequence):
+        return [child for p in processor.processors for child in _flatten_processors(p)]
+    return [processor]
+
+
+class _GraphAugmentation:
+    """Apply the augmentor and the pre-processor of a TFDS dataset to a record, as a function of `tf.data.Dataset.map`.
+
+    Consecutive processors in `_GRAPH_PROCESSORS` become tf ops, and each run of the other processors is wrapped
+    in one `tf.py_function`. The output dtypes and shapes of the `tf.py_function` are taken by applying
+    the processors to a sample record. Processors like crops change the image size per record, so the sizes
+    are only kept when the run ends with a resize to a fixed size. Otherwise the following tf ops would use
+    the size of the sample record.
+    """
+
+    def __init__(self, dataset, image, label):
+        self.label_key = _label_key(dataset)
+        self.data_format = dataset.data_format
+
+        processors = _flatten_processors(dataset.pre_processor)
+        if dataset.subset == 'train':
+            processors = _flatten_processors(dataset.augmentor) + processors
+
+        self.groups = []
+        sample = {'image': image, self.label_key: label}
+        for native, group in itertools.groupby(processors, key=lambda p: type(p) in _GRAPH_PROCESSORS):
+            group = list(group)
+            for processor in group:
+                sample = processor(**sample)
+            if native:
+                self.groups.append((group, None))
+            else:
+                image_output, label_output = np.asarray(sample['image']), np.asarray(sample[self.label_key])
+                self.groups.append((group, [
+                    (image_output.dtype, self._image_shape(group, image_output.shape)),
+                    (label_output.dtype, self._label_shape(group, label_output.shape)),
+                ]))
+
+    @staticmethod
+    def _image_shape(processors, shape):
+        """Return the static shape of the image, only the channels are known unless it is resized at last."""
+        if isinstance(processors[-1], _FIXED_SIZE_PROCESSORS):
+            return shape
+        return [None] * (len(shape) - 1) + list(shape[-1:])
+
+    def _label_shape(self, processors, shape):
+        """Return the static shape of the label. The size of masks and the number of boxes may change."""
+        if isinstance(processors[-1], _FIXED_SIZE_PROCESSORS):
+            return shape
+        if self.label_key == 'mask':
+            return [None] * len(shape)
+        if self.label_key == 'gt_boxes':
+            return [None] + list(shape[1:])
+        return shape
+
+    def _py_function(self, processors, outputs):
+        def process(image, label):
+            sample = {'image': np.array(image.numpy()), self.label_key: np.array(label.numpy())}
+            for processor in processors:
+                sample = processor(**sample)
+            return [np.asarray(sample[key], dtype=dtype)
+                    for key, (dtype, _) in zip(['image', self.label_key], outputs)]
+        return process
+
+    def __call__(self, record):
+        image, label = record['image'], record['label']
+
+        for processors, outputs in self.groups:
+            if outputs is None:
+                for processor in processors:
+                    image, label = _GRAPH_PROCESSORS[type(processor)](processor, image, label, self.label_key)
+                continue
+
+            image, label = tf.py_function(
+                self._py_function(processors, outputs), [image, label], [tf.as_dtype(dtype) for dtype, _ in outputs]
+            )
+            image.set_shape(outputs[0][1])
+            label.set_shape(outputs[1][1])
+
+        # FIXME(tokunaga): dataset should not have their own data format
+        if self.data_format == "NCHW":
+            image = tf.transpose(image, [2, 0, 1])
+
+        return image, label
+
+
+class _TFDSParallelReader:
+    """Read TFDS datasets with the augmentor and the pre-processor run in `map` of tf.data.
+
+    Samples are augmented in parallel by `num_parallel_calls` threads and batches are prefetched by tf.data,
+    so `read` only runs the session. Processors without tf ops still hold the GIL in `tf.py_function`.
+    """
+
+    def __init__(self, dataset, num_parallel_calls=tf.data.experimental.AUTOTUNE):
+        self.dataset = dataset
+        self.session = tf.Session()
+
+        record = self.session.run(tf.data.make_one_shot_iterator(dataset.tf_dataset.take(1)).get_next())
+        augmentation = _GraphAugmentation(dataset, record['image'], record['label'])
+
+        tf_dataset = dataset.tf_dataset.shuffle(1024) \
+                                       .repeat() \
+                                       .map(augmentation, num_parallel_calls=num_parallel_calls) \
+                                       .batch(dataset.batch_size) \
+                                       .prefetch(tf.data.experimental.AUTOTUNE)
+
+        iterator = tf.data.make_initializable_iterator(tf_dataset)
+
+        self.session.run(iterator.initializer)
+        self.next_batch = iterator.get_next()
+
+    def read(self):
+        """Return batch size data."""
+        return self.session.run(self.next_batch)
 
 
 class DatasetIterator:
 
     available_subsets = ["train", "train_validation_saving", "validation"]
 
-    """docstring for DatasetIterator."""
-    def __init__(self, dataset, enable_prefetch=False, seed=0):
+    """docstring for DatasetIterator.
+
+    Args:
+        dataset: dataset instance.
+        enable_prefetch (bool): use multi process prefetch or not.
+        seed (int): seed of the data id stream.
+        prefetch_kwargs (dict): options of the prefetch, they come from `config.DATASET.PREFETCH_KWARGS`.
+            engine: "pool" (default), "streaming" or "shared_memory".
+                For TFDS datasets, only "tf_data" is available, which runs the augmentor and the pre-processor
+                in the tf.data pipeline. Otherwise TFDS datasets are augmented in the main thread.
+            num_workers: the number of worker processes. Default is 8.
+            queue_size: the max number of batches waiting for the trainer. Default is 200.
+            num_in_flight: the number of batches being processed by the workers. Default is 8.
+            ordered: only for "streaming" engine. If False, batches are handed out in completion order.
+                Default is True.
+            num_parallel_calls: only for "tf_data" engine. The number of samples augmented in parallel.
+                Default is `tf.data.experimental.AUTOTUNE`.
+    """
+
+    available_prefetch_engines = {
+        "pool": _MultiProcessDatasetPrefetchThread,
+        "streaming": _StreamingDatasetPrefetchThread,
+        "shared_memory": _SharedMemoryPrefetchThread,
+    }
+
+    def __init__(self, dataset, enable_prefetch=False, seed=0, prefetch_kwargs=None):
         self.dataset = dataset
         self.enable_prefetch = enable_prefetch
         self.seed = seed
+        self.prefetch_kwargs = dict(prefetch_kwargs or {})
 
         if issubclass(dataset.__class__, TFDSMixin):
+            prefetch_kwargs = {key.lower(): val for key, val in self.prefetch_kwargs.items()}
+            if self.enable_prefetch and prefetch_kwargs.get("engine") == "tf_data":
+                num_parallel_calls = prefetch_kwargs.get("num_parallel_calls", tf.data.experimental.AUTOTUNE)
+                self.reader = _TFDSParallelReader(self.dataset, num_parallel_calls=num_parallel_calls)
+                print("ENABLE tf.data prefetch")
+            else:
+                self.reader = _TFDSReader(self.dataset)
+            # batches are read from the tf.data pipeline, not from the prefetch thread.
             self.enable_prefetch = False
-            self.reader = _TFDSReader(self.dataset)
         else:
             if self.enable_prefetch:
-                self.prefetch_result_queue = queue.Queue(maxsize=200)
-                self.prefetcher = _MultiProcessDatasetPrefetchThread(self.dataset, self.prefetch_result_queue, seed)
+                prefetch_kwargs = {key.lower(): val for key, val in self.prefetch_kwargs.items()}
+                engine = prefetch_kwargs.pop("engine", "pool")
+                assert engine in self.available_prefetch_engines, list(self.available_prefetch_engines)
+                queue_size = prefetch_kwargs.pop("queue_size", 200)
+
+                self.prefetch_result_queue = queue.Queue(maxsize=queue_size)
+                PrefetchThread = self.available_prefetch_engines[engine]
+                self.prefetcher = PrefetchThread(self.dataset, self.prefetch_result_queue, seed, **prefetch_kwargs)
                 self.prefetcher.start()
                 print("ENABLE prefetch")
+            elif issubclass(dataset.__class__, ShardMixin):
+                self.reader = _ShardReader(self.dataset, seed)
+                print("DISABLE prefetch, read shards sequentially")
             else:
                 self.reader = _SimpleDatasetReader(self.dataset, seed)
                 print("DISABLE prefetch")
@@ -280,7 +804,12 @@ class DatasetIterator:
 
     def __next__(self):
         if self.enable_prefetch:
-            (images, labels) = self.prefetch_result_queue.get()
+            result = self.prefetch_result_queue.get()
+            if isinstance(result, _PrefetchError):
+                # put it back for the following calls, the thread does not put batches anymore.
+                self.prefetch_result_queue.put(result)
+                raise result.error
+            (images, labels) = result
         else:
             images, labels = self.reader.read()
         return images, labels
@@ -288,6 +817,21 @@ class DatasetIterator:
     def feed(self):
         return self.__next__()
 
+    def as_tf_dataset(self, output_types, output_shapes, prefetch_size=2):
+        """Return `tf.data.Dataset` which yields the batches of `feed` endlessly.
+
+        Args:
+            output_types: tf dtypes of (images, labels). Batches are converted to them.
+            output_shapes: shapes of (images, labels), can be partially known.
+            prefetch_size (int): the number of batches read ahead of the session.
+
+        """
+        def generator():
+            while True:
+                yield self.feed()
+
+        return tf.data.Dataset.from_generator(generator, output_types, output_shapes).prefetch(prefetch_size)
+
     def __len__(self):
         return len(self.dataset)
 
@@ -306,17 +850,25 @@ class DatasetIterator:
         self.seed += 1
         return random_indices
 
+    def prefetch_stats(self):
+        """Return the prefetch throughput statistics, or None when the prefetch is disabled."""
+        if not self.enable_prefetch:
+            return None
+        return self.prefetcher.stats()
+
     def close(self):
         if self.enable_prefetch:
             self.prefetcher.terminate = True
-            self.prefetcher.pool.close()
-            self.prefetcher.pool.join()
+            if isinstance(self.prefetcher, (_StreamingDatasetPrefetchThread, _SharedMemoryPrefetchThread)):
+                self.prefetcher.join()
+            else:
+                self.prefetcher.pool.close()
+                self.prefetcher.pool.join()
 
 
 if __name__ == '__main__':
 
     from lmnet.datasets.cifar10 import Cifar10
-    from lmnet.data_processor import Sequence
     from lmnet.data_augmentor import FlipLeftRight, Hue, Blur
 
     cifar10 = Cifar10()
@@ -22,7 +22,6 @@ import pandas as pd
 
 from lmnet import data_processor
 from lmnet.datasets.base import Base, ObjectDetectionBase, StoragePathCustomizable
-from lmnet.utils.image import load_image
 from lmnet.utils.random import shuffle, train_test_split
 
 
@@ -201,7 +200,7 @@ class ClassificationBase(DeltaMarkMixin, StoragePathCustomizable, Base):
     def __getitem__(self, i, type=None):
         files, labels = self.files_and_annotations
 
-        image = load_image(files[i])
+        image = self._load_image(files[i])
 
         label = data_processor.binarize(labels[i], self.num_classes)
         label = np.reshape(label, (self.num_classes))
@@ -297,7 +296,7 @@ class ObjectDetectionBase(DeltaMarkMixin, StoragePathCustomizable, ObjectDetecti
         files, annotations = self.files_and_annotations
 
         target_file = files[i]
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         gt_boxes = annotations[i]
         gt_boxes = np.array(gt_boxes)
@@ -19,7 +19,6 @@ import os.path
 import numpy as np
 from pycocotools.coco import COCO
 
-from lmnet.utils.image import load_image
 from lmnet.datasets.base import ObjectDetectionBase, SegmentationBase
 
 DEFAULT_CLASSES = [
@@ -119,7 +118,7 @@ class MscocoSegmentation(SegmentationBase):
     def __getitem__(self, i, type=None):
         image_id = self._image_ids[i]
         image_file = self._image_file_from_image_id(image_id)
-        image = load_image(image_file)
+        image = self._load_image(image_file)
 
         label = self._label_from_image_id(image_id)
 
@@ -255,7 +254,7 @@ class MscocoObjectDetection(ObjectDetectionBase):
 
     def __getitem__(self, i, type=None):
         target_file = self.files[i]
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         gt_boxes = self.annotations[i]
         gt_boxes = np.array(gt_boxes)
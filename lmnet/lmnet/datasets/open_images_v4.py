@@ -25,7 +25,6 @@ import numpy as np
 
 from lmnet import data_processor
 from lmnet.datasets.base import Base, ObjectDetectionBase, StoragePathCustomizable
-from lmnet.utils.image import load_image
 from lmnet.utils.random import train_test_split
 
 
@@ -197,7 +196,7 @@ class OpenImagesV4BoundingBox(OpenImagesV4, ObjectDetectionBase):
         target_file = files[i]
         gt_boxes = gt_boxes_list[i]
 
-        image = load_image(target_file)
+        image = self._load_image(target_file)
         height = image.shape[0]
         width = image.shape[1]
 
@@ -265,7 +264,7 @@ class OpenImagesV4Classification(OpenImagesV4):
 
         filename = files[i]
 
-        image = load_image(filename)
+        image = self._load_image(filename)
 
         label = data_processor.binarize(labels[i], self.num_classes)
         label = np.reshape(label, (self.num_classes))
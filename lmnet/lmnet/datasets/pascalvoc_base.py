@@ -21,7 +21,6 @@ import xml.etree.ElementTree as ET
 import numpy as np
 import pandas as pd
 
-from lmnet.utils.image import load_image
 from lmnet.datasets.base import ObjectDetectionBase
 
 
@@ -213,7 +212,7 @@ class PascalvocBase(ObjectDetectionBase):
 
     def __getitem__(self, i, type=None):
         target_file = self.files[i]
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         gt_boxes = self.annotations[i]
         gt_boxes = np.array(gt_boxes)
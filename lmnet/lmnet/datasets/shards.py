@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Packed binary shard format for large image datasets.
+
+A subset is stored in `<shard_dir>/<subset>/` as
+    shard-00000.bin, shard-00001.bin, ...: records of encoded image bytes followed by `.npy` encoded label bytes.
+    index.npy: int64 array of [shard id, offset, image length, label length] for each record.
+    meta.json: task, classes and the other dataset properties.
+
+So a dataset is read from a few large files without globbing directories nor opening each small image file.
+"""
+import io
+import json
+import os
+
+import numpy as np
+import PIL.Image
+
+from lmnet.datasets.base import Base, KeypointDetectionBase, ObjectDetectionBase, SegmentationBase
+
+_TASK_CLASSIFICATION = "classification"
+_TASK_OBJECT_DETECTION = "object_detection"
+_TASK_SEGMENTATION = "segmentation"
+_TASK_KEYPOINT_DETECTION = "keypoint_detection"
+
+
+def _task_of(dataset_class):
+    if issubclass(dataset_class, ObjectDetectionBase):
+        return _TASK_OBJECT_DETECTION
+    if issubclass(dataset_class, SegmentationBase):
+        return _TASK_SEGMENTATION
+    if issubclass(dataset_class, KeypointDetectionBase):
+        return _TASK_KEYPOINT_DETECTION
+    return _TASK_CLASSIFICATION
+
+
+def _encode_image(image, image_format):
+    buffer = io.BytesIO()
+    PIL.Image.fromarray(np.asarray(image, dtype=np.uint8)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def _encode_label(label):
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(label), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _decode_record(data, image_length):
+    image = PIL.Image.open(io.BytesIO(data[:image_length]))
+    image = np.array(image.convert("RGB" if image.mode != "L" else "L"))
+    label = np.load(io.BytesIO(data[image_length:]), allow_pickle=False)
+    return image, label
+
+
+def write_shards(dataset, output_dir, shard_bytes=256 * 1024 ** 2, image_format="png"):
+    """Pack all the samples of `dataset` into shard files in `output_dir`.
+
+    Samples are taken by `dataset[i]` without augmentation and pre-processing.
+
+    Args:
+        dataset: `Base` dataset instance.
+        output_dir (str): output directory of the subset.
+        shard_bytes (int): a new shard file is started when the current one gets larger than this.
+        image_format (str): PIL image format to encode images, "png" is lossless. "jpeg" is smaller.
+
+    Returns:
+        int: the number of written records.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    index = []
+    shard_id = 0
+    shard_file = None
+    offset = 0
+    try:
+        for i in range(len(dataset)):
+            image, label = dataset[i]
+            image_data = _encode_image(image, image_format)
+            label_data = _encode_label(label)
+
+            if shard_file is None or offset > shard_bytes:
+                if shard_file is not None:
+                    shard_file.close()
+                    shard_id += 1
+                shard_file = open(os.path.join(output_dir, "shard-{:05d}.bin".format(shard_id)), "wb")
+                offset = 0
+
+            shard_file.write(image_data)
+            shard_file.write(label_data)
+            index.append([shard_id, offset, len(image_data), len(label_data)])
+            offset += len(image_data) + len(label_data)
+    finally:
+        if shard_file is not None:
+            shard_file.close()
+
+    np.save(os.path.join(output_dir, "index.npy"), np.array(index, dtype=np.int64).reshape([-1, 4]))
+
+    meta = {
+        "task": _task_of(dataset.__class__),
+        "classes": list(dataset.classes),
+        "num_shards": shard_id + 1 if index else 0,
+        "image_format": image_format,
+    }
+    if isinstance(dataset, ObjectDetectionBase):
+        meta["num_max_boxes"] = int(dataset.num_max_boxes)
+    if isinstance(dataset, SegmentationBase):
+        meta["label_colors"] = np.asarray(dataset.label_colors).tolist()
+    with open(os.path.join(output_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    return len(index)
+
+
+class ShardMixin:
+    """A Mixin to compose dataset classes reading packed shard files written by `write_shards`.
+
+    `__getitem__` reads one record with a single `pread` from already opened shard files, so it works with
+    the prefetch of `DatasetIterator` as other datasets. `iterate` reads whole shards with one large sequential read
+    each and shuffles at the shard and the buffer level, for streaming over datasets which don't fit in memory.
+    `DatasetIterator` reads batches from it when the prefetch is disabled.
+    """
+    available_subsets = ["train", "validation", "train_validation_saving"]
+    extend_dir = None
+
+    def __init__(
+            self,
+            shard_dir,
+            *args,
+            **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.shard_dir = shard_dir
+        self.subset_dir = os.path.join(shard_dir, self.subset)
+        if not os.path.exists(os.path.join(self.subset_dir, "index.npy")):
+            raise ValueError("Shard directory does not exist: {}\n"
+                             "Please run `python executor/build_shards.py -c <config file>` before training."
+                             .format(self.subset_dir))
+
+        with open(os.path.join(self.subset_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.index = np.load(os.path.join(self.subset_dir, "index.npy"))
+
+        self._pid = None
+        self._shard_files = {}
+
+    def __getstate__(self):
+        # file descriptors can not be shared between processes, they are re-opened lazily.
+        state = self.__dict__.copy()
+        state["_pid"] = None
+        state["_shard_files"] = {}
+        return state
+
+    def _shard_path(self, shard_id):
+        return os.path.join(self.subset_dir, "shard-{:05d}.bin".format(shard_id))
+
+    def _shard_fd(self, shard_id):
+        if self._pid != os.getpid():
+            self._shard_files = {}
+            self._pid = os.getpid()
+        if shard_id not in self._shard_files:
+            self._shard_files[shard_id] = os.open(self._shard_path(shard_id), os.O_RDONLY)
+        return self._shard_files[shard_id]
+
+    @property
+    def classes(self):
+        return self.meta["classes"]
+
+    @property
+    def num_classes(self):
+        return len(self.classes)
+
+    @property
+    def num_per_epoch(self):
+        return len(self.index)
+
+    def __len__(self):
+        return self.num_per_epoch
+
+    def __getitem__(self, i, type=None):
+        shard_id, offset, image_length, label_length = self.index[i]
+        data = os.pread(self._shard_fd(int(shard_id)), int(image_length + label_length), int(offset))
+        return _decode_record(data, int(image_length))
+
+    def iterate(self, seed=None, shuffle_buffer_size=1024):
+        """Yield all the samples once, reading each shard with one sequential read.
+
+        Args:
+            seed (int): seed of the shuffle. Shard order and the order in the buffer are shuffled.
+                If None, samples are yielded in the stored order.
+            shuffle_buffer_size (int): the number of samples buffered for the shuffle.
+        """
+        random_state = np.random.RandomState(seed) if seed is not None else None
+        shard_ids = np.arange(self.meta["num_shards"])
+        if random_state is not None:
+            random_state.shuffle(shard_ids)
+
+        # records are stored in the order of shard id.
+        starts = np.searchsorted(self.index[:, 0], shard_ids, side="left")
+        ends = np.searchsorted(self.index[:, 0], shard_ids, side="right")
+
+        buffer = []
+        for shard_id, start, end in zip(shard_ids, starts, ends):
+            with open(self._shard_path(shard_id), "rb") as f:
+                data = f.read()
+
+            for _, offset, image_length, label_length in self.index[start:end]:
+                sample = _decode_record(data[offset:offset + image_length + label_length], image_length)
+                if random_state is None:
+                    yield sample
+                    continue
+
+                buffer.append(sample)
+                if len(buffer) >= shuffle_buffer_size:
+                    j = random_state.randint(len(buffer))
+                    buffer[j], buffer[-1] = buffer[-1], buffer[j]
+                    yield buffer.pop()
+
+        if random_state is not None:
+            random_state.shuffle(buffer)
+        for sample in buffer:
+            yield sample
+
+
+class ShardClassification(ShardMixin, Base):
+    """A dataset class for loading packed shards of classification datasets."""
+    pass
+
+
+class ShardObjectDetection(ShardMixin, ObjectDetectionBase):
+    """A dataset class for loading packed shards of object detection datasets."""
+
+    @classmethod
+    def count_max_boxes(cls, shard_dir):
+        """Count max boxes size over all the subsets written in `shard_dir`, from their meta data."""
+        num_max_boxes = 0
+        for subset in cls.available_subsets:
+            meta_path = os.path.join(shard_dir, subset, "meta.json")
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                num_max_boxes = max(num_max_boxes, json.load(f)["num_max_boxes"])
+        return num_max_boxes
+
+    @property
+    def num_max_boxes(self):
+        if not hasattr(self, "_num_max_boxes"):
+            self._num_max_boxes = self.__class__.count_max_boxes(self.shard_dir)
+        return self._num_max_boxes
+
+
+class ShardSegmentation(ShardMixin, SegmentationBase):
+    """A dataset class for loading packed shards of semantic segmentation datasets."""
+
+    @property
+    def label_colors(self):
+        if self._label_colors:
+            return self._label_colors
+        return self.meta["label_colors"]
+
+
+class ShardKeypointDetection(ShardMixin, KeypointDetectionBase):
+    """A dataset class for loading packed shards of keypoint detection datasets."""
+    pass
+
+
+def shard_dataset_class(dataset_class):
+    """Return the shard dataset class which has the same task as `dataset_class`."""
+    return {
+        _TASK_CLASSIFICATION: ShardClassification,
+        _TASK_OBJECT_DETECTION: ShardObjectDetection,
+        _TASK_SEGMENTATION: ShardSegmentation,
+        _TASK_KEYPOINT_DETECTION: ShardKeypointDetection,
+    }[_task_of(dataset_class)]
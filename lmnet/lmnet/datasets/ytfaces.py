@@ -17,7 +17,6 @@ import os.path
 
 import numpy as np
 
-from lmnet.utils.image import load_image
 from lmnet.datasets.base import KeypointDetectionBase
 
 
@@ -82,7 +81,7 @@ class YoutubeFacialLandmarks(KeypointDetectionBase):
 
         """
 
-        return load_image(self.files[item]), self.joints_list[item]
+        return self._load_image(self.files[item]), self.joints_list[item]
 
     def __len__(self):
         return len(self.files)
@@ -15,6 +15,7 @@
 # limitations under the License.
 # =============================================================================
 import re
+from multiprocessing import Pool
 
 import numpy as np
 import tensorflow as tf
@@ -472,8 +473,7 @@ def _calc_average_precision(precision, recall):
     precision = np.concatenate(([0.], precision, [0.]))
 
     # compute the precision envelope
-    for i in range(precision.size - 1, 0, -1):
-        precision[i - 1] = np.maximum(precision[i - 1], precision[i])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
 
     # to calculate area under PR curve, look for points
     # where X axis (recall) changes value
@@ -526,3 +526,334 @@ def _calc_overlap(gt_boxes, pred_box):
         - inters
 
     return inters / union
+
+
+# ===========================================================================
+# Vectorized mean average precision computations on numpy
+# ===========================================================================
+def mean_average_precision(all_predict_boxes, all_gt_boxes, classes, overlap_thresh=0.5, num_workers=None):
+    """Calcurate mean average precision, the same results as `_mean_average_precision`.
+
+    Boxes are grouped by class and image once, then overlaps of all the pairs of predicted and ground truth boxes
+    in the same class and image are calculated in bulk, without python loops over classes, images and boxes.
+
+    Args:
+        all_predict_boxes(list): python list of numpy.ndarray. all images predicted boxes.
+            all_pred_boxes[image_index] shape is [num_pred_boxes, 6(x, y, w, h, class, scores)]
+        all_gt_boxes(numpy.ndarray): ground truth boxes.
+            shape is [num_images, num_max_gt_boxes, 5(x, y, w, h, class)]
+        classes: classes list.
+        overlap_thresh: threshold of overlap.
+        num_workers(int): the number of processes to calculate classes in parallel. If None, no process is used.
+
+    Return:
+       dictionary include 'MeanAveragePrecision' 'AveragePrecision', 'Precision', 'Recall', 'OrderedPrecision',
+       'OrderedRecall'
+    """
+    assert len(all_predict_boxes) == len(all_gt_boxes)
+
+    num_classes = len(classes)
+    pred_boxes, pred_keys = _group_boxes(all_predict_boxes, num_classes)
+    gt_boxes, gt_keys = _group_boxes(all_gt_boxes, num_classes)
+
+    # split into contiguous ranges of classes, each task has about the same number of predicted boxes.
+    num_tasks = 1 if not num_workers else min(num_classes, num_workers * 4)
+    pred_classes = pred_keys[:, 0]
+    gt_classes = gt_keys[:, 0]
+    task_starts = np.linspace(0, len(pred_classes), num_tasks, endpoint=False).astype(np.int64)
+    task_starts = task_starts[task_starts < len(pred_classes)]
+    class_bounds = np.unique(np.concatenate([[0], pred_classes[task_starts], [num_classes]]))
+
+    tasks = []
+    for class_start, class_end in zip(class_bounds[:-1], class_bounds[1:]):
+        pred_start, pred_end = np.searchsorted(pred_classes, [class_start, class_end])
+        gt_start, gt_end = np.searchsorted(gt_classes, [class_start, class_end])
+        tasks.append((
+            pred_boxes[pred_start:pred_end],
+            pred_keys[pred_start:pred_end],
+            gt_boxes[gt_start:gt_end],
+            gt_keys[gt_start:gt_end],
+            range(class_start, class_end),
+            overlap_thresh,
+        ))
+
+    if num_workers:
+        with Pool(num_workers) as pool:
+            class_results = pool.map(_class_average_precisions, tasks)
+    else:
+        class_results = [_class_average_precisions(task) for task in tasks]
+
+    return _mean_average_precision_result([result for results in class_results for result in results])
+
+
+def _mean_average_precision_result(class_results):
+    """Format the list of `_class_average_precision` results as `_mean_average_precision`."""
+    result = {
+        'MeanAveragePrecision': None,
+        'AveragePrecision': [],
+        'Precision': [],
+        'Recall': [],
+        'OrderedPrecision': [],
+        'OrderedRecall': [],
+    }
+    for average_precision, precision, recall, ordered_precision, ordered_recall in class_results:
+        result['AveragePrecision'].append(average_precision)
+        result['Precision'].append(precision)
+        result['Recall'].append(recall)
+        result['OrderedPrecision'].append(ordered_precision)
+        result['OrderedRecall'].append(ordered_recall)
+
+    MAP = sum(result['AveragePrecision'])/len(class_results)
+    result['MeanAveragePrecision'] = MAP
+
+    return result
+
+
+def _group_boxes(all_boxes, num_classes):
+    """Concatenate boxes of all images and sort them by class and image, keeping the order in each image.
+
+    Args:
+        all_boxes: list or numpy.ndarray of boxes for each image.
+            all_boxes[image_index] shape is [num_boxes, 5 or more(x, y, w, h, class, ...)]
+        num_classes(int): boxes of the other class ids are removed, e.g. dummy boxes of -1.
+
+    Return:
+        boxes(numpy.ndarray): shape is [num_all_boxes, 5 or more].
+        keys(numpy.ndarray): shape is [num_all_boxes, 2(class, image index)].
+    """
+    boxes = [image_boxes for image_boxes in all_boxes if len(image_boxes) != 0]
+    image_indices = [np.full(len(image_boxes), i) for i, image_boxes in enumerate(all_boxes) if len(image_boxes) != 0]
+    if not boxes:
+        return np.empty((0, 6)), np.empty((0, 2), dtype=np.int64)
+
+    boxes = np.concatenate(boxes)
+    image_indices = np.concatenate(image_indices)
+
+    is_valid = np.isin(boxes[:, 4], np.arange(num_classes))
+    boxes = boxes[is_valid]
+    keys = np.stack([boxes[:, 4].astype(np.int64), image_indices[is_valid]], axis=1)
+
+    order = np.argsort(keys[:, 0] * len(all_boxes) + keys[:, 1], kind="stable")
+    return boxes[order], keys[order]
+
+
+def _sort_by_score_in_groups(scores, keys):
+    """Return indices which sort `scores` in each group of the same keys, in the same order as `tp_fp_in_the_image`.
+
+    `keys` must be sorted. `np.argsort` is not stable, so groups with tied scores are sorted one by one.
+    """
+    groups = keys[:, 0] * (keys[:, 1].max(initial=0) + 1) + keys[:, 1]
+    order = np.argsort(-scores, kind="stable")
+    order = order[np.argsort(groups[order], kind="stable")]
+
+    sorted_scores = scores[order]
+    is_same_group = groups[1:] == groups[:-1]
+    tied = np.flatnonzero(is_same_group & (sorted_scores[1:] == sorted_scores[:-1]))
+    if tied.size != 0:
+        group_starts = np.flatnonzero(np.concatenate([[True], ~is_same_group]))
+        group_ends = np.concatenate([group_starts[1:], [len(scores)]])
+        for group in np.unique(np.searchsorted(group_starts, tied, side="right") - 1):
+            start, end = group_starts[group], group_ends[group]
+            order[start:end] = start + np.argsort(-scores[start:end], axis=0)
+
+    return order
+
+
+def _tp_and_fp_in_groups(pred_boxes, pred_keys, gt_boxes, gt_keys, overlap_thresh):
+    """Calculate tp and fp of predicted boxes sorted by class, image and score, same as `tp_fp_in_the_image`.
+
+    Each predicted box is matched to the ground truth box of the max overlap in the same class and image.
+    The ground truth box is used by the first matched predicted box, the others are false positive.
+
+    Return:
+       tp(numpy.ndarray): prediction boxes length vector of tp.
+       fp(numpy.ndarray): prediction boxes length vector of fp.
+    """
+    num_pred_boxes = len(pred_boxes)
+    num_images = max(pred_keys[:, 1].max(initial=0), gt_keys[:, 1].max(initial=0)) + 1
+    pred_group = pred_keys[:, 0] * num_images + pred_keys[:, 1]
+    gt_group = gt_keys[:, 0] * num_images + gt_keys[:, 1]
+
+    # all the pairs of predicted and ground truth boxes in the same class and image.
+    gt_starts = np.searchsorted(gt_group, pred_group, side="left")
+    num_pairs = np.searchsorted(gt_group, pred_group, side="right") - gt_starts
+    pair_starts = np.cumsum(num_pairs) - num_pairs
+    pair_pred = np.repeat(np.arange(num_pred_boxes), num_pairs)
+    pair_gt = np.repeat(gt_starts - pair_starts, num_pairs) + np.arange(num_pairs.sum())
+
+    overlaps = _calc_overlap_pairs(gt_boxes[pair_gt], pred_boxes[pair_pred])
+
+    # the first max overlap of each predicted box.
+    has_pairs = num_pairs > 0
+    ovmax = np.full(num_pred_boxes, -np.inf)
+    jmax = np.full(num_pred_boxes, -1)
+    if overlaps.size != 0:
+        ovmax[has_pairs] = np.maximum.reduceat(overlaps, pair_starts[has_pairs])
+        is_max = (overlaps == ovmax[pair_pred]) | (np.isnan(overlaps) & np.isnan(ovmax[pair_pred]))
+        first_max = np.minimum.reduceat(np.where(is_max, np.arange(len(overlaps)), len(overlaps)),
+                                        pair_starts[has_pairs])
+        jmax[has_pairs] = pair_gt[first_max]
+
+    matched = np.flatnonzero(ovmax > overlap_thresh)
+    _, first_matched = np.unique(jmax[matched], return_index=True)
+
+    tp = np.zeros(num_pred_boxes, dtype=np.float32)
+    tp[matched[first_matched]] = 1.
+    fp = 1. - tp
+
+    return tp, fp
+
+
+def _tp_fp_and_scores(pred_boxes, pred_keys, gt_boxes, gt_keys, overlap_thresh):
+    """Calculate tp, fp and score of predicted boxes grouped by `_group_boxes`.
+
+    Return:
+        pred_keys(numpy.ndarray): keys of predicted boxes sorted by class, image and score.
+        tp(numpy.ndarray): prediction boxes length vector of tp.
+        fp(numpy.ndarray): prediction boxes length vector of fp.
+        score(numpy.ndarray): prediction boxes length vector of score.
+    """
+    order = _sort_by_score_in_groups(pred_boxes[:, 5], pred_keys)
+    pred_boxes, pred_keys = pred_boxes[order], pred_keys[order]
+    tp, fp = _tp_and_fp_in_groups(pred_boxes, pred_keys, gt_boxes, gt_keys, overlap_thresh)
+    scores = pred_boxes[:, 5].astype(np.float32)
+
+    return pred_keys, tp, fp, scores
+
+
+def _class_average_precision(tp, fp, scores, num_gt_boxes):
+    """Calculate average precision of a class from tp, fp and scores concatenated in the order of images."""
+    sort_index = np.argsort(-scores, axis=0)
+
+    ordered_precision, ordered_recall, precision, recall = \
+        _calc_precision_recall(tp[sort_index], fp[sort_index], num_gt_boxes)
+    average_precision = _calc_average_precision(ordered_precision, ordered_recall)
+
+    return average_precision, precision, recall, ordered_precision, ordered_recall
+
+
+def _class_average_precisions(task):
+    """Calculate average precision of each class in the task, boxes are grouped by `_group_boxes`."""
+    pred_boxes, pred_keys, gt_boxes, gt_keys, class_indices, overlap_thresh = task
+
+    pred_keys, tp, fp, scores = _tp_fp_and_scores(pred_boxes, pred_keys, gt_boxes, gt_keys, overlap_thresh)
+
+    results = []
+    for class_index in class_indices:
+        pred_start, pred_end = np.searchsorted(pred_keys[:, 0], [class_index, class_index + 1])
+        gt_start, gt_end = np.searchsorted(gt_keys[:, 0], [class_index, class_index + 1])
+
+        results.append(_class_average_precision(
+            tp[pred_start:pred_end], fp[pred_start:pred_end], scores[pred_start:pred_end], gt_end - gt_start,
+        ))
+
+    return results
+
+
+class MeanAveragePrecisionAccumulator:
+    """Streaming mean average precision on numpy.
+
+    `update` takes boxes of a batch, matches them and keeps only scores and tp of the predicted boxes for each class,
+    so the boxes of all images don't have to be held. `result` can be called at any point and gives the same results
+    as `_mean_average_precision` of all the boxes given so far.
+
+    Args:
+        classes: classes list.
+        overlap_thresh: threshold of overlap.
+    """
+
+    def __init__(self, classes, overlap_thresh=0.5):
+        self.classes = classes
+        self.overlap_thresh = overlap_thresh
+        self.reset()
+
+    def reset(self):
+        num_classes = len(self.classes)
+        self.num_images = 0
+        self._num_gt_boxes = np.zeros(num_classes, dtype=np.int64)
+        self._scores = [[np.empty(0, dtype=np.float32)] for _ in range(num_classes)]
+        self._tps = [[np.empty(0, dtype=np.bool_)] for _ in range(num_classes)]
+
+    def update(self, predict_boxes, gt_boxes):
+        """Add boxes of a batch.
+
+        Args:
+            predict_boxes(list): python list of numpy.ndarray. predicted boxes of each image in the batch.
+                predict_boxes[image_index] shape is [num_pred_boxes, 6(x, y, w, h, class, scores)]
+            gt_boxes(numpy.ndarray): ground truth boxes.
+                shape is [batch_size, num_max_gt_boxes, 5(x, y, w, h, class)]
+        """
+        assert len(predict_boxes) == len(gt_boxes)
+
+        num_classes = len(self.classes)
+        pred_boxes, pred_keys = _group_boxes(predict_boxes, num_classes)
+        gt_boxes, gt_keys = _group_boxes(gt_boxes, num_classes)
+
+        pred_keys, tp, _, scores = _tp_fp_and_scores(pred_boxes, pred_keys, gt_boxes, gt_keys, self.overlap_thresh)
+
+        bounds = np.searchsorted(pred_keys[:, 0], np.arange(num_classes + 1))
+        for class_index in np.unique(pred_keys[:, 0]):
+            start, end = bounds[class_index], bounds[class_index + 1]
+            self._scores[class_index].append(scores[start:end])
+            self._tps[class_index].append(tp[start:end].astype(np.bool_))
+
+        self._num_gt_boxes += np.bincount(gt_keys[:, 0], minlength=num_classes)
+        self.num_images += len(predict_boxes)
+
+    def _compact(self, class_index):
+        if len(self._scores[class_index]) > 1:
+            self._scores[class_index] = [np.concatenate(self._scores[class_index])]
+            self._tps[class_index] = [np.concatenate(self._tps[class_index])]
+        return self._scores[class_index][0], self._tps[class_index][0]
+
+    def result(self):
+        """Return the current mean average precision.
+
+        Return:
+           dictionary include 'MeanAveragePrecision' 'AveragePrecision', 'Precision', 'Recall', 'OrderedPrecision',
+           'OrderedRecall'
+        """
+        class_results = []
+        for class_index in range(len(self.classes)):
+            scores, tp = self._compact(class_index)
+            tp = tp.astype(np.float32)
+            class_results.append(_class_average_precision(tp, 1. - tp, scores, self._num_gt_boxes[class_index]))
+
+        return _mean_average_precision_result(class_results)
+
+
+def _calc_overlap_pairs(gt_boxes, pred_boxes):
+    """Calcurate overlap of each pair, the same as `_calc_overlap`.
+    Args:
+        gt_boxes: ground truth boxes. shape is [num_pairs, 5(x, y, w, h, class)]
+        pred_boxes: predict boxes. shape is [num_pairs, 6(x, y, w, h, class, prob)]
+    Return:
+        overlaps: shape is [num_pairs]
+    """
+    gt_boxes_xmin = gt_boxes[:, 0]
+    gt_boxes_ymin = gt_boxes[:, 1]
+    gt_boxes_xmax = gt_boxes[:, 0] + gt_boxes[:, 2]
+    gt_boxes_ymax = gt_boxes[:, 1] + gt_boxes[:, 3]
+
+    pred_box_xmin = pred_boxes[:, 0]
+    pred_box_ymin = pred_boxes[:, 1]
+    pred_box_xmax = pred_boxes[:, 0] + pred_boxes[:, 2]
+    pred_box_ymax = pred_boxes[:, 1] + pred_boxes[:, 3]
+
+    d = 1.
+
+    # intersection
+    inter_xmin = np.maximum(gt_boxes_xmin, pred_box_xmin)
+    inter_ymin = np.maximum(gt_boxes_ymin, pred_box_ymin)
+    inter_xmax = np.minimum(gt_boxes_xmax, pred_box_xmax)
+    inter_ymax = np.minimum(gt_boxes_ymax, pred_box_ymax)
+    inter_w = np.maximum(inter_xmax - inter_xmin + d, 0.)
+    inter_h = np.maximum(inter_ymax - inter_ymin + d, 0.)
+    inters = inter_w * inter_h
+
+    # union
+    union = (pred_box_xmax - pred_box_xmin + d) * (pred_box_ymax - pred_box_ymin + d) \
+        + (gt_boxes_xmax - gt_boxes_xmin + d) * (gt_boxes_ymax - gt_boxes_ymin + d) \
+        - inters
+
+    return inters / union
@@ -13,8 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
-import math
-
 import numpy as np
 import tensorflow as tf
 
@@ -1052,81 +1050,71 @@ class YoloV2Loss:
         """Calculate ious.
 
         Args:
-            boxes: 4-D np.ndarray [num_cell, num_cell, boxes_per_cell, 4(x_center, y_center, w, h)]
-            box: 1-D np.ndarray [4(x_center, y_center, w, h)]
+            boxes: np.ndarray [..., 4(x_center, y_center, w, h)]
+            box: np.ndarray [..., 4(x_center, y_center, w, h)], which is broadcast to `boxes`.
 
         Return:
-            iou: 3-D np.ndarray [num_cell, num_cell, boxes_per_cell]
+            iou: np.ndarray [...] in float64.
         """
-        # left, top, right, bottom
-        # format left, top, right, bottom
-        boxes = np.stack([
-            boxes[:, :, :, 0] - boxes[:, :, :, 2] / 2,
-            boxes[:, :, :, 1] - boxes[:, :, :, 3] / 2,
-            boxes[:, :, :, 0] + boxes[:, :, :, 2] / 2,
-            boxes[:, :, :, 1] + boxes[:, :, :, 3] / 2,
-        ], axis=3)
-
-        box = np.array([
-            box[0] - box[2] / 2,
-            box[1] - box[3] / 2,
-            box[0] + box[2] / 2,
-            box[1] + box[3] / 2,
-        ])
-
-        # calculate the left up point
-        left_top = np.maximum(boxes[:, :, :, 0:2], box[0:2])
-        right_bottom = np.minimum(boxes[:, :, :, 2:], box[2:])
-
-        # calculate intersection. [num_cell, num_cell, boxes_per_cell, 2]
-        inter = right_bottom - left_top
-        inter_square = inter[:, :, :, 0] * inter[:, :, :, 1]
-        mask = (inter[:, :, :, 0] > 0) * (inter[:, :, :, 1] > 0)
-
-        intersection = mask * inter_square
+        boxes = boxes.astype(np.float64)
+        box = box.astype(np.float64)
+
+        # format left, top, right, bottom. each coordinate is a contiguous array to be broadcast fast.
+        left1 = boxes[..., 0] - boxes[..., 2] / 2
+        top1 = boxes[..., 1] - boxes[..., 3] / 2
+        right1 = boxes[..., 0] + boxes[..., 2] / 2
+        bottom1 = boxes[..., 1] + boxes[..., 3] / 2
+
+        left2 = box[..., 0] - box[..., 2] / 2
+        top2 = box[..., 1] - box[..., 3] / 2
+        right2 = box[..., 0] + box[..., 2] / 2
+        bottom2 = box[..., 1] + box[..., 3] / 2
+
+        # calculate intersection, which is 0 unless both of the width and the height are positive.
+        # the broadcast arrays are updated in place, as they are large.
+        inter_w = np.minimum(right1, right2)
+        inter_w -= np.maximum(left1, left2)
+        inter_h = np.minimum(bottom1, bottom2)
+        inter_h -= np.maximum(top1, top2)
+
+        intersection = np.maximum(inter_w, 0.0, out=inter_w)
+        intersection *= np.maximum(inter_h, 0.0, out=inter_h)
 
         # calculate the boxes1 square and boxes2 square
-        square1 = (boxes[:, :, :, 2] - boxes[:, :, :, 0]) * (boxes[:, :, :, 3] - boxes[:, :, :, 1])
-        square2 = (box[2] - box[0]) * (box[3] - box[1])
+        square1 = (right1 - left1) * (bottom1 - top1)
+        square2 = (right2 - left2) * (bottom2 - top2)
 
         epsilon = 1e-10
-        union = square1 + square2 - intersection
+        union = square1 + square2
+        union -= intersection
+        union += epsilon
 
-        iou = intersection / (union + epsilon)
+        iou = np.divide(intersection, union, out=intersection)
 
         iou[np.isnan(iou)] = 0.0
-        iou = np.clip(iou, 0.0, 1.0)
+        iou = np.clip(iou, 0.0, 1.0, out=iou)
 
         return iou
 
     def __iou_gt_boxes(self, boxes, gt_boxes_list, num_cell):
-        num_cell_y = num_cell[0]
-        num_cell_x = num_cell[1]
-
-        best_iou = np.zeros((self.batch_size, num_cell_y, num_cell_x, self.boxes_per_cell), dtype=np.float32)
-
-        for batch_index in range(self.batch_size):
-            current_boxes = boxes[batch_index, :, :, :, :]
-            gt_boxes = gt_boxes_list[batch_index, :, :]
+        # exclude dummy gt_box. class id `-1` is dummy.
+        # move dummy gt boxes to the end of each image and drop the columns of only dummy gt boxes.
+        is_dummy = gt_boxes_list[:, :, 4] == -1
+        order = np.argsort(is_dummy, axis=1, kind="stable")
+        num_boxes = np.max(np.sum(~is_dummy, axis=1), initial=0)
+        order = order[:, :num_boxes]
+        gt_boxes = np.take_along_axis(gt_boxes_list, order[:, :, np.newaxis], axis=1)
+        is_dummy = np.take_along_axis(is_dummy, order, axis=1)
 
-            best_iou_per_batch = np.zeros((num_cell_y, num_cell_x, self.boxes_per_cell), dtype=np.float32)
+        # [batch_size, num_cell * num_cell * boxes_per_cell, 1, 4] and [batch_size, 1, num_boxes, 4]
+        flat_boxes = boxes.reshape([boxes.shape[0], -1, 1, 4])
+        iou_per_gtbox = self._iou_per_gtbox(flat_boxes, gt_boxes[:, np.newaxis, :, 0:4])
+        iou_per_gtbox *= ~is_dummy[:, np.newaxis, :]
 
-            for box_index in range(gt_boxes.shape[0]):
+        # ious are not negative, so the best iou of no gt_box is 0.
+        best_iou = np.max(iou_per_gtbox, axis=2, initial=0.0)
 
-                gt_box = gt_boxes[box_index, :]
-
-                # exclude dummy gt_box. class id `-1` is dummy.
-                if gt_box[4] == -1:
-                    continue
-
-                iou_per_gtbox = self._iou_per_gtbox(current_boxes, gt_box[0:4])
-                filter_iou = iou_per_gtbox > best_iou_per_batch
-                best_iou_per_batch[filter_iou] =\
-                    iou_per_gtbox[filter_iou]
-
-            best_iou[batch_index, :, :, :] = best_iou_per_batch
-
-        return best_iou
+        return best_iou.reshape(boxes.shape[:4]).astype(np.float32)
 
     def _iou_gt_boxes(self, boxes, gt_boxes_list):
         """Calculate ious between predict box and gt box.
@@ -1150,34 +1138,43 @@ class YoloV2Loss:
         return ious
 
     def _one_iou(self, box1, box2):
+        """Calculate ious of pairs of boxes.
+
+        Args:
+            box1: np.ndarray [..., 4(x_center, y_center, w, h)]
+            box2: np.ndarray [..., 4(x_center, y_center, w, h)], which is broadcast to `box1`.
+
+        Return:
+            iou: np.ndarray [...] in float64.
+        """
+        box1 = box1.astype(np.float64)
+        box2 = box2.astype(np.float64)
+
         # format left, top, right, bottom
-        box1 = np.array([
-            box1[0] - box1[2] / 2,
-            box1[1] - box1[3] / 2,
-            box1[0] + box1[2] / 2,
-            box1[1] + box1[3] / 2,
-        ])
-
-        box2 = np.array([
-            box2[0] - box2[2] / 2,
-            box2[1] - box2[3] / 2,
-            box2[0] + box2[2] / 2,
-            box2[1] + box2[3] / 2,
-        ])
-
-        left_top = np.maximum(box1[0:2], box2[0:2])
-        right_bottom = np.minimum(box1[2:], box2[2:])
+        box1 = np.stack([
+            box1[..., 0] - box1[..., 2] / 2,
+            box1[..., 1] - box1[..., 3] / 2,
+            box1[..., 0] + box1[..., 2] / 2,
+            box1[..., 1] + box1[..., 3] / 2,
+        ], axis=-1)
+
+        box2 = np.stack([
+            box2[..., 0] - box2[..., 2] / 2,
+            box2[..., 1] - box2[..., 3] / 2,
+            box2[..., 0] + box2[..., 2] / 2,
+            box2[..., 1] + box2[..., 3] / 2,
+        ], axis=-1)
+
+        left_top = np.maximum(box1[..., 0:2], box2[..., 0:2])
+        right_bottom = np.minimum(box1[..., 2:], box2[..., 2:])
 
         inter = right_bottom - left_top
 
-        if inter[0] <= 0 and inter[1] <= 0:
-            return 0.0
-
-        inter_square = inter[0] * inter[1]
+        inter_square = inter[..., 0] * inter[..., 1]
 
         # calculate the box1 square and box2 square
-        square1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
-        square2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+        square1 = (box1[..., 2] - box1[..., 0]) * (box1[..., 3] - box1[..., 1])
+        square2 = (box2[..., 2] - box2[..., 0]) * (box2[..., 3] - box2[..., 1])
 
         epsilon = 1e-10
 
@@ -1185,8 +1182,8 @@ class YoloV2Loss:
 
         iou = inter_square / (union + epsilon)
 
-        if np.isnan(iou):
-            return 0.0
+        no_overlap = (inter[..., 0] <= 0) & (inter[..., 1] <= 0)
+        iou = np.where(no_overlap | np.isnan(iou), 0.0, iou)
         iou = np.clip(iou, 0.0, 1.0)
 
         return iou
@@ -1205,6 +1202,9 @@ class YoloV2Loss:
         3. In the best anchor, create cell_gt_boxes from the gt_boxes
         and calculate truth_confidence and assign masks true.
 
+        All the gt boxes are processed at once. When some gt boxes have the same cell and anchor,
+        the last one in the order of batch and gt box is assigned.
+
         Args:
             gt_boxes_list(np.ndarray): The ground truth boxes. Shape is
                 [batch_size, max_num_boxes, 5(center_x, center_y, w, h, class_id)].
@@ -1234,13 +1234,6 @@ class YoloV2Loss:
         object_masks = np.zeros((self.batch_size, num_cell_y, num_cell_x, self.boxes_per_cell, 1), dtype=np.int64)
         coordinate_masks = np.zeros((self.batch_size, num_cell_y, num_cell_x, self.boxes_per_cell, 1), dtype=np.int64)
 
-        # for debug:
-        num_gt_boxes = 0
-        num_correct_prediction_conf = 0
-        sum_iou = 0.0
-        sum_conf = 0.0
-        sum_diff_conf = 0.0
-
         # extra coordinate loss for early training steps to encourage predictions to match anchor.
         # https://github.com/pjreddie/darknet/blob/2f212a47425b2e1002c7c8a20e139fe0da7489b5/src/region_layer.c#L248
         if global_step < self.warmup_steps:
@@ -1263,78 +1256,76 @@ class YoloV2Loss:
 
             coordinate_masks[:] = 1  # True
 
-        for batch_index in range(self.batch_size):
+        # exclude dummy gt_box. class id `-1` is dummy.
+        batch_index, box_index = np.nonzero(gt_boxes_list[:self.batch_size, :, 4] != -1)
+        gt_boxes = gt_boxes_list[batch_index, box_index, :]
+        num_gt_boxes = len(gt_boxes)
 
-            # calculate iou anchor and gt box
-            gt_boxes = gt_boxes_list[batch_index, :, :]
+        # the cell and the size relative to the image are calculated in float64.
+        real_gt_boxes = gt_boxes.astype(np.float64)
+        cell_y_index = np.floor(real_gt_boxes[:, 1] / image_size[0] * num_cell_y).astype(np.int64)
+        cell_x_index = np.floor(real_gt_boxes[:, 0] / image_size[1] * num_cell_x).astype(np.int64)
 
-            for box_index in range(gt_boxes.shape[0]):
+        # calculate iou anchor and gt box, both of them are at the origin. [num_gt_boxes, num_anchors]
+        resized_boxes = np.zeros((num_gt_boxes, 1, 4))
+        resized_boxes[:, 0, 2] = real_gt_boxes[:, 2] / image_size[1]
+        resized_boxes[:, 0, 3] = real_gt_boxes[:, 3] / image_size[0]
+        anchor_boxes = np.zeros((len(self.anchors), 4))
+        anchor_boxes[:, 2] = [anchor_w / num_cell_x for anchor_w, _ in self.anchors]
+        anchor_boxes[:, 3] = [anchor_h / num_cell_y for _, anchor_h in self.anchors]
+        anchor_ious = self._one_iou(resized_boxes, anchor_boxes)
 
-                gt_box = gt_boxes[box_index, :]
+        # the first anchor of the best iou, which is not 0.
+        best_anchor_index = np.argmax(anchor_ious, axis=1)
+        found = anchor_ious[np.arange(num_gt_boxes), best_anchor_index] > 0
+        if not np.all(found):
+            print("---- Can't find best anchor ---" * 100)
 
-                # exclude dummy gt_box. class id `-1` is dummy.
-                if gt_box[4] == -1:
-                    continue
+        cells = (batch_index[found], cell_y_index[found], cell_x_index[found], best_anchor_index[found])
+        gt_boxes = gt_boxes[found]
 
-                num_gt_boxes += 1
-                center_y = gt_box[1]
-                center_x = gt_box[0]
+        predict_box = predict_boxes[cells]
+        iou = self._one_iou(predict_box, gt_boxes[:, 0:4])
 
-                cell_y_index = math.floor(center_y / image_size[0] * num_cell_y)
-                cell_x_index = math.floor(center_x / image_size[1] * num_cell_x)
+        # keep only the last gt box of each cell anchor, as the former ones are overwritten.
+        flat_index = np.ravel_multi_index(cells, cell_gt_boxes.shape[:4], mode="wrap")
+        _, last = np.unique(flat_index[::-1], return_index=True)
+        last = np.sort(len(flat_index) - 1 - last)
+        last_cells = tuple(index[last] for index in cells)
 
-                resized_h = gt_box[3] / image_size[0]
-                resized_w = gt_box[2] / image_size[1]
+        # the cell_gt_boxes is assigned gt_box coordinate
+        cell_gt_boxes[last_cells] = gt_boxes[last]
 
-                best_iou = 0.0
-                best_anchor_index = -1
+        truth_confidence[last_cells] = iou[last, np.newaxis]
 
-                for anchor_index, (anchor_w, anchor_h) in enumerate(self.anchors):
-                    iou = self._one_iou(
-                        (0, 0, resized_w, resized_h),
-                        (0, 0, anchor_w / num_cell_x, anchor_h / num_cell_y)
-                    )
-
-                    if (iou > best_iou):
-                        best_iou = iou
-                        best_anchor_index = anchor_index
-
-                if best_anchor_index == -1:
-                    print("---- Can't find best anchor ---" * 100)
-                else:
-                    predict_box = predict_boxes[batch_index, cell_y_index, cell_x_index, best_anchor_index, :]
+        # the box of cell object_mask is assigned 1.0(True),
+        object_masks[last_cells] = 1  # True
 
-                    iou = self._one_iou(predict_box, gt_box)
-
-                    # the cell_gt_boxes is assigned gt_box coordinate
-                    cell_gt_boxes[batch_index, cell_y_index, cell_x_index, best_anchor_index, :] = gt_box
-
-                    truth_confidence[batch_index, cell_y_index, cell_x_index, best_anchor_index, :] = iou
-
-                    # the box of cell object_mask is assigned 1.0(True),
-                    object_masks[batch_index, cell_y_index, cell_x_index, best_anchor_index, :] = 1  # True
-
-                    coordinate_masks[batch_index, cell_y_index, cell_x_index, best_anchor_index, :] = 1  # True
-
-                    if self.is_debug:
-                        print("best_anchor_index", best_anchor_index)
-
-                        pred_conf = predict_confidence[batch_index, cell_y_index, cell_x_index, best_anchor_index, :]
-                        predict_probabilities =\
-                            predict_classes[batch_index, cell_y_index, cell_x_index, best_anchor_index, :]
-                        argmax = np.argmax(predict_probabilities)
-                        message = "truth_class: {}. pred_class: {}. pred_prob: {}".format(
-                            gt_box[4], argmax, 100 * predict_probabilities[argmax])
-                        print(message)
-
-                        sum_conf += float(pred_conf)
-                        sum_iou += iou
-                        diff_conf = abs(float(pred_conf) - iou)
-                        sum_diff_conf += diff_conf
-                        if iou > 0.5:
-                            num_correct_prediction_conf += 1
+        coordinate_masks[last_cells] = 1  # True
 
         if self.is_debug:
+            num_correct_prediction_conf = 0
+            sum_iou = 0.0
+            sum_conf = 0.0
+            sum_diff_conf = 0.0
+
+            for i, cell in enumerate(zip(*cells)):
+                print("best_anchor_index", cell[3])
+
+                pred_conf = predict_confidence[cell]
+                predict_probabilities = predict_classes[cell]
+                argmax = np.argmax(predict_probabilities)
+                message = "truth_class: {}. pred_class: {}. pred_prob: {}".format(
+                    gt_boxes[i, 4], argmax, 100 * predict_probabilities[argmax])
+                print(message)
+
+                sum_conf += float(pred_conf)
+                sum_iou += iou[i]
+                diff_conf = abs(float(pred_conf) - iou[i])
+                sum_diff_conf += diff_conf
+                if iou[i] > 0.5:
+                    num_correct_prediction_conf += 1
+
             message = "num_gt_boxes: {}. num_correct_prediction_conf: {}. avg_iou: {}. avg_conf: {}. avg_diff_conf: {}"
             message = message.format(
                 num_gt_boxes, num_correct_prediction_conf, sum_iou/num_gt_boxes,
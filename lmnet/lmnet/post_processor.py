@@ -17,9 +17,8 @@ from __future__ import division
 
 import numpy as np
 
-from lmnet.data_augmentor import iou
 from lmnet.data_processor import Processor
-from lmnet.utils.box import format_cxcywh_to_xywh
+from lmnet.utils.box import iou_matrix
 
 
 def _softmax(x):
@@ -30,14 +29,34 @@ def _softmax(x):
 class FormatYoloV2(Processor):
     """Yolov2 postprocess.
        Format outputs of yolov2 last convolution to object detection style.
+
+       Outputs are decoded in a single pass. The intermediate buffers are reused across calls with the same output
+       shape, the returned array is a new one for each call.
+       When `score_threshold` is given, boxes are filtered by score first and only the surviving cells are
+       converted to boxes, the same as `ExcludeLowScoreBox` after this.
     """
 
-    def __init__(self, image_size, classes, anchors, data_format):
+    def __init__(self, image_size, classes, anchors, data_format, score_threshold=None):
+        """
+        Args:
+            image_size (list): [height, width].
+            classes (list): List of class names.
+            anchors (list): List of anchor (w, h).
+            data_format (string): "NHWC" or "NCHW".
+            score_threshold (float): If given, return only boxes whose score is greater than this.
+        """
         self.image_size = image_size
         self.num_classes = len(classes)
         self.anchors = anchors
         self.boxes_per_cell = len(anchors)
         self.data_format = data_format
+        self.score_threshold = score_threshold
+
+    def __getstate__(self):
+        # buffers are not a part of the settings, e.g. in the exported meta.yaml.
+        state = self.__dict__.copy()
+        state.pop("_buffers", None)
+        return state
 
     @property
     def num_cell(self):
@@ -48,96 +67,132 @@ class FormatYoloV2(Processor):
         return 1 / (1 + np.exp(-x))
 
     def _split_prediction(self, outputs):
-        """Separate combined final convolution outputs to predictions.
+        """Reshape combined final convolution outputs to predictions without copy.
 
         Args:
             outputs: combined final convolution outputs 4D Tensor.
-                shape is [batch_size, num_cell[0], num_cell[1],  (num_classes + 5) * boxes_per_cell]
+                When `data_format` is `NHWC`,
+                shape is [batch_size, num_cell[0], num_cell[1], (num_classes + 5) * boxes_per_cell]
+                When `data_format` is `NCHW`,
+                shape is [batch_size, (num_classes + 5) * boxes_per_cell, num_cell[0], num_cell[1]]
 
         Returns:
             Tensor: [batch_size, num_cell[0], num_cell[1], boxes_per_cell, num_classes]
-            Tensor: [batch_size, num_cell[0], num_cell[1], boxes_per_cell, 1]
+            Tensor: [batch_size, num_cell[0], num_cell[1], boxes_per_cell]
             Tensor: [batch_size, num_cell[0], num_cell[1], boxes_per_cell, 4(center_x, center_y, w, h)]
 
         """
         batch_size = len(outputs)
         num_cell_y, num_cell_x = self.num_cell[0], self.num_cell[1]
 
-        outputs = np.reshape(
-            outputs,
-            [batch_size, num_cell_y, num_cell_x, self.boxes_per_cell, self.num_classes + 5]
-        )
-
-        outputs = np.split(outputs, [self.num_classes, self.num_classes+1, self.num_classes+1+4], axis=4)
-
-        predict_classes, predict_confidence, predict_boxes = outputs[0], outputs[1], outputs[2]
+        if self.data_format == "NCHW":
+            outputs = np.reshape(
+                outputs,
+                [batch_size, self.boxes_per_cell, self.num_classes + 5, num_cell_y, num_cell_x]
+            )
+            outputs = np.transpose(outputs, [0, 3, 4, 1, 2])
+        else:
+            outputs = np.reshape(
+                outputs,
+                [batch_size, num_cell_y, num_cell_x, self.boxes_per_cell, self.num_classes + 5]
+            )
+
+        predict_classes = outputs[..., :self.num_classes]
+        predict_confidence = outputs[..., self.num_classes]
+        predict_boxes = outputs[..., self.num_classes + 1:self.num_classes + 5]
         return predict_classes, predict_confidence, predict_boxes
 
-    def _offset_boxes(self, batch_size, num_cell_y, num_cell_x):
-        """Numpy implementing of offset_boxes.
-        Return yolo space offset of x and y and w and h.
+    def _convert_boxes_space_from_yolo_to_real(self, predict_boxes, cells, out):
+        """Convert predict boxes from yolo space to real space (x(left), y(top), w, h).
+
+        Real space boxes coordinates are in the interval [0, image_size].
+        Yolo space boxes x,y are in the interval [-inf, +inf] before sigmoid. w,h are in the interval [-inf, +inf].
 
         Args:
-            batch_size (int): batch size
-            num_cell_y: Number of cell y. The spatial dimension of the final convolutional features.
-            num_cell_x: Number of cell x. The spatial dimension of the final convolutional features.
+            predict_boxes: np.ndarray, shape is [..., 4(center_x, center_y, w, h)].
+            cells: tuple of (y, x, anchor) indices of `predict_boxes`, they are broadcastable to
+                `predict_boxes.shape[:-1]`. The cell indices are the offset of x and y.
+            out: np.ndarray to write boxes, shape is [..., 4(x(left), y(top), w, h)].
 
         """
+        image_size_h, image_size_w = self.image_size[0], self.image_size[1]
+        num_cell_y, num_cell_x = self.num_cell[0], self.num_cell[1]
+        anchors = np.array(self.anchors, dtype=np.float32)
+        offset_y, offset_x, anchor = cells
 
-        offset_y = np.arange(num_cell_y)
-        offset_y = np.reshape(offset_y, (1, num_cell_y, 1, 1))
-        offset_y = np.broadcast_to(offset_y, [batch_size, num_cell_y, num_cell_x, self.boxes_per_cell])
-
-        offset_x = np.arange(num_cell_x)
-        offset_x = np.reshape(offset_x, (1, 1, num_cell_x, 1))
-        offset_x = np.broadcast_to(offset_x, [batch_size, num_cell_y, num_cell_x, self.boxes_per_cell])
+        w = np.exp(predict_boxes[..., 2]) * anchors[anchor, 0] / num_cell_x * image_size_w
+        h = np.exp(predict_boxes[..., 3]) * anchors[anchor, 1] / num_cell_y * image_size_h
+        out[..., 0] = (self.sigmoid(predict_boxes[..., 0]) + offset_x) / num_cell_x * image_size_w - w / 2
+        out[..., 1] = (self.sigmoid(predict_boxes[..., 1]) + offset_y) / num_cell_y * image_size_h - h / 2
+        out[..., 2] = w
+        out[..., 3] = h
 
-        w_anchors = [anchor_w for anchor_w, anchor_h in self.anchors]
-        offset_w = np.broadcast_to(w_anchors, (batch_size, num_cell_y, num_cell_x, self.boxes_per_cell))
-        offset_w = offset_w.astype(np.float32)
+        return out
 
-        h_anchors = [anchor_h for anchor_w, anchor_h in self.anchors]
-        offset_h = np.broadcast_to(h_anchors, (batch_size, num_cell_y, num_cell_x, self.boxes_per_cell))
-        offset_h = offset_h.astype(np.float32)
+    def _get_buffers(self, batch_size):
+        """Return intermediate buffers, they are allocated once for each batch size and shape and reused."""
+        num_cell_y, num_cell_x = self.num_cell[0], self.num_cell[1]
+        shape = (batch_size, num_cell_y, num_cell_x, self.boxes_per_cell)
+
+        # processors are restored without __init__() from meta.yaml on device.
+        buffers = getattr(self, "_buffers", None)
+        if buffers is None or buffers["boxes"].shape[:-1] != shape:
+            buffers = {
+                "boxes": np.empty(shape + (4, )),
+                "classes": np.empty(shape + (self.num_classes, ), dtype=np.float32),
+            }
+            self._buffers = buffers
+        return buffers
+
+    def _decode(self, predict_classes, predict_confidence, predict_boxes):
+        """Decode all the boxes into a new array, shape is [batch_size, num_boxes, 6]."""
+        batch_size = len(predict_classes)
+        buffers = self._get_buffers(batch_size)
+        boxes, probs = buffers["boxes"], buffers["classes"]
+
+        # the results are returned to the caller, so they are not reused and kept valid after the next call.
+        num_cell_y, num_cell_x = self.num_cell[0], self.num_cell[1]
+        results = np.empty((batch_size, self.num_classes, num_cell_y, num_cell_x, self.boxes_per_cell, 6))
+        results[..., 4] = np.reshape(np.arange(self.num_classes), (1, self.num_classes, 1, 1, 1))
 
-        return offset_x, offset_y, offset_w, offset_h
+        # softmax of classes
+        np.subtract(predict_classes, predict_classes.max(axis=-1, keepdims=True), out=probs)
+        np.exp(probs, out=probs)
+        probs *= (self.sigmoid(predict_confidence) / probs.sum(axis=-1))[..., np.newaxis]
 
-    def _convert_boxes_space_from_yolo_to_real(self, predict_boxes):
-        """Convert predict boxes space size from yolo to real.
+        cells = np.ix_(range(num_cell_y), range(num_cell_x), range(self.boxes_per_cell))
+        self._convert_boxes_space_from_yolo_to_real(predict_boxes, cells, boxes)
 
-        Real space boxes coordinates are in the interval [0, image_size].
-        Yolo space boxes x,y are in the interval [-1, 1]. w,h are in the interval [-inf, +inf].
+        results[..., :4] = boxes[:, np.newaxis]
+        results[..., 5] = np.moveaxis(probs, -1, 1)
 
-        Args:
-            predict_boxes: 5D np.ndarray.
-                           shape is [batch_size, num_cell, num_cell, boxes_per_cell, 4(center_x, center_y, w, h)].
+        return np.reshape(results, [batch_size, -1, 6])
 
-        Returns:
-            resized_boxes: 5D np.ndarray,
-                           shape is [batch_size, num_cell, num_cell, boxes_per_cell, 4(center_x, center_y, w, h)].
+    def _decode_with_threshold(self, predict_classes, predict_confidence, predict_boxes):
+        """Decode only the boxes whose score is greater than `score_threshold`, list of [num_boxes, 6]."""
+        batch_size = len(predict_classes)
 
-        """
-        batch_size = len(predict_boxes)
-        image_size_h, image_size_w = self.image_size[0], self.image_size[1]
-        num_cell_y, num_cell_x = self.num_cell[0], self.num_cell[1]
+        # score = class probability * confidence, it can't be greater than the confidence.
+        predict_confidence = self.sigmoid(predict_confidence)
+        candidates = np.nonzero(predict_confidence > self.score_threshold)
 
-        offset_x, offset_y, offset_w, offset_h = self._offset_boxes(batch_size, num_cell_y, num_cell_x)
+        logits = predict_classes[candidates]
+        probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        scores = probs * (predict_confidence[candidates] / probs.sum(axis=-1))[:, np.newaxis]
+        candidate_ids, class_ids = np.nonzero(scores > self.score_threshold)
 
-        resized_predict_boxes = np.stack([
-            (predict_boxes[:, :, :, :, 0] + offset_x) / num_cell_x,
-            (predict_boxes[:, :, :, :, 1] + offset_y) / num_cell_y,
-            np.exp(predict_boxes[:, :, :, :, 2]) * offset_w / num_cell_x,
-            np.exp(predict_boxes[:, :, :, :, 3]) * offset_h / num_cell_y,
-        ], axis=4)
+        # same order as `ExcludeLowScoreBox` after decoding all the boxes, class major for each image.
+        batch_ids = candidates[0][candidate_ids]
+        order = np.lexsort((candidate_ids, class_ids, batch_ids))
+        candidate_ids, class_ids, batch_ids = candidate_ids[order], class_ids[order], batch_ids[order]
 
-        resized_predict_boxes = resized_predict_boxes * [
-            image_size_w,
-            image_size_h,
-            image_size_w,
-            image_size_h,
-        ]
+        cells = tuple(indices[candidate_ids] for indices in candidates)
+        results = np.empty((len(candidate_ids), 6))
+        self._convert_boxes_space_from_yolo_to_real(predict_boxes[cells], cells[1:], results[:, :4])
+        results[:, 4] = class_ids
+        results[:, 5] = scores[candidate_ids, class_ids]
 
-        return resized_predict_boxes
+        return np.split(results, np.cumsum(np.bincount(batch_ids, minlength=batch_size))[:-1])
 
     def __call__(self, outputs, **kwargs):
         """
@@ -161,55 +216,19 @@ class FormatYoloV2(Processor):
 
         Returns:
             dict: Contains processed outputs.
-                outputs: Object detection formatted list op np.ndarray.
-                List is [predict_boxes(np.ndarray), predict_boxes(np.ndarray), ...] which length is batch size.
+                outputs: Object detection formatted np.ndarray.
+                Shape is [batch_size, num_predict_boxes, 6(x(left), y(top), w, h, class_id, score)].
+                When `score_threshold` is given, list of np.ndarray which length is batch size.
                 Each predict_boxes shape is [num_predict_boxes, 6(x(left), y(top), w, h, class_id, score)]
 
         """
-
-        num_cell_y, num_cell_x = self.num_cell[0], self.num_cell[1]
-        batch_size = len(outputs)
-
-        if self.data_format == "NCHW":
-            outputs = np.transpose(outputs, [0, 2, 3, 1])
-
         predict_classes, predict_confidence, predict_boxes = self._split_prediction(outputs)
 
-        predict_classes = _softmax(predict_classes)
-        predict_confidence = self.sigmoid(predict_confidence)
-        predict_boxes = np.stack([
-            self.sigmoid(predict_boxes[:, :, :, :, 0]),
-            self.sigmoid(predict_boxes[:, :, :, :, 1]),
-            predict_boxes[:, :, :, :, 2],
-            predict_boxes[:, :, :, :, 3],
-        ], axis=4)
-
-        predict_boxes = self._convert_boxes_space_from_yolo_to_real(predict_boxes)
-
-        predict_boxes = format_cxcywh_to_xywh(predict_boxes, axis=4)
-
-        results = []
-        for class_id in range(self.num_classes):
-            predict_prob = predict_classes[:, :, :, :, class_id]
-            predict_score = predict_prob * predict_confidence[:, :, :, :, 0]
-
-            result = np.stack([
-                predict_boxes[:, :, :, :, 0],
-                predict_boxes[:, :, :, :, 1],
-                predict_boxes[:, :, :, :, 2],
-                predict_boxes[:, :, :, :, 3],
-                np.full(predict_score.shape, class_id),
-                predict_score,
-            ], axis=4)
-
-            results.append(result)
-
-        results = np.stack(results, axis=1)
-
-        results = np.reshape(
-            results,
-            [batch_size, num_cell_y * num_cell_x * self.boxes_per_cell * self.num_classes, 6]
-        )
+        # processors restored from meta.yaml of older versions don't have `score_threshold`.
+        if getattr(self, "score_threshold", None) is None:
+            results = self._decode(predict_classes, predict_confidence, predict_boxes)
+        else:
+            results = self._decode_with_threshold(predict_classes, predict_confidence, predict_boxes)
 
         return dict({"outputs": results}, **kwargs)
 
@@ -231,44 +250,173 @@ class ExcludeLowScoreBox(Processor):
 
 
 class NMS(Processor):
-    """Non Maximum Suppression"""
+    """Non Maximum Suppression
 
-    def __init__(self, classes, iou_threshold, max_output_size=100, per_class=True):
+    IoU of the candidate boxes is calculated as a matrix in blocks of sorted boxes, so each box pair is calculated
+    at most once per image without python loops over boxes. When `per_class` is True, boxes are shifted by
+    class id times the coordinate range so that boxes of different classes never overlap, and all the classes are
+    suppressed in a single pass.
+    """
+
+    # the number of sorted boxes whose IoU with the rest of boxes are calculated at once.
+    block_size = 256
+
+    def __init__(
+            self,
+            classes,
+            iou_threshold,
+            max_output_size=100,
+            per_class=True,
+            soft_nms=None,
+            sigma=0.5,
+            score_threshold=0.001,
+    ):
         """
         Args:
             classes (list): List of class names.
             iou_threshold (float): The threshold for deciding whether boxes overlap with respect to IOU.
             max_output_size (int): The maximum number of boxes to be selected
             per_class (boolean): Whether or not, NMS respect to per class.
+            soft_nms (str): None, "linear" or "gaussian". If given, the scores of overlapped boxes are decayed
+                instead of removing the boxes (Soft-NMS, https://arxiv.org/abs/1704.04503).
+            sigma (float): The parameter of "gaussian" Soft-NMS.
+            score_threshold (float): Soft-NMS removes the boxes whose decayed score is lower than this.
         """
+        assert soft_nms in (None, "linear", "gaussian"), "soft_nms should be None, 'linear' or 'gaussian'."
 
         self.classes = classes
         self.iou_threshold = iou_threshold
         self.max_output_size = max_output_size
         self.per_class = per_class
+        self.soft_nms = soft_nms
+        self.sigma = sigma
+        self.score_threshold = score_threshold
+
+    def _offset_boxes(self, boxes):
+        """Shift boxes by class id, so that boxes of different classes don't overlap."""
+        if not self.per_class:
+            return boxes[:, :4]
+
+        left_top = boxes[:, 0:2]
+        right_bottom = boxes[:, 0:2] + boxes[:, 2:4]
+        span = right_bottom.max() - left_top.min() + 1
+        offsets = boxes[:, 4:5] * span
+        return np.concatenate([left_top + offsets, boxes[:, 2:4]], axis=1)
+
+    def _hard_nms(self, coordinates, group_starts, group_ends):
+        """Return the kept indices of sorted `coordinates`.
+
+        Boxes are suppressed in each group of `group_starts[i]:group_ends[i]`, boxes of the other groups are never
+        compared. Up to `max_output_size` boxes are kept for each group.
+        """
+        num_boxes = len(coordinates)
+        suppressed = np.zeros(num_boxes, dtype=np.bool_)
+        counts = np.zeros(num_boxes, dtype=np.int64)
+        keep_indices = []
 
-    def _nms(self, boxes):
-        scores = boxes[:, 5]
-
-        order_indices = np.argsort(-scores)
+        for start in range(0, num_boxes, self.block_size):
+            end = min(start + self.block_size, num_boxes)
+            if suppressed[start:end].all():
+                continue
+            block = coordinates[start:end]
+            overlapped = iou_matrix(block, block) >= self.iou_threshold
+
+            # resolve the greedy suppression inside the block, then suppress the following boxes at once.
+            block_suppressed = suppressed[start:end]
+            block_keep = []
+            for i in range(end - start):
+                if block_suppressed[i]:
+                    continue
+                block_keep.append(i)
+                group_start, group_end = group_starts[start + i], group_ends[start + i]
+                counts[group_start] += 1
+                if counts[group_start] == self.max_output_size:
+                    suppressed[start + i + 1:group_end] = True
+                else:
+                    block_suppressed[i + 1:] |= overlapped[i, i + 1:]
+
+            keep_indices += [start + i for i in block_keep]
+
+            rest = end + np.flatnonzero(~suppressed[end:group_ends[end - 1]])
+            if block_keep and rest.size > 0:
+                ious = iou_matrix(block[block_keep], coordinates[rest])
+                suppressed[rest] |= (ious >= self.iou_threshold).any(axis=0)
+
+        return keep_indices
+
+    def _soft_nms(self, coordinates, scores, group_starts, group_ends):
+        """Return the kept indices of sorted `coordinates` and the decayed scores.
+
+        Scores are decayed in each group of `group_starts[i]:group_ends[i]`. Up to `max_output_size` boxes are kept
+        for each group.
+        """
+        soft_nms = getattr(self, "soft_nms", None)
+        sigma = getattr(self, "sigma", 0.5)
+        score_threshold = getattr(self, "score_threshold", 0.001)
 
+        scores = scores.copy()
+        counts = np.zeros(len(coordinates), dtype=np.int64)
+        remain_indices = np.arange(len(coordinates))
         keep_indices = []
 
-        while order_indices.size > 0:
-            i = order_indices[0]
+        while remain_indices.size > 0:
+            top = np.argmax(scores[remain_indices])
+            i = remain_indices[top]
             keep_indices.append(i)
-            if order_indices.size == 1:
-                break
-            ious = iou(boxes[order_indices[1:], :], boxes[i, :])
-            remain_boxes = np.where(ious < self.iou_threshold)[0]
-            remain_boxes = remain_boxes + 1
+            remain_indices = np.delete(remain_indices, top)
+
+            group_start, group_end = group_starts[i], group_ends[i]
+            group_slice = slice(
+                np.searchsorted(remain_indices, group_start), np.searchsorted(remain_indices, group_end)
+            )
+            counts[group_start] += 1
+            if counts[group_start] == self.max_output_size:
+                remain_indices = np.delete(remain_indices, group_slice)
+                continue
+
+            group = remain_indices[group_slice]
+            if group.size == 0:
+                continue
+
+            ious = iou_matrix(coordinates[i:i + 1], coordinates[group])[0]
+            if soft_nms == "linear":
+                weights = np.where(ious >= self.iou_threshold, 1 - ious, 1)
+            else:
+                weights = np.exp(-(ious * ious) / sigma)
+            scores[group] *= weights
+            remain_indices = remain_indices[scores[remain_indices] >= score_threshold]
+
+        return keep_indices, scores
+
+    def _nms(self, boxes):
+        if self.per_class:
+            boxes = boxes[(boxes[:, 4] >= 0) & (boxes[:, 4] < len(self.classes))]
+        if len(boxes) == 0:
+            return boxes
+
+        if self.per_class:
+            # sort by class id and score, each class is a group of contiguous boxes.
+            boxes = boxes[np.lexsort((-boxes[:, 5], boxes[:, 4]))]
+            group_starts = np.searchsorted(boxes[:, 4], boxes[:, 4], side="left")
+            group_ends = np.searchsorted(boxes[:, 4], boxes[:, 4], side="right")
+        else:
+            boxes = boxes[np.argsort(-boxes[:, 5], kind="mergesort")]
+            group_starts = np.zeros(len(boxes), dtype=np.int64)
+            group_ends = np.full(len(boxes), len(boxes))
+        coordinates = self._offset_boxes(boxes)
 
-            order_indices = order_indices[remain_boxes]
+        # processors restored from meta.yaml of older versions don't have the Soft-NMS settings, it is hard NMS.
+        if not getattr(self, "soft_nms", None):
+            return boxes[self._hard_nms(coordinates, group_starts, group_ends)]
 
-        nms_boxes = boxes[keep_indices, :]
-        if len(nms_boxes) > self.max_output_size:
-            nms_boxes = nms_boxes[:self.max_output_size, :]
-        return nms_boxes
+        keep_indices, scores = self._soft_nms(coordinates, boxes[:, 5], group_starts, group_ends)
+        nms_boxes = boxes[keep_indices]
+        nms_boxes[:, 5] = scores[keep_indices]
+        if not self.per_class:
+            return nms_boxes
+
+        # group by class id, keeping the selected order in each class.
+        return nms_boxes[np.argsort(nms_boxes[:, 4], kind="mergesort")]
 
     def __call__(self, outputs, **kwargs):
         """
@@ -282,24 +430,12 @@ class NMS(Processor):
                 outputs: The boxes list of predict boxes for each image.
                     The format is [boxes, boxes, boxes, ...]. len(boxes) == batch_size.
                     boxes[image_id] is np.array, the shape is (num_boxes, 6[x(left), y(top), h, w, class_id, sore])
+                    In per class mode, boxes are grouped by class id.
         """
         results = []
         batch_size = len(outputs)
         for i in range(batch_size):
-            boxes_per_batch = outputs[i]
-            result_per_batch = []
-
-            if self.per_class:
-                for class_id in range(len(self.classes)):
-                    class_masked = boxes_per_batch[boxes_per_batch[:, 4] == class_id]
-                    nms_boxes = self._nms(class_masked)
-                    result_per_batch.append(nms_boxes)
-            else:
-                nms_boxes = self._nms(boxes_per_batch)
-                result_per_batch.append(nms_boxes)
-
-            result_per_batch = np.concatenate(result_per_batch)
-            results.append(result_per_batch)
+            results.append(self._nms(np.asarray(outputs[i])))
 
         return dict({"outputs": results}, **kwargs)
 
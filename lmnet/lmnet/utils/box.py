@@ -49,6 +49,44 @@ def iou(boxes, box):
     return intersection / (union + epsilon)
 
 
+def iou_matrix(boxes_a, boxes_b):
+    """Calculate pairwise overlap
+
+    Args:
+        boxes_a: boxes in the image. shape is [num_boxes_a, 4 or more(x, y, w, h, ...)]
+        boxes_b: boxes in the image. shape is [num_boxes_b, 4 or more(x, y, w, h, ...)]
+    Returns:
+        iou: shape is [num_boxes_a, num_boxes_b]. iou[i, j] is the same as `iou(boxes_b, boxes_a[i])[j]`.
+    """
+
+    # format boxes (left, top, right, bottom)
+    left_a, top_a = boxes_a[:, 0:1], boxes_a[:, 1:2]
+    right_a, bottom_a = left_a + boxes_a[:, 2:3], top_a + boxes_a[:, 3:4]
+    left_b, top_b = boxes_b[:, 0], boxes_b[:, 1]
+    right_b, bottom_b = left_b + boxes_b[:, 2], top_b + boxes_b[:, 3]
+
+    horizon = np.minimum(right_b, right_a)
+    horizon -= np.maximum(left_b, left_a)
+    np.maximum(horizon, 0, out=horizon)
+
+    vertical = np.minimum(bottom_b, bottom_a)
+    vertical -= np.maximum(top_b, top_a)
+    np.maximum(vertical, 0, out=vertical)
+
+    intersection = horizon
+    intersection *= vertical
+
+    areas_a = (right_a - left_a) * (bottom_a - top_a)
+    areas_b = (right_b - left_b) * (bottom_b - top_b)
+
+    epsilon = 1e-10
+    union = areas_a + areas_b
+    union -= intersection
+    union += epsilon
+
+    return np.divide(intersection, union, out=union)
+
+
 def fill_dummy_boxes(gt_boxes, num_max_boxes):
 
     dummy_gt_box = [0, 0, 0, 0, -1]
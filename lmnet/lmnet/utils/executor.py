@@ -19,6 +19,8 @@ import tensorflow as tf
 from tensorflow.io import gfile
 
 from lmnet import environment
+from lmnet.common import Tasks
+from lmnet.metrics.mean_average_precision import MeanAveragePrecisionAccumulator
 
 
 def init_logging(config):
@@ -103,6 +105,59 @@ def save_pb_file(sess, output_dir, output_node_names=["output"], pb_name="minima
     return pb_name
 
 
+def prepare_detection_metrics(config, classes, thresholds=(0.3, 0.5, 0.7)):
+    """Create numpy streaming mean average precision accumulators for each overlap threshold.
+
+    They are opt-in by `config.NUMPY_DETECTION_METRICS`, because the network output of every validation batch is
+    fetched and post-processed by `config.POST_PROCESSOR`. This returns None when they are not enabled,
+    the task is not object detection or the config doesn't have the post processor.
+
+    Args:
+        config: config.
+        classes (list): class names.
+        thresholds (tuple): overlap thresholds.
+
+    Returns:
+        dict: overlap threshold and `MeanAveragePrecisionAccumulator`.
+
+    """
+    if not config.get("NUMPY_DETECTION_METRICS", False):
+        return None
+    if config.TASK != Tasks.OBJECT_DETECTION or not config.POST_PROCESSOR:
+        return None
+
+    return {
+        overlap_thresh: MeanAveragePrecisionAccumulator(classes, overlap_thresh=overlap_thresh)
+        for overlap_thresh in thresholds
+    }
+
+
+def update_detection_metrics(detection_metrics, config, output, labels):
+    """Post-process network output of a batch and add the boxes to the accumulators."""
+    predict_boxes = config.POST_PROCESSOR(outputs=output)["outputs"]
+    for accumulator in detection_metrics.values():
+        accumulator.update(predict_boxes, labels)
+
+
+def detection_metrics_summary(detection_metrics):
+    """Return current mean average precisions and the summary of them.
+
+    Returns:
+        dict: metrics name and value.
+        tf.compat.v1.Summary: summary of the values, tags are `numpy_metrics/<metrics name>`.
+
+    """
+    values = {
+        "MeanAveragePrecision_{}".format(overlap_thresh): float(accumulator.result()["MeanAveragePrecision"])
+        for overlap_thresh, accumulator in detection_metrics.items()
+    }
+    summary = tf.compat.v1.Summary(value=[
+        tf.compat.v1.Summary.Value(tag="numpy_metrics/{}".format(key), simple_value=value)
+        for key, value in values.items()
+    ])
+    return values, summary
+
+
 def prepare_metrics(metrics_ops_dict):
     """Create summary_op and placeholders for training metrics.
 
@@ -128,3 +183,68 @@ def prepare_metrics(metrics_ops_dict):
         metrics_summary_op = tf.summary.merge(metrics_summaries)
 
     return metrics_summary_op, metrics_placeholders
+
+
+INPUT_MODES = ["feed_dict", "tf_data"]
+
+
+class InputPipeline:
+    """Input of the graph for each subset of the dataset, which is given by `config.DATASET.INPUT_MODE`.
+
+    - "feed_dict" (default): batches of `DatasetIterator.feed` are fed to the placeholders on every step.
+    - "tf_data": `DatasetIterator` is wrapped as `tf.data.Dataset`, so the graph pulls batches by itself and
+      the next batches are read while the current step runs. Only the iterator handle of the subset is fed.
+
+    Use `images` and `labels` as the input tensors of the model and run the session with `feed_dict(subset)`.
+
+    Args:
+        datasets (dict): subset name and `DatasetIterator`.
+        images_placeholder: images placeholder of the model, which gives the dtype and the shape.
+        labels_placeholder: labels placeholder of the model, which gives the dtype and the shape.
+        input_mode (str): "feed_dict" or "tf_data".
+        prefetch_size (int): only for "tf_data". The number of batches read ahead for each subset.
+
+    """
+
+    def __init__(self, datasets, images_placeholder, labels_placeholder, input_mode="feed_dict", prefetch_size=2):
+        assert input_mode in INPUT_MODES, INPUT_MODES
+        self.datasets = datasets
+        self.input_mode = input_mode
+        self.images_placeholder = images_placeholder
+        self.labels_placeholder = labels_placeholder
+
+        if input_mode == "feed_dict":
+            self.images, self.labels = images_placeholder, labels_placeholder
+            return
+
+        output_types = (images_placeholder.dtype, labels_placeholder.dtype)
+        output_shapes = (images_placeholder.shape, labels_placeholder.shape)
+        with tf.name_scope("input_pipeline"):
+            self.handle_placeholder = tf.compat.v1.placeholder(tf.string, shape=[], name="handle_placeholder")
+            self.string_handles = {
+                subset: tf.compat.v1.data.make_one_shot_iterator(
+                    dataset.as_tf_dataset(output_types, output_shapes, prefetch_size)
+                ).string_handle()
+                for subset, dataset in datasets.items()
+            }
+            iterator = tf.compat.v1.data.Iterator.from_string_handle(
+                self.handle_placeholder, output_types, output_shapes
+            )
+            self.images, self.labels = iterator.get_next()
+        self.handles = None
+
+    def init(self, sess):
+        """Get the iterator handles of the subsets, call this once after the session is created."""
+        if self.input_mode == "tf_data":
+            self.handles = sess.run(self.string_handles)
+
+    def feed_dict(self, subset, feed_dict=None):
+        """Return `feed_dict` for the next batch of `subset`, `feed_dict` is added to it."""
+        feed_dict = dict(feed_dict or {})
+        if self.input_mode == "tf_data":
+            feed_dict[self.handle_placeholder] = self.handles[subset]
+        else:
+            images, labels = self.datasets[subset].feed()
+            feed_dict[self.images_placeholder] = images
+            feed_dict[self.labels_placeholder] = labels
+        return feed_dict
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from lmnet.utils.image import load_image
+
+
+class ImageCache:
+    """Persistent cache of decoded images backed by a preallocated data file.
+
+    Decoded uint8 images are written into `images.bin` and located through a sqlite index `index.sqlite`,
+    both in `cache_dir`. The cache can be shared by the prefetch worker processes and survives between epochs
+    and runs, so `PIL` decode is done only once for each image.
+
+    The data file is split into segments of `segment_bytes`. Images are appended to the current segment and when it
+    is full, the least recently used segment is evicted and reused. So the data file never grows over `max_bytes`.
+
+    Cached images are read from the data file straight into new arrays, so in-place augmentations don't modify
+    the cache and images are not changed when their segment is evicted and reused by other processes later.
+
+    Args:
+        cache_dir (str): directory of the cache files.
+        max_bytes (int): max size of the data file.
+        segment_bytes (int): size of one eviction unit. Images larger than this are not cached.
+        touch_interval (int): the number of reads to batch LRU updates of the index.
+    """
+
+    def __init__(
+            self,
+            cache_dir,
+            max_bytes=8 * 1024 ** 3,
+            segment_bytes=64 * 1024 ** 2,
+            touch_interval=256,
+    ):
+        assert max_bytes >= segment_bytes, "max_bytes should be larger than or equal to segment_bytes."
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.num_segments = max_bytes // segment_bytes
+        self.touch_interval = touch_interval
+
+        self.data_path = os.path.join(cache_dir, "images.bin")
+        self.index_path = os.path.join(cache_dir, "index.sqlite")
+
+        self._pid = None
+        self._connection = None
+        self._data_file = None
+        self._read_lock = None
+        self._touched = set()
+        self._num_reads = 0
+
+        self._setup()
+
+    def __getstate__(self):
+        # sqlite connection, file object and lock can not be shared between processes, they are re-opened lazily.
+        state = self.__dict__.copy()
+        state["_pid"] = None
+        state["_connection"] = None
+        state["_data_file"] = None
+        state["_read_lock"] = None
+        state["_touched"] = set()
+        return state
+
+    def _setup(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if not os.path.exists(self.data_path) or os.path.getsize(self.data_path) != self.max_bytes:
+            with open(self.data_path, "ab") as f:
+                f.truncate(self.max_bytes)
+
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, segment INTEGER, offset INTEGER, shape TEXT, dtype TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS segments "
+                "(id INTEGER PRIMARY KEY, used INTEGER, last_used REAL, generation INTEGER DEFAULT 0)"
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(segments)")]
+            if "generation" not in columns:
+                # the cache was created before segments had the generation.
+                connection.execute("ALTER TABLE segments ADD COLUMN generation INTEGER DEFAULT 0")
+            connection.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER)")
+
+            # the cache was created with larger max_bytes, drop the segments out of the data file.
+            connection.execute("DELETE FROM entries WHERE segment >= ?", (self.num_segments, ))
+            connection.execute("DELETE FROM segments WHERE id >= ?", (self.num_segments, ))
+            connection.executemany(
+                "INSERT OR IGNORE INTO segments (id, used, last_used) VALUES (?, 0, 0)",
+                [(i, ) for i in range(self.num_segments)],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO state (name, value) "
+                "VALUES ('current', COALESCE((SELECT value FROM state WHERE name = 'current' AND value < ?), 0))",
+                (self.num_segments, ),
+            )
+
+    def _connect(self):
+        """Return the sqlite connection and the data file of this process."""
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.index_path, timeout=60, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # unbuffered, `readinto` reads the bytes straight into the given array.
+            self._data_file = open(self.data_path, "r+b", buffering=0)
+            self._read_lock = threading.Lock()
+            self._pid = os.getpid()
+            self._touched = set()
+        return self._connection
+
+    def _touch(self, segment):
+        self._touched.add(segment)
+        self._num_reads += 1
+        if self._num_reads % self.touch_interval == 0:
+            self.flush()
+
+    def flush(self):
+        """Write the batched LRU updates to the index."""
+        if not self._touched:
+            return
+        connection = self._connect()
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "UPDATE segments SET last_used = ? WHERE id = ?", [(now, segment) for segment in self._touched]
+            )
+        self._touched = set()
+
+    def _allocate(self, connection, nbytes):
+        """Reserve `nbytes` in the current segment, evict the least recently used segment when it is full.
+
+        This must be called in a write transaction, which also writes the entry of the reserved bytes.
+        An evicted segment gets a new generation, so that readers can tell its bytes were reused.
+        """
+        segment, = connection.execute("SELECT value FROM state WHERE name = 'current'").fetchone()
+        used, = connection.execute("SELECT used FROM segments WHERE id = ?", (segment, )).fetchone()
+
+        if used + nbytes > self.segment_bytes:
+            segment, = connection.execute("SELECT id FROM segments ORDER BY last_used LIMIT 1").fetchone()
+            connection.execute("DELETE FROM entries WHERE segment = ?", (segment, ))
+            connection.execute("UPDATE segments SET generation = generation + 1 WHERE id = ?", (segment, ))
+            connection.execute("UPDATE state SET value = ? WHERE name = 'current'", (segment, ))
+            used = 0
+
+        connection.execute(
+            "UPDATE segments SET used = ?, last_used = ? WHERE id = ?", (used + nbytes, time.time(), segment)
+        )
+        return segment, segment * self.segment_bytes + used
+
+    def get(self, key):
+        """Return the cached image of `key`, or None when it is not cached."""
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT entries.segment, entries.offset, entries.shape, entries.dtype, segments.generation "
+            "FROM entries JOIN segments ON entries.segment = segments.id WHERE entries.key = ?", (key, )
+        ).fetchone()
+        if row is None:
+            return None
+
+        segment, offset, shape, dtype, generation = row
+        shape = tuple(json.loads(shape))
+        dtype = np.dtype(dtype)
+        image = np.empty(shape, dtype=dtype)
+        # seek and read of the shared file object are not atomic.
+        with self._read_lock:
+            self._data_file.seek(offset)
+            nbytes = self._data_file.readinto(memoryview(image).cast("B"))
+
+        # the segment was evicted while reading, the bytes may belong to another image.
+        current, = connection.execute("SELECT generation FROM segments WHERE id = ?", (segment, )).fetchone()
+        if current != generation or nbytes != image.nbytes:
+            return None
+
+        self._touch(segment)
+        return image
+
+    def put(self, key, image):
+        """Write `image` to the cache. Return False when the image is too large to be cached."""
+        image = np.ascontiguousarray(image)
+        if image.nbytes > self.segment_bytes:
+            return False
+
+        connection = self._connect()
+        # allocate, write and index in one transaction, so no other process evicts the segment in between.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            segment, offset = self._allocate(connection, image.nbytes)
+            os.pwrite(self._data_file.fileno(), image.tobytes(), offset)
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, segment, offset, shape, dtype) VALUES (?, ?, ?, ?, ?)",
+                (key, segment, offset, json.dumps(image.shape), image.dtype.str),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return True
+
+    def load_image(self, filename, convert_rgb=True):
+        """Same as `lmnet.utils.image.load_image` but decoded images are read from and written to the cache."""
+        key = "{}:{}".format(os.path.abspath(filename), "RGB" if convert_rgb else "L")
+        image = self.get(key)
+        if image is None:
+            image = load_image(filename, convert_rgb=convert_rgb)
+            self.put(key, image)
+        return image
+
+    def __len__(self):
+        connection = self._connect()
+        count, = connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return count
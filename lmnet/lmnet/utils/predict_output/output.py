@@ -340,3 +340,247 @@ class ImageFromJson():
             filename_images = self._keypoint_detection(json_results, raw_images, image_files)
 
         return filename_images
+
+
+class BinaryOutput():
+    """Create callable instance to output predictions arrays from post processed tensor(np.ndarray).
+
+    This is a compact alternative of `JsonOutput`. Predictions are kept as columnar arrays instead of json objects,
+    and `dump_binary` writes them with a small JSON manifest into one uncompressed `.npz` container.
+
+    Arrays depend on task type.
+        classification: `probabilities` [N, num_classes] float32.
+        object detection: `boxes` [num_boxes, 6] float32 of (x, y, w, h, class_id, score) in the raw image
+            coordinates, and `box_offsets` [N + 1] int64. Boxes of i-th image are `boxes[offsets[i]:offsets[i + 1]]`.
+        semantic segmentation: `labels` [N, height, width] argmax label maps, and `probabilities`
+            [N, height, width, num_classes] uint8 quantized to [0, 255], in the network output size.
+        keypoint detection: `joints` [N, num_joints, 3] float32 in the raw image coordinates.
+    """
+
+    def __init__(self, task, classes, image_size, data_format, bench=None):
+        assert task in Tasks
+        self.task = task
+        self.classes = classes
+        self.image_size = image_size
+        self.data_format = data_format
+        self.bench = bench if bench else {}
+
+    def _scales(self, raw_image):
+        height_scale = raw_image.shape[0] / self.image_size[0]
+        width_scale = raw_image.shape[1] / self.image_size[1]
+        return height_scale, width_scale
+
+    def _classification(self, outputs, raw_images):
+        outputs = np.asarray(outputs, dtype=np.float32)
+        assert outputs.shape == (len(raw_images), len(self.classes))
+
+        return {"probabilities": outputs}
+
+    def _object_detection(self, outputs, raw_images):
+        all_boxes = []
+        for output, raw_image in zip(outputs, raw_images):
+            height_scale, width_scale = self._scales(raw_image)
+
+            predict_boxes = np.array(output, dtype=np.float32).reshape([-1, 6])
+            predict_boxes[:, :4] *= np.array([width_scale, height_scale, width_scale, height_scale], np.float32)
+            all_boxes.append(predict_boxes)
+
+        box_offsets = np.cumsum([0] + [len(boxes) for boxes in all_boxes], dtype=np.int64)
+        boxes = np.concatenate(all_boxes) if all_boxes else np.zeros([0, 6], np.float32)
+
+        return {"boxes": boxes, "box_offsets": box_offsets}
+
+    def _semantic_segmentation(self, outputs, raw_images):
+        outputs = np.asarray(outputs)
+        if self.data_format == "NCHW":
+            outputs = np.transpose(outputs, [0, 2, 3, 1])
+
+        label_dtype = np.uint8 if len(self.classes) <= 256 else np.int32
+        labels = np.argmax(outputs, axis=3).astype(label_dtype)
+        probabilities = (np.clip(outputs, 0, 1) * 255).astype(np.uint8)
+
+        return {"labels": labels, "probabilities": probabilities}
+
+    def _keypoint_detection(self, outputs, raw_images):
+        all_joints = []
+        for output, raw_image in zip(outputs, raw_images):
+            height_scale, width_scale = self._scales(raw_image)
+
+            joints = np.array(output, dtype=np.float32)
+            joints[:, 0] *= width_scale
+            joints[:, 1] *= height_scale
+            all_joints.append(joints)
+
+        return {"joints": np.stack(all_joints)}
+
+    def __call__(self, outputs, raw_images, image_files):
+        """Output predictions manifest and arrays from post processed tensor(np.ndarray).
+
+        Args:
+            outputs(np.ndarray or list): Post processed tensor.
+            raw_images(list): List of np.ndarray of raw (non pre-processed) images.
+            image_files(list): List of image file paths.
+
+        Returns:
+            dict: manifest, which is small enough to be dumped as JSON.
+            dict: array name and np.ndarray.
+        """
+
+        assert len(outputs) == len(raw_images)
+        assert len(outputs) == len(image_files)
+
+        if self.task == Tasks.CLASSIFICATION:
+
+            arrays = self._classification(outputs, raw_images)
+
+        if self.task == Tasks.OBJECT_DETECTION:
+
+            arrays = self._object_detection(outputs, raw_images)
+
+        if self.task == Tasks.SEMANTIC_SEGMENTATION:
+
+            arrays = self._semantic_segmentation(outputs, raw_images)
+
+        if self.task == Tasks.KEYPOINT_DETECTION:
+
+            arrays = self._keypoint_detection(outputs, raw_images)
+
+        manifest = {
+            "version": 0.2,
+            "task": str(self.task.value),
+            "classes": [{"id": i, "name": class_name} for i, class_name in enumerate(self.classes)],
+            "date": datetime.now().isoformat(),
+            "file_paths": list(image_files),
+            "image_sizes": [list(raw_image.shape[:2]) for raw_image in raw_images],
+            "arrays": sorted(arrays.keys()),
+            "bench": self.bench,
+        }
+
+        return manifest, arrays
+
+
+def dump_binary(filepath, manifest, arrays):
+    """Write manifest and arrays of `BinaryOutput` into one uncompressed `.npz` container.
+
+    The manifest is stored as UTF-8 JSON bytes in the `manifest` entry.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    manifest_bytes = np.frombuffer(json.dumps(manifest).encode("utf-8"), dtype=np.uint8)
+    with open(filepath, "wb") as f:
+        np.savez(f, manifest=manifest_bytes, **arrays)
+
+
+def load_binary(filepath):
+    """Load manifest and arrays written by `dump_binary`."""
+    with np.load(filepath, allow_pickle=False) as data:
+        manifest = json.loads(data["manifest"].tobytes().decode("utf-8"))
+        arrays = {key: data[key] for key in data.files if key != "manifest"}
+    return manifest, arrays
+
+
+class ImageFromArrays():
+    """Create callable instance to return list of tuple (file_name, PIL image object) from predictions arrays.
+
+    It renders the arrays of `BinaryOutput` directly, without a round trip through JSON and encoded masks.
+    """
+
+    def __init__(self, task, classes, image_size):
+        assert task in Tasks
+        self.task = task
+        self.classes = classes
+        self.image_size = image_size
+        self.color_maps = get_color_map(len(classes))
+
+    def _classification(self, arrays, raw_images, image_files):
+        filename_images = []
+        highest_indices = np.argmax(arrays["probabilities"], axis=1)
+
+        for highest_index, raw_image, image_file in zip(highest_indices, raw_images, image_files):
+            class_dir = self.classes[highest_index]
+            base, _ = os.path.splitext(os.path.basename(image_file))
+            filename = os.path.join(class_dir, "{}.png".format(base))
+            image = PIL.Image.fromarray(raw_image)
+
+            filename_images.append((filename, image))
+
+        return filename_images
+
+    def _semantic_segmentation(self, arrays, raw_images, image_files):
+        filename_images = []
+        color_maps = np.array(self.color_maps, dtype=np.uint8)
+
+        for labels, raw_image, image_file in zip(arrays["labels"], raw_images, image_files):
+            base, _ = os.path.splitext(os.path.basename(image_file))
+
+            out_file = os.path.join("mask", "{}.png".format(base))
+            out_overlap_file = os.path.join("overlap", "{}.png".format(base))
+
+            # nearest neighbor resize of the label map to the raw image size.
+            rows = np.arange(raw_image.shape[0]) * labels.shape[0] // raw_image.shape[0]
+            cols = np.arange(raw_image.shape[1]) * labels.shape[1] // raw_image.shape[1]
+            output_image = color_maps[labels[rows[:, np.newaxis], cols]]
+
+            output_pil = PIL.Image.fromarray(output_image)
+            filename_images.append((out_file, output_pil))
+
+            overlap_image = 0.5 * raw_image + output_image * 0.5
+            overlap_image = overlap_image.astype(np.uint8)
+            overlap = PIL.Image.fromarray(overlap_image)
+
+            filename_images.append((out_overlap_file, overlap))
+
+        return filename_images
+
+    def _object_detection(self, arrays, raw_images, image_files):
+        filename_images = []
+        boxes = arrays["boxes"]
+        box_offsets = arrays["box_offsets"]
+
+        for i, (raw_image, image_file) in enumerate(zip(raw_images, image_files)):
+            base, _ = os.path.splitext(os.path.basename(image_file))
+            file_name = "{}.png".format(base)
+
+            image = PIL.Image.fromarray(raw_image)
+            draw = PIL.ImageDraw.Draw(image)
+
+            for box in boxes[box_offsets[i]:box_offsets[i + 1]]:
+                x, y, w, h = [float(value) for value in box[:4]]
+                class_id = int(box[4])
+
+                color = tuple(self.color_maps[class_id % len(self.classes)])
+
+                draw.rectangle([x, y, x + w, y + h], outline=color)
+                txt = "class: {:s}, score: {:.3f}".format(self.classes[class_id], float(box[5]))
+                draw.text([x, y], txt, fill=color)
+
+            filename_images.append((file_name, image))
+
+        return filename_images
+
+    def _keypoint_detection(self, arrays, raw_images, image_files):
+        filename_images = []
+
+        for joints, raw_image, image_file in zip(arrays["joints"], raw_images, image_files):
+            base, _ = os.path.splitext(os.path.basename(image_file))
+            file_name = "{}.png".format(base)
+            image = visualize_keypoint_detection(raw_image, joints.astype(np.int64).astype(np.float64))
+            filename_images.append((file_name, PIL.Image.fromarray(image)))
+
+        return filename_images
+
+    def __call__(self, arrays, raw_images, image_files):
+        assert len(raw_images) == len(image_files)
+
+        if self.task == Tasks.CLASSIFICATION:
+            filename_images = self._classification(arrays, raw_images, image_files)
+
+        if self.task == Tasks.SEMANTIC_SEGMENTATION:
+            filename_images = self._semantic_segmentation(arrays, raw_images, image_files)
+
+        if self.task == Tasks.OBJECT_DETECTION:
+            filename_images = self._object_detection(arrays, raw_images, image_files)
+
+        if self.task == Tasks.KEYPOINT_DETECTION:
+            filename_images = self._keypoint_detection(arrays, raw_images, image_files)
+
+        return filename_images
@@ -3,20 +3,32 @@ import os
 
 import numpy as np
 
+from lmnet.utils.predict_output.output import BinaryOutput
+from lmnet.utils.predict_output.output import ImageFromArrays
 from lmnet.utils.predict_output.output import ImageFromJson
 from lmnet.utils.predict_output.output import JsonOutput
+from lmnet.utils.predict_output.output import dump_binary
 
 logger = logging.getLogger(__name__)
 
 
 class OutputWriter():
-    def __init__(self, task, classes, image_size, data_format):
+    def __init__(self, task, classes, image_size, data_format, output_format="json"):
+        """
+        Args:
+            output_format (str): "json" saves numpy array and JSON.
+                "binary" saves a `.npz` container of `BinaryOutput` instead, and renders images from its arrays.
+        """
+        assert output_format in ("json", "binary")
+        self.output_format = output_format
         self.json_output = JsonOutput(task, classes, image_size, data_format)
         self.image_from_json = ImageFromJson(task, classes, image_size)
+        self.binary_output = BinaryOutput(task, classes, image_size, data_format)
+        self.image_from_arrays = ImageFromArrays(task, classes, image_size)
 
     def write(self, dest, outputs, raw_images, image_files, step, save_material=True):
         """Save predict output to disk.
-           numpy array, JSON, and images if you want.
+           numpy array and JSON, or binary container, and images if you want.
 
         Args:
             dest (str): path to save file
@@ -26,6 +38,15 @@ class OutputWriter():
             step (int): value of training step
             save_material (bool, optional): save materials or not. Defaults to True.
         """
+        if self.output_format == "binary":
+            manifest, arrays = self.binary_output(outputs, raw_images, image_files)
+            save_binary(dest, manifest, arrays, step)
+
+            if save_material:
+                materials = self.image_from_arrays(arrays, raw_images, image_files)
+                save_materials(dest, materials, step)
+            return
+
         save_npy(dest, outputs, step)
 
         json = self.json_output(outputs, raw_images, image_files)
@@ -83,6 +104,28 @@ def save_json(dest, json, step):
     logger.info("save json: {}".format(filepath))
 
 
+def save_binary(dest, manifest, arrays, step):
+    """Save binary container of predictions to disk.
+
+    Args:
+        dest (str): path to save file
+        manifest (dict): manifest of `BinaryOutput`
+        arrays (dict): arrays of `BinaryOutput`
+        step (int): value of training step
+
+    Raises:
+        PermissionError: If dest dir has no permission to write.
+        ValueError: If type of step is not int.
+    """
+    if type(step) is not int:
+        raise ValueError("step must be integer.")
+
+    filepath = os.path.join(dest, "binary", "{}.npz".format(step))
+    dump_binary(filepath, manifest, arrays)
+
+    logger.info("save binary: {}".format(filepath))
+
+
 def save_materials(dest, materials, step):
     """Save materials to disk.
 
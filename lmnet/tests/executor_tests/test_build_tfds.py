@@ -155,3 +155,31 @@ def test_build_tfds_object_detection():
         assert labels.shape[0] == config.BATCH_SIZE
         assert labels.shape[1] == num_max_boxes
         assert labels.shape[2] == 5
+
+
+@pytest.mark.parametrize("config_file, dataset_class", [
+    ("tests/fixtures/configs/for_build_tfds_classification.py", TFDSClassification),
+    ("tests/fixtures/configs/for_build_tfds_object_detection.py", TFDSObjectDetection),
+])
+def test_tfds_tf_data_prefetch(config_file, dataset_class):
+    environment.setup_test_environment()
+    run(config_file, overwrite=True)
+    config = config_util.load(config_file)
+
+    dataset = dataset_class(subset="train",
+                            batch_size=config.BATCH_SIZE,
+                            augmentor=config.DATASET.AUGMENTOR,
+                            pre_processor=config.PRE_PROCESSOR,
+                            **config.DATASET.TFDS_KWARGS)
+    train_dataset = DatasetIterator(dataset, seed=0, enable_prefetch=True, prefetch_kwargs={"engine": "tf_data"})
+
+    for _ in range(3):
+        images, labels = train_dataset.feed()
+
+        assert isinstance(images, np.ndarray)
+        assert images.shape == (config.BATCH_SIZE, config.IMAGE_SIZE[0], config.IMAGE_SIZE[1], 3)
+        # PerImageStandardization is applied to each image
+        assert np.allclose(images.mean(axis=(1, 2, 3)), 0, atol=1e-4)
+
+        assert isinstance(labels, np.ndarray)
+        assert labels.shape[0] == config.BATCH_SIZE
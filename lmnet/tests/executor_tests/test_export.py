@@ -13,9 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import json
+import os
+import zipfile
+from types import SimpleNamespace
+
+import numpy as np
 import pytest
 
-from executor.export import run
+from executor.export import _capture_operation_outputs, _capture_targets, run
 from executor.train import run as train_run
 from lmnet.environment import setup_test_environment
 
@@ -35,6 +41,75 @@ def test_export():
     run(expriment_id, None, (None, None), [], None)
 
 
+class _Session(object):
+    """Session which returns arange of the given tensors and counts the runs."""
+
+    def __init__(self):
+        self.num_runs = 0
+
+    def run(self, fetches, feed_dict=None):
+        self.num_runs += 1
+        return [np.arange(len(name)).reshape([1, -1]) for name in fetches]
+
+
+def _operation(name, op_type, num_outputs=1):
+    outputs = [SimpleNamespace(name="{}:{}".format(name, i)) for i in range(num_outputs)]
+    return SimpleNamespace(name=name, type=op_type, outputs=outputs)
+
+
+def test_capture_targets():
+    all_ops = [
+        _operation("images_placeholder", "Placeholder"),
+        _operation("block_1/conv", "Conv2D"),
+        _operation("block_1/split", "Split", num_outputs=2),
+        _operation("block_2/conv", "Conv2D"),
+    ]
+
+    targets = _capture_targets(all_ops)
+    assert [name for name, _ in targets] == [
+        "000_images_placeholder:0", "001_block_1_conv:0", "002_block_1_split:0", "003_block_1_split:1",
+        "004_block_2_conv:0",
+    ]
+
+    # indices are kept with the filters
+    assert _capture_targets(all_ops, op_types=["Conv2D"]) == [
+        ("001_block_1_conv:0", "block_1/conv:0"), ("004_block_2_conv:0", "block_2/conv:0"),
+    ]
+    assert _capture_targets(all_ops, name_pattern="^block_1/", op_types=["Split"]) == [
+        ("002_block_1_split:0", "block_1/split:0"), ("003_block_1_split:1", "block_1/split:1"),
+    ]
+
+
+@pytest.mark.parametrize("chunk_size, num_runs", [(0, 1), (2, 3)])
+def test_capture_operation_outputs(tmpdir, chunk_size, num_runs):
+    targets = [("{:03d}_op_{}:0".format(i, i), "op/{}:0".format("x" * i)) for i in range(1, 6)]
+    sess = _Session()
+
+    _capture_operation_outputs(sess, {}, targets, str(tmpdir), chunk_size=chunk_size)
+
+    assert sess.num_runs == num_runs
+    for name, tensor_name in targets:
+        value = np.load(os.path.join(str(tmpdir), "{}.npy".format(name)))
+        assert np.array_equal(value, np.arange(len(tensor_name)).reshape([1, -1]))
+
+
+def test_capture_operation_outputs_archive(tmpdir):
+    targets = [("{:03d}_op_{}:0".format(i, i), "op/{}:0".format("x" * i)) for i in range(1, 6)]
+
+    _capture_operation_outputs(_Session(), {}, targets, str(tmpdir), chunk_size=2, capture_format="archive")
+
+    archive_path = os.path.join(str(tmpdir), "activations.npz")
+    with zipfile.ZipFile(archive_path) as archive:
+        index = json.loads(archive.read("index.json").decode())
+    assert [entry["name"] for entry in index] == [name for name, _ in targets]
+
+    with np.load(archive_path) as archive:
+        for (name, tensor_name), entry in zip(targets, index):
+            value = archive[name]
+            assert list(value.shape) == entry["shape"]
+            assert np.array_equal(value, np.arange(len(tensor_name)).reshape([1, -1]))
+
+
 if __name__ == '__main__':
     setup_test_environment()
     test_export()
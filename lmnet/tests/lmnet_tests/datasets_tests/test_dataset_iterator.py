@@ -13,10 +13,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import random
+
 import numpy as np
 import pytest
+import tensorflow as tf
 
-from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.data_augmentor import FlipLeftRight, FlipTopBottom, SSDRandomCrop
+from lmnet.data_processor import Sequence
+from lmnet.datasets.base import ObjectDetectionBase
+from lmnet.datasets.dataset_iterator import DatasetIterator, _GraphAugmentation
 from lmnet.datasets.image_folder import ImageFolderBase
 
 # Apply set_test_environment() in conftest.py to all tests in this file.
@@ -63,8 +69,164 @@ def test_dataset_iterator_batch_order():
         assert np.all(labels == prefetch_labels)
 
 
+def test_dataset_iterator_shared_memory_prefetch():
+    """Assert that shared memory prefetch gives same data as simple reader and reports its throughput."""
+
+    batch_size = 8
+    dataset = Dummy(subset="train", batch_size=batch_size)
+    dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=False)
+    prefetch_kwargs = {"engine": "shared_memory", "num_workers": 3, "queue_size": 4, "num_in_flight": 2}
+    prefetch_dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=True,
+                                                prefetch_kwargs=prefetch_kwargs)
+
+    for i in range(0, 30):
+        images, labels = next(dataset_iterator)
+        prefetch_images, prefetch_labels = next(prefetch_dataset_iterator)
+
+        assert np.all(images == prefetch_images)
+        assert np.all(labels == prefetch_labels)
+
+    stats = prefetch_dataset_iterator.prefetch_stats()
+    assert stats["samples_per_sec"] > 0
+    assert stats["queue_capacity"] == 4
+    assert 0 <= stats["queue_size"] <= 4
+    assert dataset_iterator.prefetch_stats() is None
+
+    prefetch_dataset_iterator.close()
+
+
+def test_dataset_iterator_streaming_prefetch():
+    """Assert that ordered streaming prefetch gives same data as simple reader."""
+
+    batch_size = 8
+    dataset = Dummy(subset="train", batch_size=batch_size)
+    dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=False)
+    prefetch_kwargs = {"engine": "streaming", "num_workers": 3, "num_in_flight": 3}
+    prefetch_dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=True,
+                                                prefetch_kwargs=prefetch_kwargs)
+
+    for i in range(0, 30):
+        images, labels = next(dataset_iterator)
+        prefetch_images, prefetch_labels = next(prefetch_dataset_iterator)
+
+        assert np.all(images == prefetch_images)
+        assert np.all(labels == prefetch_labels)
+
+    prefetch_dataset_iterator.close()
+
+
+def test_dataset_iterator_unordered_streaming_prefetch():
+    batch_size = 8
+    dataset = Dummy(subset="train", batch_size=batch_size)
+    prefetch_kwargs = {"engine": "streaming", "num_workers": 3, "num_in_flight": 3, "ordered": False}
+    prefetch_dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=True,
+                                                prefetch_kwargs=prefetch_kwargs)
+
+    for i in range(0, 10):
+        images, labels = next(prefetch_dataset_iterator)
+        assert images.shape[0] == batch_size
+        assert labels.shape[0] == batch_size
+
+    prefetch_dataset_iterator.close()
+
+
+class BrokenDummy(Dummy):
+    """Only the first sample can be read, which the shared memory engine reads in the main process."""
+
+    def __getitem__(self, i):
+        if i != 0:
+            raise ValueError("broken sample {}".format(i))
+        return super().__getitem__(i)
+
+
+@pytest.mark.parametrize("engine", ["pool", "streaming", "shared_memory"])
+def test_dataset_iterator_prefetch_error(engine):
+    """Assert that an error in the prefetch workers is raised to the trainer instead of blocking it."""
+
+    dataset = BrokenDummy(subset="train", batch_size=8)
+    prefetch_kwargs = {"engine": engine, "num_workers": 2, "num_in_flight": 2}
+    prefetch_dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=True,
+                                                prefetch_kwargs=prefetch_kwargs)
+
+    with pytest.raises(Exception, match="broken sample"):
+        next(prefetch_dataset_iterator)
+    # the following calls also fail.
+    with pytest.raises(Exception, match="broken sample"):
+        next(prefetch_dataset_iterator)
+
+    prefetch_dataset_iterator.close()
+
+
+class DummyObjectDetection(ObjectDetectionBase):
+    """Only holds the processors, which `_GraphAugmentation` reads."""
+
+    classes = ["a", "b"]
+    num_classes = 2
+    extend_dir = None
+    available_subsets = ["train", "validation"]
+    num_max_boxes = 4
+
+    @classmethod
+    def count_max_boxes(cls):
+        return cls.num_max_boxes
+
+    @property
+    def num_per_epoch(self):
+        return 0
+
+    def __getitem__(self, i, type=None):
+        raise NotImplementedError()
+
+    def __len__(self):
+        return 0
+
+
+def test_graph_augmentation_crop_before_flip():
+    """Assert that flips after a crop in `tf.py_function` use the size of each cropped image, not of the sample."""
+
+    random.seed(0)
+    tf.compat.v1.set_random_seed(0)
+
+    # boxes of [x, y, w, h, class_id] padded by dummy boxes, and the pixels of each box are painted with its class.
+    gt_boxes = np.array([[4, 6, 10, 12, 0], [30, 20, 16, 24, 1], [0, 0, 0, 0, -1], [0, 0, 0, 0, -1]], np.int64)
+    image = np.zeros([64, 64, 3], np.uint8)
+    for x, y, w, h, class_id in gt_boxes[:2]:
+        image[y:y + h, x:x + w] = class_id + 1
+
+    # the flips with probability 0.0 always flip.
+    augmentor = Sequence([SSDRandomCrop(), FlipLeftRight(probability=0.0), FlipTopBottom(probability=0.0)])
+    dataset = DummyObjectDetection(subset="train", augmentor=augmentor)
+    augmentation = _GraphAugmentation(dataset, image, gt_boxes)
+
+    tf_dataset = tf.data.Dataset.from_tensors({"image": image, "label": gt_boxes}).repeat(30).map(augmentation)
+    next_sample = tf.compat.v1.data.make_one_shot_iterator(tf_dataset).get_next()
+
+    sizes = set()
+    with tf.compat.v1.Session() as sess:
+        for _ in range(30):
+            augmented_image, augmented_boxes = sess.run(next_sample)
+            sizes.add(augmented_image.shape)
+
+            assert augmented_boxes.shape == (4, 5)
+            for x, y, w, h, class_id in augmented_boxes:
+                if class_id < 0:
+                    continue
+                assert w > 0 and h > 0
+                assert 0 <= x and x + w <= augmented_image.shape[1]
+                assert 0 <= y and y + h <= augmented_image.shape[0]
+                assert np.all(augmented_image[y:y + h, x:x + w] == class_id + 1)
+
+    # the images are cropped to various sizes.
+    assert len(sizes) > 1
+
+
 if __name__ == '__main__':
     from lmnet import environment
     environment.setup_test_environment()
     test_dataset_iterator_batch_size()
     test_dataset_iterator_batch_order()
+    test_dataset_iterator_shared_memory_prefetch()
+    test_dataset_iterator_streaming_prefetch()
+    test_dataset_iterator_unordered_streaming_prefetch()
+    test_dataset_iterator_prefetch_error("shared_memory")
+    test_graph_augmentation_crop_before_flip()
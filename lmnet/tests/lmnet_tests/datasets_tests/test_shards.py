@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+
+import numpy as np
+import pytest
+
+from lmnet.datasets.dataset_iterator import DatasetIterator, _ShardReader
+from lmnet.datasets.delta_mark import ObjectDetectionBase
+from lmnet.datasets.image_folder import ImageFolderBase
+from lmnet.datasets.shards import (
+    ShardClassification,
+    ShardObjectDetection,
+    shard_dataset_class,
+    write_shards,
+)
+from lmnet.pre_processor import ResizeWithGtBoxes
+
+# Apply set_test_environment() in conftest.py to all tests in this file.
+pytestmark = pytest.mark.usefixtures("set_test_environment")
+
+
+class DummyClassification(ImageFolderBase):
+    extend_dir = "dummy_classification"
+
+
+class DummyObjectDetection(ObjectDetectionBase):
+    extend_dir = "custom_delta_mark_object_detection/for_train"
+    validation_extend_dir = "custom_delta_mark_object_detection/for_validation"
+
+
+def test_shard_classification(tmpdir):
+    dataset = DummyClassification(subset="train", batch_size=1)
+    num_records = write_shards(dataset, os.path.join(str(tmpdir), "train"), shard_bytes=1)
+
+    assert num_records == len(dataset)
+    assert shard_dataset_class(DummyClassification) is ShardClassification
+
+    shard_dataset = ShardClassification(subset="train", batch_size=1, shard_dir=str(tmpdir))
+    assert len(shard_dataset) == len(dataset)
+    assert shard_dataset.classes == dataset.classes
+    assert shard_dataset.meta["num_shards"] == len(dataset)
+
+    for i in range(len(dataset)):
+        image, label = dataset[i]
+        shard_image, shard_label = shard_dataset[i]
+
+        assert np.all(image == shard_image)
+        assert np.all(label == shard_label)
+
+    # shuffled streaming read yields every sample once.
+    labels = [label.argmax() for _, label in shard_dataset.iterate(seed=0, shuffle_buffer_size=2)]
+    expected = [dataset[i][1].argmax() for i in range(len(dataset))]
+    assert sorted(labels) == sorted(expected)
+
+    # without the prefetch, the iterator reads the shards sequentially and yields every sample once in an epoch.
+    dataset_iterator = DatasetIterator(shard_dataset, seed=0)
+    assert isinstance(dataset_iterator.reader, _ShardReader)
+    labels = [dataset_iterator.feed()[1][0].argmax() for _ in range(len(dataset))]
+    assert sorted(labels) == sorted(expected)
+
+
+def test_shard_object_detection(tmpdir):
+    batch_size = 2
+    image_size = [128, 160]
+    dataset = DummyObjectDetection(subset="train", batch_size=batch_size)
+    write_shards(dataset, os.path.join(str(tmpdir), "train"))
+
+    assert shard_dataset_class(DummyObjectDetection) is ShardObjectDetection
+
+    shard_dataset = ShardObjectDetection(subset="train", batch_size=batch_size, shard_dir=str(tmpdir),
+                                         pre_processor=ResizeWithGtBoxes(image_size))
+    assert shard_dataset.num_max_boxes == dataset.num_max_boxes
+    assert ShardObjectDetection.count_max_boxes(str(tmpdir)) == dataset.num_max_boxes
+
+    for i in range(len(dataset)):
+        image, gt_boxes = dataset[i]
+        shard_image, shard_gt_boxes = shard_dataset[i]
+
+        assert np.all(image == shard_image)
+        assert np.all(gt_boxes == shard_gt_boxes)
+
+    dataset_iterator = DatasetIterator(shard_dataset, seed=0)
+    for _ in range(3):
+        images, labels = dataset_iterator.feed()
+
+        assert images.shape == (batch_size, image_size[0], image_size[1], 3)
+        assert labels.shape == (batch_size, dataset.num_max_boxes, 5)
+
+
+def test_shard_directory_not_exists(tmpdir):
+    with pytest.raises(ValueError):
+        ShardClassification(subset="train", batch_size=1, shard_dir=str(tmpdir))
@@ -15,11 +15,14 @@
 # =============================================================================
 
 import numpy as np
+import pytest
 import tensorflow as tf
 
 from lmnet.metrics.mean_average_precision import (
     _mean_average_precision,
     _calc_average_precision,
+    MeanAveragePrecisionAccumulator,
+    mean_average_precision,
     _average_precision,
     tp_fp_in_the_image,
     average_precision,
@@ -209,6 +212,72 @@ def test_mean_average_precision():
     assert np.allclose(result['OrderedRecall'], expected['OrderedRecall'])
 
 
+def _random_boxes(num_images, num_classes, rng):
+    all_gt_boxes = []
+    all_predict_boxes = []
+    for _ in range(num_images):
+        num_gt_boxes = rng.randint(0, 8)
+        gt_boxes = np.concatenate([
+            rng.randint(0, 300, size=(num_gt_boxes, 2)),
+            rng.randint(5, 80, size=(num_gt_boxes, 2)),
+            rng.randint(0, num_classes, size=(num_gt_boxes, 1)),
+        ], axis=1)
+        # dummy boxes
+        gt_boxes = np.concatenate([gt_boxes, [[0, 0, 0, 0, -1]] * (8 - num_gt_boxes)])
+        all_gt_boxes.append(gt_boxes)
+
+        # predicted boxes around the ground truth, with tied scores.
+        num_pred_boxes = rng.randint(0, 30)
+        pred_boxes = np.concatenate([
+            gt_boxes[rng.randint(0, len(gt_boxes), size=num_pred_boxes), :4] + rng.normal(0, 8, (num_pred_boxes, 4)),
+            rng.randint(0, num_classes, size=(num_pred_boxes, 1)),
+            rng.choice([0.2, 0.5, 0.8], size=(num_pred_boxes, 1)) + rng.randint(0, 2, size=(num_pred_boxes, 1)) * 0.01,
+        ], axis=1)
+        all_predict_boxes.append(pred_boxes)
+
+    return all_predict_boxes, np.array(all_gt_boxes)
+
+
+@pytest.mark.parametrize("num_workers", [None, 2])
+def test_vectorized_mean_average_precision(num_workers):
+    classes = ["class_{}".format(i) for i in range(5)]
+    all_boxes, gt_boxes = _random_boxes(50, len(classes), np.random.RandomState(0))
+
+    expected = _mean_average_precision(all_boxes, gt_boxes, classes)
+    result = mean_average_precision(all_boxes, gt_boxes, classes, num_workers=num_workers)
+
+    assert result["MeanAveragePrecision"] == expected["MeanAveragePrecision"]
+    for key in ["AveragePrecision", "Precision", "Recall", "OrderedPrecision", "OrderedRecall"]:
+        assert len(result[key]) == len(classes)
+        for value, expected_value in zip(result[key], expected[key]):
+            assert np.array_equal(value, expected_value), key
+
+
+def test_mean_average_precision_accumulator():
+    classes = ["class_{}".format(i) for i in range(5)]
+    all_boxes, gt_boxes = _random_boxes(50, len(classes), np.random.RandomState(0))
+    batch_size = 8
+
+    accumulator = MeanAveragePrecisionAccumulator(classes)
+    for start in range(0, len(all_boxes), batch_size):
+        accumulator.update(all_boxes[start:start + batch_size], gt_boxes[start:start + batch_size])
+
+        # the result can be taken at any point of the stream.
+        end = start + batch_size
+        expected = _mean_average_precision(all_boxes[:end], gt_boxes[:end], classes)
+        result = accumulator.result()
+
+        assert accumulator.num_images == min(end, len(all_boxes))
+        assert result["MeanAveragePrecision"] == expected["MeanAveragePrecision"]
+        for key in ["AveragePrecision", "Precision", "Recall", "OrderedPrecision", "OrderedRecall"]:
+            for value, expected_value in zip(result[key], expected[key]):
+                assert np.array_equal(value, expected_value), key
+
+    accumulator.reset()
+    assert accumulator.num_images == 0
+    assert accumulator.result()["MeanAveragePrecision"] == 0
+
+
 def _tf_mean_average_precision(classes, gt_boxes, all_boxes, expected):
     graph = tf.Graph()
     with graph.as_default():
@@ -520,5 +589,8 @@ def test_average_precision():
 
 if __name__ == '__main__':
     test_mean_average_precision()
+    test_vectorized_mean_average_precision(num_workers=None)
+    test_vectorized_mean_average_precision(num_workers=2)
+    test_mean_average_precision_accumulator()
     test_tf_mean_average_precision()
     test_average_precision()
@@ -609,6 +609,79 @@ def test_calculate_truth_and_masks():
     assert np.all(coordinate_masks_val == expected_object_masks)
 
 
+def test_calculate_truth_and_masks_same_cell():
+    """Test that the last gt box is assigned when gt boxes have the same cell and anchor."""
+    model = YoloV2(
+        anchors=[(1.0, 1.0), (1.5, 1.5)],
+        image_size=[128, 256],
+        batch_size=1,
+        num_max_boxes=3,
+        loss_warmup_steps=0,
+    )
+
+    gt_boxes_list = tf.convert_to_tensor([
+        [
+            [33, 43, 64, 50, 3],
+            [34, 44, 60, 48, 1],
+            [0, 0, 0, 0, -1],
+        ],
+    ], dtype=tf.float32)
+    predict_boxes = tf.zeros([1, 4, 8, 2, 4], dtype=tf.float32)
+    cell_gt_boxes, truth_confidence, object_masks, coordinate_masks =\
+        model.loss_function._calculate_truth_and_masks(gt_boxes_list, predict_boxes, global_step=0)
+
+    sess = tf.InteractiveSession()
+    cell_gt_boxes_val, object_masks_val = sess.run([cell_gt_boxes, object_masks])
+
+    assert np.sum(object_masks_val) == 1
+    assert np.all(cell_gt_boxes_val[0, 1, 1, 1] == [34, 44, 60, 48, 1])
+
+
+def test_iou_gt_boxes():
+    """Test that the best ious are the same as the ious calculated with each gt box."""
+    model = YoloV2(
+        anchors=[(1.0, 1.0), (1.5, 1.5)],
+        image_size=[128, 256],
+        batch_size=2,
+        num_max_boxes=4,
+    )
+    loss_function = model.loss_function
+
+    rng = np.random.RandomState(0)
+    boxes = np.concatenate([
+        rng.uniform(0, 128, size=(2, 4, 8, 2, 2)),
+        rng.uniform(8, 64, size=(2, 4, 8, 2, 2)),
+    ], axis=4).astype(np.float32)
+    gt_boxes_list = np.array([
+        [
+            [33, 43, 64, 50, 3],
+            [113, 62, 36, 26, 1],
+            [0, 0, 0, 0, -1],
+            [173, 53, 30, 32, 2],
+        ],
+        [
+            [130, 67, 32, 22, 1],
+            [0, 0, 0, 0, -1],
+            [0, 0, 0, 0, -1],
+            [0, 0, 0, 0, -1],
+        ],
+    ], dtype=np.float32)
+
+    expected = np.zeros((2, 4, 8, 2), dtype=np.float32)
+    for batch_index, gt_boxes in enumerate(gt_boxes_list):
+        for gt_box in gt_boxes[gt_boxes[:, 4] != -1]:
+            iou = loss_function._iou_per_gtbox(boxes[batch_index], gt_box[0:4])
+            expected[batch_index] = np.maximum(expected[batch_index], iou)
+
+    ious = loss_function._iou_gt_boxes(tf.constant(boxes), tf.constant(gt_boxes_list))
+
+    sess = tf.InteractiveSession()
+    ious_val = sess.run(ious)
+
+    assert np.any(ious_val > 0)
+    assert np.allclose(ious_val, expected)
+
+
 def test_convert_boxes_space_inverse():
     """Test from_real_to_yolo is inverse function of from_yolo_to_real."""
     model = YoloV2(
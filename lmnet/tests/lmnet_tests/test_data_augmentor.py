@@ -37,6 +37,7 @@ from lmnet.data_augmentor import (
     FlipTopBottom,
     Hue,
     Pad,
+    RandomErasing,
     RandomPatchCut,
     SSDRandomCrop
 )
@@ -359,6 +360,79 @@ def test_crop_boxes():
         cropped = crop_boxes(boxes, crop_rect)
 
 
+def _batch_images():
+    image = _image()
+    return np.stack([image, image[::-1], image[:, ::-1]])
+
+
+def test_batch_enhance():
+    """Assert that vectorized batch path gives same images as PIL path."""
+    images = _batch_images()
+
+    for augmentor in [Brightness(1.3), Color(0.4), Contrast(1.7), Hue((7.5, 7.5)), Hue((-100, -100))]:
+        assert augmentor.supports_batch
+
+        result = augmentor.process_batch(image=images)['image']
+        expected = np.stack([augmentor(image=image)['image'] for image in images])
+
+        assert result.dtype == np.uint8
+        assert np.all(result == expected)
+
+
+def test_batch_flip():
+    images = _batch_images()
+    masks = images[..., 0]
+    gt_boxes = np.array([[[10, 20, 30, 40, 1], [0, 0, 0, 0, -1]]] * len(images))
+
+    # random.random() > -1 is always true, so all the samples are flipped.
+    for augmentor in [FlipLeftRight(-1), FlipTopBottom(-1)]:
+        result = augmentor.process_batch(image=images, mask=masks, gt_boxes=gt_boxes)
+        for i in range(len(images)):
+            expected = augmentor(image=images[i], mask=masks[i], gt_boxes=gt_boxes[i].copy())
+
+            assert np.all(result['image'][i] == expected['image'])
+            assert np.all(result['mask'][i] == expected['mask'])
+            assert np.all(result['gt_boxes'][i] == expected['gt_boxes'])
+
+    # random.random() > 1 is never true.
+    result = FlipLeftRight(1).process_batch(image=images, gt_boxes=gt_boxes)
+    assert np.all(result['image'] == images)
+    assert np.all(result['gt_boxes'] == gt_boxes)
+
+
+def test_batch_random_patch_cut_and_erasing():
+    images = _batch_images()
+
+    result = RandomPatchCut(num_patch=10, max_size=10, square=False).process_batch(image=images)['image']
+    assert result.shape == images.shape
+    assert np.any(result != images)
+
+    result = RandomErasing(probability=1.0).process_batch(image=images)['image']
+    assert result.shape == images.shape
+    for image, erased in zip(images, result):
+        changed = np.any(image != erased, axis=2)
+        assert changed.any()
+        assert np.all(erased[changed] == [125, 122, 114])
+
+
+def test_sequence_process_batch():
+    images = _batch_images()
+    gt_boxes = np.array([[[10, 20, 30, 40, 1]]] * len(images))
+
+    augmentor = Sequence([FlipLeftRight(), Brightness(), Hue()])
+    assert augmentor.supports_batch
+    result = augmentor.process_batch(image=images, gt_boxes=gt_boxes)
+    assert result['image'].shape == images.shape
+    assert result['gt_boxes'].shape == gt_boxes.shape
+
+    # Blur doesn't support the batch path, fall back to each sample.
+    augmentor = Sequence([FlipLeftRight(), Blur()])
+    assert not augmentor.supports_batch
+    result = augmentor.process_batch(image=images, gt_boxes=gt_boxes)
+    assert result['image'].shape == images.shape
+    assert result['gt_boxes'].shape == gt_boxes.shape
+
+
 if __name__ == '__main__':
     test_sequence()
     test_blur()
@@ -374,3 +448,7 @@ if __name__ == '__main__':
     test_ssd_random_crop()
     test_iou()
     test_crop_boxes()
+    test_batch_enhance()
+    test_batch_flip()
+    test_batch_random_patch_cut_and_erasing()
+    test_sequence_process_batch()
@@ -25,6 +25,7 @@ from lmnet.post_processor import (
     Bilinear,
     GaussianHeatmapToJoints
 )
+from lmnet.utils.box import iou
 
 # Apply reset_default_graph() in conftest.py to all tests in this file.
 pytestmark = pytest.mark.usefixtures("reset_default_graph")
@@ -54,6 +55,87 @@ def test_format_yolov2_shape():
     assert expected_shape == y.shape
 
 
+@pytest.mark.parametrize("data_format", ["NHWC", "NCHW"])
+def test_format_yolov2_score_threshold(data_format):
+    image_size = [128, 96]
+    batch_size = 3
+    classes = range(8)
+    anchors = [(0.1, 0.2), (1.2, 1.1)]
+    score_threshold = 0.2
+
+    post_process = FormatYoloV2(
+        image_size=image_size,
+        classes=classes,
+        anchors=anchors,
+        data_format=data_format,
+    )
+    threshold_post_process = FormatYoloV2(
+        image_size=image_size,
+        classes=classes,
+        anchors=anchors,
+        data_format=data_format,
+        score_threshold=score_threshold,
+    )
+
+    if data_format == "NCHW":
+        shape = (batch_size, len(anchors) * (len(classes) + 5), image_size[0]//32, image_size[1]//32)
+    else:
+        shape = (batch_size, image_size[0]//32, image_size[1]//32, len(anchors) * (len(classes) + 5))
+    output = np.random.uniform(-2., 2., size=shape).astype(np.float32)
+
+    expected_ys = ExcludeLowScoreBox(threshold=score_threshold)(post_process(output)["outputs"])["outputs"]
+    ys = threshold_post_process(output)["outputs"]
+
+    assert len(ys) == batch_size
+    for expected_y, y in zip(expected_ys, ys):
+        assert expected_y.shape == y.shape
+        assert np.allclose(expected_y, y)
+
+    # results kept from a previous call are not overwritten by the next call.
+    first = post_process(output)["outputs"]
+    expected_first = first.copy()
+    second = post_process(np.random.uniform(-2., 2., size=shape).astype(np.float32))["outputs"]
+    assert not np.shares_memory(first, second)
+    assert np.array_equal(first, expected_first)
+
+    # intermediate buffers are reused but not a part of the processor settings.
+    assert "_buffers" in post_process.__dict__
+    assert "_buffers" not in post_process.__reduce_ex__(4)[2]
+
+
+def _restore_processor(cls, settings):
+    """Restore a processor in the same way as `build_post_process` of the output template for meta.yaml."""
+    processor = cls.__new__(cls)
+    processor.__dict__.update(settings)
+    return processor
+
+
+def test_format_yolov2_restored_from_old_settings():
+    """FormatYoloV2 restored from meta.yaml of the versions without `score_threshold` decodes all the boxes."""
+    image_size = [128, 96]
+    classes = range(8)
+    anchors = [(0.1, 0.2), (1.2, 1.1)]
+
+    post_process = FormatYoloV2(
+        image_size=image_size,
+        classes=classes,
+        anchors=anchors,
+        data_format="NHWC",
+    )
+    restored_post_process = _restore_processor(FormatYoloV2, {
+        "image_size": image_size,
+        "num_classes": len(classes),
+        "anchors": anchors,
+        "boxes_per_cell": len(anchors),
+        "data_format": "NHWC",
+    })
+
+    shape = (2, image_size[0]//32, image_size[1]//32, len(anchors) * (len(classes) + 5))
+    output = np.random.uniform(-2., 2., size=shape).astype(np.float32)
+
+    assert np.allclose(post_process(output)["outputs"], restored_post_process(output)["outputs"])
+
+
 def test_exclude_low_score_box():
     threshold = 0.35
     inputs = np.array([
@@ -246,6 +328,128 @@ def test_nms_max_output_size():
         assert np.allclose(expected_y, y), (expected_y, y)
 
 
+def _loop_nms(boxes, iou_threshold, max_output_size):
+    """NMS which calculates IoU box by box, for comparison."""
+    order_indices = np.argsort(-boxes[:, 5], kind="mergesort")
+    keep_indices = []
+    while order_indices.size > 0:
+        i = order_indices[0]
+        keep_indices.append(i)
+        ious = iou(boxes[order_indices[1:], :], boxes[i, :]) if order_indices.size > 1 else np.array([])
+        order_indices = order_indices[np.where(ious < iou_threshold)[0] + 1]
+    return boxes[keep_indices][:max_output_size]
+
+
+@pytest.mark.parametrize("per_class", [True, False])
+def test_nms_random_boxes(per_class):
+    iou_threshold = 0.5
+    classes = range(5)
+    max_output_size = 20
+    num_boxes = 1000
+
+    rng = np.random.RandomState(0)
+    inputs = [
+        np.concatenate([
+            rng.uniform(0, 400, size=(num_boxes, 2)),
+            rng.uniform(5, 100, size=(num_boxes, 2)),
+            rng.randint(0, len(classes), size=(num_boxes, 1)),
+            rng.uniform(0, 1, size=(num_boxes, 1)),
+        ], axis=1) for _ in range(2)
+    ]
+
+    post_process = NMS(
+        classes=classes,
+        iou_threshold=iou_threshold,
+        per_class=per_class,
+        max_output_size=max_output_size,
+    )
+    # make blocks smaller than the boxes to test suppression between blocks.
+    post_process.block_size = 64
+
+    ys = post_process(inputs)["outputs"]
+
+    for boxes, y in zip(inputs, ys):
+        if per_class:
+            expected_y = np.concatenate([
+                _loop_nms(boxes[boxes[:, 4] == class_id], iou_threshold, max_output_size) for class_id in classes
+            ])
+        else:
+            expected_y = _loop_nms(boxes, iou_threshold, max_output_size)
+
+        assert expected_y.shape == y.shape
+        assert np.allclose(expected_y, y)
+
+
+def test_soft_nms():
+    iou_threshold = 0.3
+    classes = range(2)
+    sigma = 0.5
+
+    inputs = [
+        np.array([
+            [0, 0, 10, 10, 0, 0.9],
+            [0, 0, 10, 10, 0, 0.8],
+            [5, 0, 10, 10, 0, 0.7],
+            [0, 0, 10, 10, 1, 0.6],
+        ]),
+    ]
+
+    # iou of box 0 and 1 is 1, iou of box 0 and 2, box 1 and 2 is 1/3, box 3 is in the other class.
+    expected_linear = np.array([
+        [0, 0, 10, 10, 0, 0.9],
+        [5, 0, 10, 10, 0, 0.7 * (1 - 1 / 3)],
+        [0, 0, 10, 10, 1, 0.6],
+    ])
+
+    weight_0_1 = np.exp(-1 / sigma)
+    weight_0_2 = np.exp(-(1 / 3) ** 2 / sigma)
+    expected_gaussian = np.array([
+        [0, 0, 10, 10, 0, 0.9],
+        [5, 0, 10, 10, 0, 0.7 * weight_0_2],
+        [0, 0, 10, 10, 0, 0.8 * weight_0_1 * weight_0_2],
+        [0, 0, 10, 10, 1, 0.6],
+    ])
+
+    for soft_nms, expected_y in [("linear", expected_linear), ("gaussian", expected_gaussian)]:
+        post_process = NMS(
+            classes=classes,
+            iou_threshold=iou_threshold,
+            soft_nms=soft_nms,
+            sigma=sigma,
+        )
+
+        y = post_process(inputs)["outputs"][0]
+
+        assert np.allclose(expected_y, y), (soft_nms, expected_y, y)
+
+
+def test_nms_restored_from_old_settings():
+    """NMS restored from meta.yaml of the versions without Soft-NMS is hard NMS."""
+    classes = range(2)
+    inputs = [
+        np.array([
+            [0, 0, 10, 10, 0, 0.9],
+            [0, 0, 10, 10, 0, 0.8],
+            [5, 0, 10, 10, 0, 0.7],
+            [0, 0, 10, 10, 1, 0.6],
+        ]),
+    ]
+
+    post_process = NMS(classes=classes, iou_threshold=0.3)
+    restored_post_process = _restore_processor(NMS, {
+        "classes": classes,
+        "iou_threshold": 0.3,
+        "max_output_size": 100,
+        "per_class": True,
+    })
+
+    expected_y = post_process(inputs)["outputs"][0]
+    y = restored_post_process(inputs)["outputs"][0]
+
+    assert expected_y.shape == y.shape == (2, 6)
+    assert np.allclose(expected_y, y)
+
+
 def test_resize_bilinear():
     """Verify Bilinear post process results are same as tf.image.resize_bilinear()"""
     batch_size = 2
@@ -349,10 +553,15 @@ def test_gaussian_heatmap_to_joints():
 
 if __name__ == '__main__':
     test_format_yolov2_shape()
+    test_format_yolov2_score_threshold("NHWC")
+    test_format_yolov2_score_threshold("NCHW")
     test_exclude_low_score_box()
     test_nms()
     test_nms_not_per_class()
     test_nms_max_output_size()
+    test_nms_random_boxes(per_class=True)
+    test_nms_random_boxes(per_class=False)
+    test_soft_nms()
     test_resize_bilinear()
     test_resize_bilinear_pillow()
     test_gaussian_heatmap_to_joints()
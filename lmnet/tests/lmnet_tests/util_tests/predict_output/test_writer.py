@@ -6,6 +6,7 @@ import pytest
 from PIL import Image
 
 from lmnet.common import Tasks
+from lmnet.utils.predict_output.output import load_binary
 from lmnet.utils.predict_output.writer import OutputWriter
 from lmnet.utils.predict_output.writer import save_json
 from lmnet.utils.predict_output.writer import save_npy
@@ -32,6 +33,30 @@ def test_write(temp_dir):
     assert os.path.exists(os.path.join(temp_dir, "images", "1", "ccc", "dummy2.png"))
 
 
+def test_write_binary(temp_dir):
+    task = Tasks.CLASSIFICATION
+    classes = ("aaa", "bbb", "ccc")
+    image_size = (320, 280)
+    data_format = "NCHW"
+
+    writer = OutputWriter(task, classes, image_size, data_format, output_format="binary")
+    outputs = np.array([[0, 1, 0], [0, 0, 1], [1, 0, 0]])
+    raw_images = np.zeros((3, 320, 280, 3), dtype=np.uint8)
+    image_files = ["dummy1.png", "dummy2.png", "dummy3.png"]
+
+    writer.write(temp_dir, outputs, raw_images, image_files, 1)
+
+    assert not os.path.exists(os.path.join(temp_dir, "npy", "1.npy"))
+    assert not os.path.exists(os.path.join(temp_dir, "json", "1.json"))
+    assert os.path.exists(os.path.join(temp_dir, "images", "1", "aaa", "dummy3.png"))
+    assert os.path.exists(os.path.join(temp_dir, "images", "1", "bbb", "dummy1.png"))
+    assert os.path.exists(os.path.join(temp_dir, "images", "1", "ccc", "dummy2.png"))
+
+    manifest, arrays = load_binary(os.path.join(temp_dir, "binary", "1.npz"))
+    assert manifest["file_paths"] == image_files
+    assert np.all(arrays["probabilities"] == outputs)
+
+
 def test_save_npy(temp_dir):
     """Test for save npy to existed dir"""
     data = np.array([[1, 2, 3], [4, 5, 6]])
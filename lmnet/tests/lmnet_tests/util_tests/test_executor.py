@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import numpy as np
+import pytest
+import tensorflow as tf
+from easydict import EasyDict
+
+from lmnet.common import Tasks
+from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.post_processor import NMS
+from lmnet.utils.executor import InputPipeline, prepare_detection_metrics
+
+# Apply reset_default_graph() in conftest.py to all tests in this file.
+pytestmark = pytest.mark.usefixtures("reset_default_graph")
+
+
+class DummyDataset:
+    """Sample i is an image filled with i and the one hot label of i % num_classes."""
+
+    augmentor = None
+    pre_processor = None
+    data_format = "NHWC"
+
+    def __init__(self, subset, offset, num_samples=6, batch_size=2, num_classes=3):
+        self.subset = subset
+        self.offset = offset
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.num_classes = num_classes
+
+    def __getitem__(self, i):
+        image = np.full([4, 4, 3], self.offset + i, dtype=np.uint8)
+        label = np.eye(self.num_classes)[i % self.num_classes]
+        return image, label
+
+    def __len__(self):
+        return self.num_samples
+
+
+@pytest.mark.parametrize("input_mode", ["feed_dict", "tf_data"])
+def test_input_pipeline(input_mode):
+    datasets = {
+        "train": DatasetIterator(DummyDataset("train", offset=0), seed=0),
+        "validation": DatasetIterator(DummyDataset("validation", offset=100), seed=0),
+    }
+    images_placeholder = tf.compat.v1.placeholder(tf.float32, shape=(2, 4, 4, 3), name="images_placeholder")
+    labels_placeholder = tf.compat.v1.placeholder(tf.bool, shape=(2, 3), name="labels_placeholder")
+
+    input_pipeline = InputPipeline(datasets, images_placeholder, labels_placeholder, input_mode)
+    images_sum = tf.reduce_sum(input_pipeline.images, axis=[1, 2, 3])
+
+    with tf.compat.v1.Session() as sess:
+        input_pipeline.init(sess)
+
+        for subset, offset in [("train", 0), ("validation", 100), ("train", 0), ("validation", 100)]:
+            images, labels = sess.run([input_pipeline.images, input_pipeline.labels],
+                                      feed_dict=input_pipeline.feed_dict(subset))
+
+            assert images.dtype == np.float32
+            assert images.shape == (2, 4, 4, 3)
+            assert labels.dtype == np.bool_
+            assert labels.shape == (2, 3)
+
+            # each image comes from the subset, and its label is the label of the same sample.
+            sample_ids = images[:, 0, 0, 0].astype(np.int64) - offset
+            assert np.all((0 <= sample_ids) & (sample_ids < 6))
+            assert np.all(labels[np.arange(2), sample_ids % 3])
+
+        assert sess.run(images_sum, feed_dict=input_pipeline.feed_dict("train")).shape == (2,)
+
+
+def test_prepare_detection_metrics():
+    classes = ["a", "b"]
+    config = EasyDict(TASK=Tasks.OBJECT_DETECTION, POST_PROCESSOR=NMS(iou_threshold=0.5, classes=classes))
+
+    # numpy detection metrics are opt-in.
+    assert prepare_detection_metrics(config, classes) is None
+
+    config.NUMPY_DETECTION_METRICS = True
+    detection_metrics = prepare_detection_metrics(config, classes)
+    assert sorted(detection_metrics) == [0.3, 0.5, 0.7]
+
+    # they need object detection and its post processor.
+    config.POST_PROCESSOR = None
+    assert prepare_detection_metrics(config, classes) is None
+    config.update(TASK=Tasks.CLASSIFICATION, POST_PROCESSOR=NMS(iou_threshold=0.5, classes=classes))
+    assert prepare_detection_metrics(config, classes) is None
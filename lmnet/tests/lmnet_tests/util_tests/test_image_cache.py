@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import pickle
+from multiprocessing import Pool
+
+import numpy as np
+import pytest
+
+from lmnet.datasets.image_folder import ImageFolderBase
+from lmnet.utils.image_cache import ImageCache
+
+# Apply set_test_environment() in conftest.py to all tests in this file.
+pytestmark = pytest.mark.usefixtures("set_test_environment")
+
+
+class Dummy(ImageFolderBase):
+    extend_dir = "dummy_classification"
+
+
+def test_image_cache_put_get(tmpdir):
+    cache = ImageCache(str(tmpdir), max_bytes=4096, segment_bytes=1024)
+    image = np.random.randint(0, 256, size=(10, 8, 3), dtype=np.uint8)
+
+    assert cache.get("a") is None
+    assert cache.put("a", image)
+
+    cached = cache.get("a")
+    assert cached.shape == image.shape
+    assert cached.dtype == image.dtype
+    assert np.all(cached == image)
+
+    # in-place modification doesn't change the cache.
+    cached[:] = 0
+    assert np.all(cache.get("a") == image)
+
+    # the returned image is not a view of the data file, it owns its writable buffer.
+    cached = cache.get("a")
+    assert not isinstance(cached, np.memmap)
+    assert cached.base is None and cached.flags.writeable
+
+    # other dtypes are read with their item size.
+    float_image = np.random.rand(4, 5).astype(np.float32)
+    assert cache.put("f", float_image)
+    assert np.array_equal(cache.get("f"), float_image)
+
+    # too large image is not cached.
+    assert not cache.put("b", np.zeros((1025, ), dtype=np.uint8))
+    assert cache.get("b") is None
+
+    # the cache is persistent and picklable.
+    cache.flush()
+    assert np.all(ImageCache(str(tmpdir), max_bytes=4096, segment_bytes=1024).get("a") == image)
+    assert np.all(pickle.loads(pickle.dumps(cache)).get("a") == image)
+
+
+def test_image_cache_lru_eviction(tmpdir):
+    cache = ImageCache(str(tmpdir), max_bytes=2048, segment_bytes=1024, touch_interval=1)
+    images = [np.full((512, ), i, dtype=np.uint8) for i in range(4)]
+
+    # fill 2 segments, segment 0 has images 0, 1 and segment 1 has images 2, 3.
+    for i, image in enumerate(images):
+        cache.put(str(i), image)
+    assert len(cache) == 4
+
+    # use segment 0 so that segment 1 is the least recently used.
+    assert np.all(cache.get("0") == images[0])
+
+    cache.put("4", np.full((512, ), 4, dtype=np.uint8))
+    assert len(cache) == 3
+    assert cache.get("2") is None
+    assert cache.get("3") is None
+    assert np.all(cache.get("1") == images[1])
+    assert np.all(cache.get("4") == 4)
+
+    # an image read before its segment is evicted and reused is not changed.
+    image_1 = cache.get("1")
+    for i in range(5, 9):
+        cache.put(str(i), np.full((512, ), i, dtype=np.uint8))
+    assert cache.get("1") is None
+    assert np.all(image_1 == images[1])
+
+
+def test_image_cache_dataset(tmpdir):
+    dataset = Dummy(subset="train", batch_size=1)
+    cached_dataset = Dummy(subset="train", batch_size=1, image_cache_kwargs={"cache_dir": str(tmpdir)})
+
+    for _ in range(2):
+        for i in range(len(dataset)):
+            image, label = dataset[i]
+            cached_image, cached_label = cached_dataset[i]
+
+            assert np.all(image == cached_image)
+            assert np.all(label == cached_label)
+
+    assert len(cached_dataset.image_cache) == len(dataset)
+
+
+def _put_and_get(args):
+    """Put and get images whose values are their keys, return the number of wrong images read.
+
+    The images read are checked again at the end, after their segments are evicted and reused.
+    """
+    cache, worker = args
+    read_images = []
+    for i in range(200):
+        key = (worker * 7 + i) % 32
+        image = cache.get(str(key))
+        if image is None:
+            cache.put(str(key), np.full((300, ), key, dtype=np.uint8))
+        else:
+            read_images.append((key, image))
+    return sum(not np.all(image == key) for key, image in read_images)
+
+
+def test_image_cache_multi_process_eviction(tmpdir):
+    # only 3 images fit in a segment, the segments are evicted all the time.
+    cache = ImageCache(str(tmpdir), max_bytes=2048, segment_bytes=1024, touch_interval=1)
+
+    with Pool(4) as pool:
+        num_wrong = pool.map(_put_and_get, [(cache, worker) for worker in range(4)])
+
+    assert sum(num_wrong) == 0
+    for key in range(32):
+        image = cache.get(str(key))
+        assert image is None or np.all(image == key)
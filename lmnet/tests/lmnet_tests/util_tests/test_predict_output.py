@@ -21,7 +21,13 @@ import numpy as np
 import PIL.Image
 
 from lmnet.common import Tasks
-from lmnet.utils.predict_output.output import JsonOutput
+from lmnet.utils.predict_output.output import (
+    BinaryOutput,
+    ImageFromArrays,
+    JsonOutput,
+    dump_binary,
+    load_binary,
+)
 
 
 def test_classification_json():
@@ -152,7 +158,96 @@ def test_semantic_segmentation_json():
             assert mask_image.shape == (320, 280)
 
 
+def test_object_detection_binary(tmpdir):
+    task = Tasks.OBJECT_DETECTION
+    image_size = (120, 160)
+    classes = ("aaa", "bbb")
+    params = {
+        "task": task,
+        "classes": classes,
+        "image_size": image_size,
+        "data_format": "NHWC",
+    }
+
+    box_sizes = (3, 0, 5)
+    inputs = [
+        np.concatenate([
+            np.random.randint(120, size=(box_size, 4)),
+            np.random.randint(len(classes), size=(box_size, 1)),
+            np.random.uniform(size=(box_size, 1)),
+        ], axis=1)
+        for box_size in box_sizes
+    ]
+
+    raw_images = np.zeros((len(box_sizes), 320, 280, 3), dtype=np.uint8)
+    image_files = ["dummy.png", "dummy_2.png", "dummy_3.png"]
+
+    manifest, arrays = BinaryOutput(**params)(inputs, raw_images, image_files)
+
+    assert manifest["task"] == str(task.value)
+    assert manifest["file_paths"] == image_files
+    assert manifest["image_sizes"] == [[320, 280]] * len(box_sizes)
+    assert arrays["box_offsets"].tolist() == [0, 3, 3, 8]
+
+    filepath = str(tmpdir.join("output.npz"))
+    dump_binary(filepath, manifest, arrays)
+    loaded_manifest, loaded_arrays = load_binary(filepath)
+
+    assert loaded_manifest == manifest
+    assert sorted(loaded_arrays.keys()) == manifest["arrays"]
+
+    boxes = loaded_arrays["boxes"]
+    box_offsets = loaded_arrays["box_offsets"]
+    for i in range(len(box_sizes)):
+        predict_boxes = boxes[box_offsets[i]:box_offsets[i + 1]]
+        resized_boxes = np.stack([
+            inputs[i][:, 0] * 280 / image_size[1],
+            inputs[i][:, 1] * 320 / image_size[0],
+            inputs[i][:, 2] * 280 / image_size[1],
+            inputs[i][:, 3] * 320 / image_size[0],
+        ], axis=1)
+        assert np.allclose(predict_boxes[:, :4], resized_boxes)
+        assert np.allclose(predict_boxes[:, 4:], inputs[i][:, 4:])
+
+    filename_images = ImageFromArrays(task, classes, image_size)(loaded_arrays, raw_images, image_files)
+    assert [filename for filename, _ in filename_images] == ["dummy.png", "dummy_2.png", "dummy_3.png"]
+
+
+def test_semantic_segmentation_binary():
+    task = Tasks.SEMANTIC_SEGMENTATION
+    image_size = (120, 160)
+    classes = ("aaa", "bbb", "ccc")
+    params = {
+        "task": task,
+        "classes": classes,
+        "image_size": image_size,
+        "data_format": "NCHW",
+    }
+
+    batch_size = 2
+
+    predict = np.random.uniform(size=(batch_size, len(classes), image_size[0], image_size[1]))
+
+    raw_images = np.zeros((batch_size, 320, 280, 3), dtype=np.uint8)
+    image_files = ["dummy.png", "dumpy_2.pny"]
+
+    manifest, arrays = BinaryOutput(**params)(predict, raw_images, image_files)
+
+    assert manifest["arrays"] == ["labels", "probabilities"]
+    assert arrays["labels"].dtype == np.uint8
+    assert np.all(arrays["labels"] == np.argmax(predict, axis=1))
+    assert arrays["probabilities"].shape == (batch_size, image_size[0], image_size[1], len(classes))
+    assert np.all(arrays["probabilities"] == (np.transpose(predict, [0, 2, 3, 1]) * 255).astype(np.uint8))
+
+    filename_images = ImageFromArrays(task, classes, image_size)(arrays, raw_images, image_files)
+    filenames = [filename for filename, _ in filename_images]
+    assert filenames == ["mask/dummy.png", "overlap/dummy.png", "mask/dumpy_2.png", "overlap/dumpy_2.png"]
+    for _, image in filename_images:
+        assert image.size == (280, 320)
+
+
 if __name__ == '__main__':
     test_classification_json()
     test_object_detection_json()
     test_semantic_segmentation_json()
+    test_semantic_segmentation_binary()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+import sys
+import time
+
+import numpy as np
+
+from lmnet.utils.config import build_post_process, build_pre_process
+
+STAGES = ["pre", "inference", "post", "total"]
+
+if sys.version_info.major == 2:
+    # python2 doesn't have perf_counter, and time.clock is CPU time on Unix.
+    get_time = time.time
+else:
+    get_time = time.perf_counter
+
+
+def load_model(model):
+    """Load and initialize a `.so` (shared object) or `.pb` (protocol buffer) model.
+
+    Args:
+        model (str): model file path.
+
+    Returns:
+        `NNLib` or `TensorflowGraphRunner` instance.
+    """
+    filename, file_extension = os.path.splitext(model)
+    supported_files = ['.so', '.pb']
+
+    if file_extension not in supported_files:
+        raise Exception("""
+            Unknown file type. Got %s%s.
+            Please check the model file (-m).
+            Only .pb (protocol buffer), .so (shared object) file is supported.
+            """ % (filename, file_extension))
+
+    if file_extension == '.so':  # Shared library
+        from lmnet.nnlib import NNLib
+        # load and initialize the generated shared model
+        nn = NNLib()
+        nn.load(model)
+        nn.init()
+
+    elif file_extension == '.pb':  # Protocol Buffer file
+        # only load tensorflow if user wants to use GPU
+        from lmnet.tensorflow_graph_runner import TensorflowGraphRunner
+        nn = TensorflowGraphRunner(model)
+        nn.init()
+
+    return nn
+
+
+def _percentiles(seconds):
+    seconds = np.asarray(seconds)
+    return {
+        "mean": float(np.mean(seconds)),
+        "p50": float(np.percentile(seconds, 50)),
+        "p90": float(np.percentile(seconds, 90)),
+        "p99": float(np.percentile(seconds, 99)),
+        "min": float(np.min(seconds)),
+        "max": float(np.max(seconds)),
+    }
+
+
+class InferenceEngine(object):
+    """Resident inference engine, which loads a model and its pre/post processors only once.
+
+    Args:
+        model (str): `.so` or `.pb` model file path.
+        config (EasyDict): config loaded by `load_yaml` from `meta.yaml`.
+    """
+
+    def __init__(self, model, config):
+        self.config = config
+        self.data_format = config.DATA_FORMAT
+        self.pre_process = build_pre_process(config.PRE_PROCESSOR)
+        self.post_process = build_post_process(config.POST_PROCESSOR)
+        self.nn = load_model(model)
+
+    def pre_process_image(self, image):
+        data = self.pre_process(image=image)['image']
+        if self.data_format == 'NCHW':
+            data = np.transpose(data, [2, 0, 1])
+        return data
+
+    def run(self, data):
+        """Run the model on pre-processed data with the batch dimension."""
+        return self.nn.run(data)
+
+    def run_batch(self, data):
+        """Run the model on each frame of pre-processed data [N] + input shape, and concatenate the outputs."""
+        if hasattr(self.nn, "run_batch"):
+            outputs = self.nn.run_batch(data)
+        else:
+            outputs = np.stack([self.nn.run(frame) for frame in data])
+        # merge frames into the batch dimension of the model output.
+        return outputs.reshape((-1,) + outputs.shape[2:])
+
+    def post_process_output(self, output):
+        return self.post_process(outputs=output)['outputs']
+
+    def predict(self, image):
+        """Predict a raw image.
+
+        Returns:
+            post processed output of the batch size 1.
+        """
+        data = np.expand_dims(self.pre_process_image(image), axis=0)
+        output = self.run(data)
+        return self.post_process_output(output)
+
+    def predict_batch(self, images):
+        """Predict raw images, which are run frame by frame by the model and post processed as one batch.
+
+        Returns:
+            post processed output of the batch size `len(images)`.
+        """
+        data = np.stack([np.expand_dims(self.pre_process_image(image), axis=0) for image in images])
+        output = self.run_batch(data)
+        return self.post_process_output(output)
+
+    def benchmark(self, image, trial=10, warmup=1):
+        """Measure wall clock time of each stage of `predict`.
+
+        Args:
+            image (np.ndarray): raw image.
+            trial (int): the number of measured predictions.
+            warmup (int): the number of predictions before the measurement, which are not measured.
+
+        Returns:
+            dict: JSON serializable result, which has "mean", "p50", "p90", "p99", "min" and "max" seconds
+                of "pre", "inference", "post" and "total" stages.
+        """
+        for _ in range(warmup):
+            self.predict(image)
+
+        seconds = {stage: [] for stage in STAGES}
+        for _ in range(trial):
+            start = get_time()
+            data = np.expand_dims(self.pre_process_image(image), axis=0)
+            pre_end = get_time()
+            output = self.run(data)
+            inference_end = get_time()
+            self.post_process_output(output)
+            end = get_time()
+
+            seconds["pre"].append(pre_end - start)
+            seconds["inference"].append(inference_end - pre_end)
+            seconds["post"].append(end - inference_end)
+            seconds["total"].append(end - start)
+
+        return {
+            "trial": trial,
+            "warmup": warmup,
+            "stages": {stage: _percentiles(seconds[stage]) for stage in STAGES},
+        }
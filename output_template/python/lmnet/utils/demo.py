@@ -146,6 +146,49 @@ class VideoStream:
         self.thread.join()
 
 
+class ImageFileStream:
+    """File backed stream which has the same `read` and `release` interface as `VideoStream`.
+
+    It is for running demos and servers without camera.
+
+    Args:
+        image_files (list): image file paths, which are read in order.
+        video_fps (float): If given, `read` waits to keep this frame rate.
+        loop (bool): If True, restart from the first image after the last one. Otherwise `read` returns None.
+    """
+
+    def __init__(self, image_files, video_fps=None, loop=True):
+        self.frames = []
+        for image_file in image_files:
+            frame = cv2.imread(image_file)
+            if frame is None:
+                raise ValueError("Can not read image: {}".format(image_file))
+            self.frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+        self.video_fps = video_fps
+        self.loop = loop
+        self.index = 0
+        self.last_read = None
+        self.stopped = False
+
+    def read(self):
+        if self.stopped or (not self.loop and self.index >= len(self.frames)):
+            return None
+
+        if self.video_fps and self.last_read is not None:
+            wait = 1 / float(self.video_fps) - (time.time() - self.last_read)
+            if wait > 0:
+                time.sleep(wait)
+        self.last_read = time.time()
+
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame.copy()
+
+    def release(self):
+        self.stopped = True
+
+
 def run_inference(image, nn, pre_process, post_process):
     start = time.clock()
 
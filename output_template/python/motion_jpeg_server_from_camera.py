@@ -13,31 +13,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
-from __future__ import absolute_import
-from __future__ import division
-from __future__ import print_function
-from __future__ import unicode_literals
-
-from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
-from io import BytesIO
-from multiprocessing import Pool
-import os
-import signal
+import json
 import sys
-from SocketServer import ThreadingMixIn
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from socketserver import ThreadingMixIn
 
 import click
+import numpy as np
 
-from lmnet.nnlib import NNLib
-from lmnet.utils.config import (
-    load_yaml,
-    build_pre_process,
-    build_post_process,
-)
-from lmnet.utils.demo import (
-    VideoStream,
-    run_inference,
-)
+from lmnet.inference_engine import InferenceEngine
+from lmnet.utils.config import load_yaml
+from lmnet.utils.demo import VideoStream
 from lmnet.visualize import (
     draw_fps,
     visualize_classification,
@@ -46,138 +36,242 @@ from lmnet.visualize import (
 )
 
 
-# global variable for multi process or multi thread.
-nn = None
-pre_process = None
-post_process = None
-stream = None
-config = None
-pool = None
-
 # camera settings.
 CAMERA_WIDTH = 320
 CAMERA_HEIGHT = 240
 CAMERA_FPS = 10
 CAMERA_SOURCE = 0
 
+BOUNDARY = "jpgboundary"
 
-class MotionJpegHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        global config, stream, pool
-        result = None
-        fps = 0.0
-        fps_only_network = 0.0
-
-        camera_img = stream.read()
-        pool_result = pool.apply_async(_run_inference, (camera_img, ))
-
-        self.send_response(200)
-        self.send_header('Content-type', 'multipart/x-mixed-replace; boundary=jpgboundary')
-        self.end_headers()
-
-        while True:
-            try:
-                pool_result.wait()
-
-                if pool_result.ready():
-                    window_img = camera_img
-                    result, fps, fps_only_network = pool_result.get()
-
-                    camera_img = stream.read()
-                    pool_result = pool.apply_async(_run_inference, (camera_img, ))
 
-                else:
-                    result = None
+def _visualize(image, result, config):
+    if config.TASK == "IMAGE.CLASSIFICATION":
+        return visualize_classification(image, result, config)
 
-                if result is not None:
-                    result = result[0]
-                    if config.TASK == "IMAGE.CLASSIFICATION":
-                        image = visualize_classification(window_img, result, config)
+    if config.TASK == "IMAGE.OBJECT_DETECTION":
+        return visualize_object_detection(image, result, config)
 
-                    if config.TASK == "IMAGE.OBJECT_DETECTION":
-                        image = visualize_object_detection(window_img, result, config)
+    if config.TASK == "IMAGE.SEMANTIC_SEGMENTATION":
+        return visualize_semantic_segmentation(image, result, config)
 
-                    if config.TASK == "IMAGE.SEMANTIC_SEGMENTATION":
-                        image = visualize_semantic_segmentation(window_img, result, config)
+    raise ValueError("Unsupported task: {}".format(config.TASK))
 
-                    draw_fps(image, fps, fps_only_network)
-                    tmp = BytesIO()
-                    image.save(tmp, "JPEG")
 
-                self.send_header('Content-type', 'image/jpeg')
-                self.end_headers()
-                self.wfile.write(tmp.getvalue())
+def _percentiles(seconds):
+    if not seconds:
+        return {"p50": None, "p90": None, "p99": None}
+    milliseconds = np.array(seconds) * 1000
+    return {
+        "p50": float(np.percentile(milliseconds, 50)),
+        "p90": float(np.percentile(milliseconds, 90)),
+        "p99": float(np.percentile(milliseconds, 99)),
+    }
 
-            finally:
-                self.wfile.write(b"\r\n--jpgboundary\r\n")
 
-        return
+class FrameBroadcaster(object):
+    """Run one capture -> inference -> visualize -> JPEG encode pipeline and publish the latest frame to all clients.
 
+    The pipeline runs in a single producer thread regardless of the number of clients.
+    Each client waits for a frame newer than the one it sent last, so slow clients skip (drop) frames
+    instead of slowing down the pipeline or the other clients.
 
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-    daemon_threads = True
-
-
-def _run_inference(inputs):
-    global nn, pre_process, post_process
-    res, fps, fps_only_network = run_inference(inputs, nn, pre_process, post_process)
-    return res, fps, fps_only_network
-
+    Args:
+        stream: an object which has `read()` and `release()` like `VideoStream`. `read()` returning None ends the
+            pipeline.
+        engine: `InferenceEngine`.
+        config (EasyDict): config loaded from `meta.yaml`.
+        window (int): the number of the latest frames to calculate FPS and latency.
+    """
 
-def _init_worker():
-    global nn
-    # ignore SIGINT in pooled process.
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    def __init__(self, stream, engine, config, window=100):
+        self.stream = stream
+        self.engine = engine
+        self.config = config
+
+        self.condition = threading.Condition()
+        self.frame_id = 0
+        self.frame = None
+        self.stopped = False
+
+        self.num_clients = 0
+        self.num_sent_frames = 0
+        self.num_dropped_frames = 0
+
+        self.frame_times = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.network_latencies = deque(maxlen=window)
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.stream.release()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def _fps(self):
+        if len(self.frame_times) < 2:
+            return 0.0
+        return (len(self.frame_times) - 1) / (self.frame_times[-1] - self.frame_times[0])
+
+    def _fps_only_network(self):
+        if not self.network_latencies:
+            return 0.0
+        return len(self.network_latencies) / sum(self.network_latencies)
+
+    def _process(self, image):
+        data = np.expand_dims(self.engine.pre_process_image(image), axis=0)
+
+        network_start = time.perf_counter()
+        output = self.engine.run(data)
+        network_latency = time.perf_counter() - network_start
+
+        result = self.engine.post_process_output(output)[0]
+
+        # fps on the image is of the frames until the previous one.
+        window_image = _visualize(image, result, self.config)
+        draw_fps(window_image, self._fps(), self._fps_only_network())
+
+        buffer = BytesIO()
+        window_image.save(buffer, "JPEG")
+        return buffer.getvalue(), network_latency
+
+    def _run(self):
+        try:
+            while not self.stopped:
+                image = self.stream.read()
+                if image is None:
+                    break
+
+                start = time.perf_counter()
+                jpeg, network_latency = self._process(image)
+                end = time.perf_counter()
+
+                with self.condition:
+                    self.frame = jpeg
+                    self.frame_id += 1
+                    self.frame_times.append(end)
+                    self.latencies.append(end - start)
+                    self.network_latencies.append(network_latency)
+                    self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+
+    def wait_frame(self, last_frame_id, timeout=None):
+        """Wait for a frame newer than `last_frame_id`.
+
+        Returns:
+            int: id of the frame.
+            bytes: JPEG encoded frame. None when the pipeline is stopped or timed out.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id > last_frame_id or self.stopped, timeout)
+            if self.frame_id <= last_frame_id:
+                return last_frame_id, None
+
+            if last_frame_id > 0:
+                self.num_dropped_frames += self.frame_id - last_frame_id - 1
+            self.num_sent_frames += 1
+            return self.frame_id, self.frame
+
+    def add_client(self):
+        with self.condition:
+            self.num_clients += 1
+
+    def remove_client(self):
+        with self.condition:
+            self.num_clients -= 1
+
+    def stats(self):
+        """Return JSON serializable counters of the pipeline and the clients."""
+        with self.condition:
+            return {
+                "frames": self.frame_id,
+                "fps": self._fps(),
+                "fps_only_network": self._fps_only_network(),
+                "latency_ms": _percentiles(list(self.latencies)),
+                "network_latency_ms": _percentiles(list(self.network_latencies)),
+                "clients": self.num_clients,
+                "sent_frames": self.num_sent_frames,
+                "dropped_frames": self.num_dropped_frames,
+                "stopped": self.stopped,
+            }
 
-    # init
-    nn.init()
 
+class MotionJpegHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_stats()
+        else:
+            self._send_motion_jpeg()
 
-def run(model, config_file, port=80):
-    global nn, pre_process, post_process, config, stream, pool
+    def _send_stats(self):
+        body = json.dumps(self.server.broadcaster.stats()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-    filename, file_extension = os.path.splitext(model)
-    supported_files = ['.so', '.pb']
+    def _send_motion_jpeg(self):
+        broadcaster = self.server.broadcaster
 
-    if file_extension not in supported_files:
-        raise Exception("""
-            Unknown file type. Got %s%s.
-            Please check the model file (-m).
-            Only .pb (protocol buffer) or .so (shared object) file is supported.
-            """ % (filename, file_extension))
+        self.send_response(200)
+        self.send_header("Content-type", "multipart/x-mixed-replace; boundary={}".format(BOUNDARY))
+        self.end_headers()
 
-    if file_extension == '.so':  # Shared library
-        nn = NNLib()
-        nn.load(model)
+        broadcaster.add_client()
+        try:
+            frame_id = 0
+            while True:
+                frame_id, jpeg = broadcaster.wait_frame(frame_id)
+                if jpeg is None:
+                    break
+
+                self.wfile.write("--{}\r\nContent-type: image/jpeg\r\nContent-length: {}\r\n\r\n".format(
+                    BOUNDARY, len(jpeg)).encode("ascii"))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client is disconnected.
+            pass
+        finally:
+            broadcaster.remove_client()
 
-    elif file_extension == '.pb':  # Protocol Buffer file
-        # only load tensorflow if user wants to use GPU
-        from lmnet.tensorflow_graph_runner import TensorflowGraphRunner
-        nn = TensorflowGraphRunner(model)
 
-    nn = NNLib()
-    nn.load(model)
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
 
-    stream = VideoStream(CAMERA_SOURCE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS)
 
+def run(model, config_file, port=80, stream=None):
     config = load_yaml(config_file)
+    engine = InferenceEngine(model, config)
 
-    pre_process = build_pre_process(config.PRE_PROCESSOR)
-    post_process = build_post_process(config.POST_PROCESSOR)
+    if stream is None:
+        stream = VideoStream(CAMERA_SOURCE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS)
 
-    pool = Pool(processes=1, initializer=_init_worker)
+    broadcaster = FrameBroadcaster(stream, engine, config).start()
 
+    server = ThreadedHTTPServer(('', port), MotionJpegHandler)
+    server.broadcaster = broadcaster
     try:
-        server = ThreadedHTTPServer(('', port), MotionJpegHandler)
         print("server starting")
         server.serve_forever()
-    except KeyboardInterrupt as e:
+    except KeyboardInterrupt:
         print("KeyboardInterrpt in server - ending server")
-        stream.release()
-        pool.terminate()
-        pool.join()
-        server.socket.close()
-        server.shutdown()
+    finally:
+        broadcaster.stop()
+        server.server_close()
 
     return
 
@@ -212,7 +306,9 @@ def main(model, config_file, port):
 
     1. Run inference from video camera source image.
     2. Visualize (decorate) input image from inference result.
-    3. Response decorated image as motion jpeg.
+    3. Response decorated image as motion jpeg to all the clients.
+
+    `/stats` responds FPS and latency counters as JSON.
     """
 
     run(model, config_file, port)
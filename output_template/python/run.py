@@ -13,41 +13,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
-import numpy as np
 import click
+import json
 import logging
 import os
 import sys
-import time
-
-from lmnet.nnlib import NNLib as NNLib
 
+from lmnet.inference_engine import InferenceEngine
 from lmnet.utils.image import load_image
 from lmnet.common import Tasks
-from lmnet.utils.output import JsonOutput, ImageFromJson
-from lmnet.utils.config import (
-    load_yaml,
-    build_pre_process,
-    build_post_process,
-)
+from lmnet.utils.output import BinaryOutput, ImageFromArrays, JsonOutput, ImageFromJson, dump_binary
+from lmnet.utils.config import load_yaml
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
-def _pre_process(raw_image, pre_processor, data_format):
-    pre_process = build_pre_process(pre_processor)
-    image = pre_process(image=raw_image)['image']
-    if data_format == 'NCHW':
-        image = np.transpose(image, [2, 0, 1])
-    return image
-
-
-def _post_process(output, post_processor):
-    post_process = build_post_process(post_processor)
-    output = post_process(outputs=output)['outputs']
-    return output
-
-
 def _save_json(output_dir, json_obj):
     output_file_name = os.path.join(output_dir, "output.json")
     dirname = os.path.dirname(output_file_name)
@@ -69,111 +49,92 @@ def _save_images(output_dir, filename_images):
         logger.info("save image: {}".format(output_file_name))
 
 
-def _run(model, image_data, config):
-    filename, file_extension = os.path.splitext(model)
-    supported_files = ['.so', '.pb']
-
-    if file_extension not in supported_files:
-        raise Exception("""
-            Unknown file type. Got %s%s.
-            Please check the model file (-m).
-            Only .pb (protocol buffer), .so (shared object) file is supported.
-            """ % (filename, file_extension))
+def _save_binary(output_dir, manifest, arrays):
+    output_file_name = os.path.join(output_dir, "output.npz")
+    dump_binary(output_file_name, manifest, arrays)
+    logger.info("save binary: {}".format(output_file_name))
 
-    if file_extension == '.so':  # Shared library
-        # load and initialize the generated shared model
-        nn = NNLib()
-        nn.load(model)
-        nn.init()
 
-    elif file_extension == '.pb':  # Protocol Buffer file
-        # only load tensorflow if user wants to use GPU
-        from lmnet.tensorflow_graph_runner import TensorflowGraphRunner
-        nn = TensorflowGraphRunner(model)
-        nn.init()
-
-    # run the graph
-    output = nn.run(image_data)
-
-    return output
-
-
-def _timerfunc(func, extraArgs, trial):
-    if sys.version_info.major == 2:
-        get_time = time.clock
-    else:
-        get_time = time.process_time
-
-    runtime = 0.
-    for i in range(trial):
-        start = get_time()
-        value = func(*extraArgs)
-        end = get_time()
-        runtime += end - start
-        msg = "Function {func} took {time} seconds to complete"
-        logger.info(msg.format(func=func.__name__, time=end - start))
-    logger.info("Avg(func {}): {} sec.".format(func.__name__, runtime / trial))
-    return value, runtime / trial
+def _save_benchmark(output_dir, benchmark):
+    output_file_name = os.path.join(output_dir, "benchmark.json")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(output_file_name, "w") as json_file:
+        json.dump(benchmark, json_file, indent=4)
+    logger.info("save benchmark: {}".format(output_file_name))
 
 
-def run_prediction(input_image, model, config_file, max_percent_incorrect_values=0.1, trial=1):
+def run_prediction(input_image, model, config_file, max_percent_incorrect_values=0.1, trial=1, output_format="json",
+                   warmup=1):
     if not input_image or not model or not config_file:
         logger.error('Please check usage with --help option')
         exit(1)
 
     config = load_yaml(config_file)
 
-    # load the image
-    image_data = load_image(input_image)
-    raw_image = image_data
-
-    # pre process for image
-    image_data, bench_pre = _timerfunc(_pre_process, (image_data, config.PRE_PROCESSOR, config.DATA_FORMAT), trial)
+    # load the model and the pre/post processors only once.
+    engine = InferenceEngine(model, config)
 
-    # add the batch dimension
-    image_data = np.expand_dims(image_data, axis=0)
-
-    # run the model to inference
-    output, bench_inference = _timerfunc(_run, (model, image_data, config), trial)
+    # load the image
+    raw_image = load_image(input_image)
 
-    logger.info('Output: (before post process)\n{}'.format(output))
+    # measure wall clock time of each stage after warm-up.
+    benchmark = engine.benchmark(raw_image, trial=trial, warmup=warmup)
 
-    # pre process for output
-    output, bench_post = _timerfunc(_post_process, (output, config.POST_PROCESSOR), trial)
+    output = engine.predict(raw_image)
 
     logger.info('Output: (after post process)\n{}'.format(output))
 
-    # json output
-    json_output = JsonOutput(
-        task=Tasks(config.TASK),
-        classes=config.CLASSES,
-        image_size=config.IMAGE_SIZE,
-        data_format=config.DATA_FORMAT,
-        bench={
-            "total": (bench_pre + bench_post + bench_inference) / trial,
-            "pre": bench_pre / trial,
-            "post": bench_post / trial,
-            "inference": bench_inference / trial,
-        },
-    )
-
-    image_from_json = ImageFromJson(
-        task=Tasks(config.TASK),
-        classes=config.CLASSES,
-        image_size=config.IMAGE_SIZE,
-    )
+    bench = {stage: result["mean"] for stage, result in benchmark["stages"].items()}
 
     output_dir = "output"
+    _save_benchmark(output_dir, benchmark)
     outputs = output
     raw_images = [raw_image]
     image_files = [input_image]
-    json_obj = json_output(outputs, raw_images, image_files)
-    _save_json(output_dir, json_obj)
-    filename_images = image_from_json(json_obj, raw_images, image_files)
+
+    if output_format == "binary":
+        # binary output, images are rendered from the arrays directly.
+        binary_output = BinaryOutput(
+            task=Tasks(config.TASK),
+            classes=config.CLASSES,
+            image_size=config.IMAGE_SIZE,
+            data_format=config.DATA_FORMAT,
+            bench=bench,
+        )
+
+        image_from_arrays = ImageFromArrays(
+            task=Tasks(config.TASK),
+            classes=config.CLASSES,
+            image_size=config.IMAGE_SIZE,
+        )
+
+        manifest, arrays = binary_output(outputs, raw_images, image_files)
+        _save_binary(output_dir, manifest, arrays)
+        filename_images = image_from_arrays(arrays, raw_images, image_files)
+    else:
+        # json output
+        json_output = JsonOutput(
+            task=Tasks(config.TASK),
+            classes=config.CLASSES,
+            image_size=config.IMAGE_SIZE,
+            data_format=config.DATA_FORMAT,
+            bench=bench,
+        )
+
+        image_from_json = ImageFromJson(
+            task=Tasks(config.TASK),
+            classes=config.CLASSES,
+            image_size=config.IMAGE_SIZE,
+        )
+
+        json_obj = json_output(outputs, raw_images, image_files)
+        _save_json(output_dir, json_obj)
+        filename_images = image_from_json(json_obj, raw_images, image_files)
+
     _save_images(output_dir, filename_images)
-    logger.info("Benchmark avg result(sec) for {} trials: pre_process: {}  inference: {} post_process: {}  Total: {}"
-                .format(trial, bench_pre / trial, bench_inference / trial, bench_post / trial,
-                        (bench_pre + bench_post + bench_inference) / trial,))
+    logger.info("Benchmark result(sec) for {} trials after {} warm-up:\n{}".format(
+        trial, warmup, json.dumps(benchmark["stages"], indent=4)))
 
 
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
@@ -206,9 +167,21 @@ def run_prediction(input_image, model, config_file, max_percent_incorrect_values
     type=click.INT,
     default=1,
 )
-def main(input_image, model, config_file, trial):
+@click.option(
+    "--warmup",
+    help="# of warm-up runs before Benchmark, which are not measured",
+    type=click.INT,
+    default=1,
+)
+@click.option(
+    "--output_format",
+    help="Format of the output. \"binary\" saves arrays into output/output.npz instead of output/output.json.",
+    type=click.Choice(["json", "binary"]),
+    default="json",
+)
+def main(input_image, model, config_file, trial, warmup, output_format):
     _check_deprecated_arguments()
-    run_prediction(input_image, model, config_file, trial)
+    run_prediction(input_image, model, config_file, trial=trial, output_format=output_format, warmup=warmup)
 
 
 def _check_deprecated_arguments():
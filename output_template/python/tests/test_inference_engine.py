@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import itertools
+
+import numpy as np
+import pytest
+from easydict import EasyDict
+
+from lmnet import inference_engine
+from lmnet.inference_engine import STAGES, InferenceEngine
+
+
+class FakeNNLib(object):
+    """`NNLib` without `run_batch`, whose output is the mean of each channel of the input, shape is [1, channels]."""
+
+    def __init__(self):
+        self.num_runs = 0
+        self.num_batch_runs = 0
+
+    def run(self, data):
+        assert data.shape[0] == 1
+        self.num_runs += 1
+        return data.mean(axis=tuple(range(1, data.ndim - 1)))
+
+
+class FakeBatchNNLib(FakeNNLib):
+    """`NNLib` with `run_batch`, which runs each frame of [N] + input shape."""
+
+    def run_batch(self, data):
+        self.num_batch_runs += 1
+        return np.stack([self.run(frame) for frame in data])
+
+
+def _engine(monkeypatch, nn, data_format="NHWC"):
+    monkeypatch.setattr(inference_engine, "load_model", lambda model: nn)
+    config = EasyDict({"DATA_FORMAT": data_format, "PRE_PROCESSOR": None, "POST_PROCESSOR": None})
+    return InferenceEngine("model.so", config)
+
+
+def _images(num_images):
+    return [np.full((8, 6, 3), [i, i + 1, i + 2], dtype=np.float32) for i in range(num_images)]
+
+
+def test_predict(monkeypatch):
+    nn = FakeNNLib()
+    engine = _engine(monkeypatch, nn)
+
+    output = engine.predict(_images(2)[1])
+
+    assert output.shape == (1, 3)
+    assert np.allclose(output, [[1, 2, 3]])
+    assert nn.num_runs == 1
+
+
+@pytest.mark.parametrize("nn_class", [FakeNNLib, FakeBatchNNLib])
+def test_predict_batch(monkeypatch, nn_class):
+    nn = nn_class()
+    engine = _engine(monkeypatch, nn)
+    images = _images(4)
+
+    outputs = engine.predict_batch(images)
+
+    # frames are merged into the batch dimension in the order of images.
+    assert outputs.shape == (4, 3)
+    for image, output in zip(images, outputs):
+        assert np.allclose(output, engine.predict(image)[0])
+
+    assert nn.num_batch_runs == (1 if nn_class is FakeBatchNNLib else 0)
+
+
+def test_pre_process_image_nchw(monkeypatch):
+    engine = _engine(monkeypatch, FakeNNLib(), data_format="NCHW")
+
+    assert engine.pre_process_image(_images(1)[0]).shape == (3, 8, 6)
+
+
+def test_benchmark(monkeypatch):
+    nn = FakeNNLib()
+    engine = _engine(monkeypatch, nn)
+    # each reading of the clock advances 1 second.
+    clock = itertools.count()
+    monkeypatch.setattr(inference_engine, "get_time", lambda: float(next(clock)))
+
+    result = engine.benchmark(_images(1)[0], trial=5, warmup=2)
+
+    assert result["trial"] == 5
+    assert result["warmup"] == 2
+    assert nn.num_runs == 7
+    assert sorted(result["stages"]) == sorted(STAGES)
+    for stage, expected in [("pre", 1.0), ("inference", 1.0), ("post", 1.0), ("total", 3.0)]:
+        percentiles = result["stages"][stage]
+        assert sorted(percentiles) == ["max", "mean", "min", "p50", "p90", "p99"]
+        assert all(value == expected for value in percentiles.values())
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import json
+import threading
+from urllib.request import urlopen
+
+import numpy as np
+import PIL.Image
+import pytest
+from easydict import EasyDict
+
+import motion_jpeg_server_from_camera as server_module
+from lmnet.utils.demo import ImageFileStream
+
+NUM_IMAGES = 3
+
+
+class FakeEngine(object):
+    """`InferenceEngine` which returns the same classification output for every image."""
+
+    def pre_process_image(self, image):
+        return image
+
+    def run(self, data):
+        return np.array([[0.2, 0.8]])
+
+    def post_process_output(self, output):
+        return output
+
+
+@pytest.fixture
+def stream(tmpdir):
+    image_files = []
+    for i in range(NUM_IMAGES):
+        image_file = str(tmpdir.join("{}.png".format(i)))
+        PIL.Image.fromarray(np.full((24, 32, 3), i * 50, dtype=np.uint8)).save(image_file)
+        image_files.append(image_file)
+    return ImageFileStream(image_files, loop=False)
+
+
+@pytest.fixture(autouse=True)
+def plain_visualize(monkeypatch):
+    # drawing texts depends on the fonts of the system, they are out of the scope of these tests.
+    monkeypatch.setattr(server_module, "_visualize", lambda image, result, config: PIL.Image.fromarray(image))
+    monkeypatch.setattr(server_module, "draw_fps", lambda *args: None)
+
+
+def _is_jpeg(data):
+    return data[:2] == b"\xff\xd8" and data[-2:] == b"\xff\xd9"
+
+
+def test_frame_broadcaster(stream):
+    config = EasyDict({"TASK": "IMAGE.CLASSIFICATION", "CLASSES": ["a", "b"]})
+    broadcaster = server_module.FrameBroadcaster(stream, FakeEngine(), config).start()
+
+    frames = []
+    frame_id = 0
+    while True:
+        frame_id, jpeg = broadcaster.wait_frame(frame_id, timeout=10)
+        if jpeg is None:
+            break
+        frames.append(jpeg)
+
+    broadcaster.thread.join(timeout=10)
+    assert not broadcaster.thread.is_alive()
+
+    assert 1 <= len(frames) <= NUM_IMAGES
+    assert all(_is_jpeg(frame) for frame in frames)
+
+    stats = broadcaster.stats()
+    assert stats["frames"] == NUM_IMAGES
+    assert stats["stopped"]
+    assert stats["sent_frames"] == len(frames)
+    broadcaster.stop()
+
+
+def test_motion_jpeg_server(stream):
+    config = EasyDict({"TASK": "IMAGE.CLASSIFICATION", "CLASSES": ["a", "b"]})
+    broadcaster = server_module.FrameBroadcaster(stream, FakeEngine(), config)
+
+    server = server_module.ThreadedHTTPServer(("127.0.0.1", 0), server_module.MotionJpegHandler)
+    server.broadcaster = broadcaster
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+    try:
+        response = urlopen(url + "/", timeout=10)
+        broadcaster.start()
+        # the response ends when the stream ends.
+        body = response.read()
+
+        assert response.headers["Content-type"].startswith("multipart/x-mixed-replace")
+        parts = [part for part in body.split("--{}\r\n".format(server_module.BOUNDARY).encode("ascii")) if part]
+        assert 1 <= len(parts) <= NUM_IMAGES
+        for part in parts:
+            header, jpeg = part.split(b"\r\n\r\n", 1)
+            jpeg = jpeg[:-len(b"\r\n")]
+            assert b"Content-type: image/jpeg" in header
+            assert int(header.split(b"Content-length: ")[1]) == len(jpeg)
+            assert _is_jpeg(jpeg)
+
+        stats = json.loads(urlopen(url + "/stats", timeout=10).read().decode("utf-8"))
+        assert stats["frames"] == NUM_IMAGES
+        assert stats["stopped"]
+        assert stats["clients"] == 0
+    finally:
+        broadcaster.stop()
+        server.shutdown()
+        server.server_close()
+
+    assert not broadcaster.thread.is_alive()
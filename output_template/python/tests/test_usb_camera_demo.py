@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+from multiprocessing import Process
+
+import numpy as np
+
+from usb_camera_demo import FrameRing
+
+
+def _publish_large_results(ring, num_results):
+    # larger than the pipe buffer, the process can not exit until they are read.
+    try:
+        for i in range(num_results):
+            ring.publish_result(i % ring.num_slots, np.zeros(1 << 20, dtype=np.uint8))
+    finally:
+        ring.publish_result(None, None)
+
+
+def test_stop_with_pending_results():
+    ring = FrameRing(2, 8, 8)
+    p_infer = Process(target=_publish_large_results, args=(ring, 4))
+    p_infer.start()
+
+    ring.stop()
+    ring.drain_results(p_infer)
+    p_infer.join(timeout=10)
+
+    assert not p_infer.is_alive()
+    assert p_infer.exitcode == 0
+
+
+def test_drain_results_after_end():
+    ring = FrameRing(2, 8, 8)
+    p_infer = Process(target=_publish_large_results, args=(ring, 0))
+    p_infer.start()
+
+    assert ring.take_result(timeout=10) == (None, None)
+    p_infer.join(timeout=10)
+
+    # returns when the process has already exited without another sentinel.
+    ring.drain_results(p_infer, timeout=0.01)
+    assert not p_infer.is_alive()
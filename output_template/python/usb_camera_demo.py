@@ -18,28 +18,26 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import time
-import os
+import ctypes
 import sys
-from multiprocessing import Process, Queue
-from time import sleep
+import time
 from collections import deque
+from multiprocessing import Condition, Process, Queue, RawArray, RawValue
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
 
 import click
 import cv2
 import numpy as np
 
 from lmnet.common import get_color_map
-from lmnet.nnlib import NNLib
-from lmnet.utils.config import (
-    load_yaml,
-    build_pre_process,
-    build_post_process,
-)
+from lmnet.inference_engine import InferenceEngine
+from lmnet.utils.config import load_yaml
 from lmnet.utils.demo import (
     add_rectangle,
     add_fps,
-    run_inference,
 )
 
 from lmnet.visualize import (
@@ -49,9 +47,13 @@ from lmnet.visualize import (
 from lmnet.pre_processor import resize
 
 
-nn = None
-pre_process = None
-post_process = None
+CAMERA_WIDTH = 320
+CAMERA_HEIGHT = 240
+
+# "latest": inference always takes the newest captured frame, older frames are dropped.
+#     End-to-end latency stays at one frame when inference is slower than the camera.
+# "none": every captured frame is inferred, capture waits for inference. For benchmarks with a video file.
+FRAME_SKIP_POLICIES = ["latest", "none"]
 
 
 def init_camera(camera_width, camera_height):
@@ -69,6 +71,156 @@ def init_camera(camera_width, camera_height):
     return vc
 
 
+class FrameRing(object):
+    """Ring of frame slots in shared memory between capture, inference and display processes.
+
+    Frames are captured into the slots and only slot indices and inference results are passed between processes,
+    so frames are never pickled. Each handoff blocks on a condition or a queue instead of polling.
+
+    Args:
+        num_slots (int): the number of frame slots.
+        height (int): frame height.
+        width (int): frame width.
+        frame_skip (str): one of `FRAME_SKIP_POLICIES`.
+    """
+
+    def __init__(self, num_slots, height, width, frame_skip="latest"):
+        assert frame_skip in FRAME_SKIP_POLICIES
+        self.num_slots = num_slots
+        self.shape = (height, width, 3)
+        self.frame_skip = frame_skip
+
+        self._frames = RawArray(ctypes.c_uint8, num_slots * height * width * 3)
+        self._timestamps = RawArray(ctypes.c_double, num_slots)
+        self._fps = RawArray(ctypes.c_double, num_slots)
+
+        self._condition = Condition()
+        self._captured = RawValue(ctypes.c_int, -1)
+        self._capture_finished = RawValue(ctypes.c_bool, False)
+        self._stopped = RawValue(ctypes.c_bool, False)
+        self._num_dropped = RawValue(ctypes.c_int, 0)
+
+        self._free_slots = Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+        self._results = Queue()
+
+    @property
+    def stopped(self):
+        return self._stopped.value
+
+    @property
+    def num_dropped(self):
+        return self._num_dropped.value
+
+    def frame(self, slot):
+        """Return the frame of the slot as a numpy array on the shared memory."""
+        frames = np.frombuffer(self._frames, dtype=np.uint8).reshape((self.num_slots,) + self.shape)
+        return frames[slot]
+
+    def timestamp(self, slot):
+        return self._timestamps[slot]
+
+    def fps(self, slot):
+        return self._fps[slot]
+
+    def acquire_slot(self, timeout=0.1):
+        """Wait for a free slot to capture a frame into. Return None when stopped."""
+        while not self.stopped:
+            try:
+                return self._free_slots.get(timeout=timeout)
+            except Empty:
+                continue
+        return None
+
+    def release_slot(self, slot):
+        self._free_slots.put(slot)
+
+    def _wait(self, predicate):
+        """Wait on the condition until `predicate` is true, the condition must be held.
+
+        `Condition.wait_for` is not available on python2.
+        """
+        while not predicate():
+            self._condition.wait()
+
+    def publish_captured(self, slot, timestamp, fps):
+        """Hand a captured frame to inference, following the frame skip policy."""
+        self._timestamps[slot] = timestamp
+        self._fps[slot] = fps
+        with self._condition:
+            if self.frame_skip == "none":
+                self._wait(lambda: self._captured.value == -1 or self.stopped)
+            elif self._captured.value != -1:
+                # inference has not taken the previous frame yet, drop it.
+                self.release_slot(self._captured.value)
+                self._num_dropped.value += 1
+            self._captured.value = slot
+            self._condition.notify_all()
+
+    def finish_capture(self):
+        with self._condition:
+            self._capture_finished.value = True
+            self._condition.notify_all()
+
+    def take_captured(self):
+        """Wait for a captured frame. Return None when capture is finished or stopped."""
+        with self._condition:
+            self._wait(lambda: self._captured.value != -1 or self._capture_finished.value or self.stopped)
+            slot = self._captured.value
+            if slot == -1 or self.stopped:
+                return None
+            self._captured.value = -1
+            self._condition.notify_all()
+            return slot
+
+    def publish_result(self, slot, result):
+        """Hand an inference result to display. `slot` None tells the end."""
+        self._results.put((slot, result))
+
+    def take_result(self, timeout=None):
+        """Wait for the latest inference result, older results are dropped.
+
+        Returns:
+            tuple: (slot, result). slot is None at the end. None when timed out.
+        """
+        try:
+            item = self._results.get(timeout=timeout)
+        except Empty:
+            return None
+
+        while item[0] is not None:
+            try:
+                newer = self._results.get_nowait()
+            except Empty:
+                break
+            self.release_slot(item[0])
+            self._num_dropped.value += 1
+            item = newer
+        return item
+
+    def drain_results(self, process, timeout=0.1):
+        """Discard results until the end sentinel of the inference `process` or its exit.
+
+        A process cannot exit until the results it put are read out of the queue,
+        so they have to be drained after stop before joining it.
+        """
+        while True:
+            try:
+                slot, _ = self._results.get(timeout=timeout)
+            except Empty:
+                if not process.is_alive():
+                    return
+                continue
+            if slot is None:
+                return
+
+    def stop(self):
+        with self._condition:
+            self._stopped.value = True
+            self._condition.notify_all()
+
+
 def add_class_label(canvas,
                     text="Hello",
                     font=cv2.FONT_HERSHEY_SIMPLEX,
@@ -79,14 +231,56 @@ def add_class_label(canvas,
     cv2.putText(canvas, text, dl_corner, font, font_scale, font_color, line_type)
 
 
-def infer_loop(q_input, q_output):
-    global nn, pre_process, post_process
-    nn.init()
-    while True:
-        img_orig, fps = q_input.get()
-        img = cv2.cvtColor(img_orig, cv2.COLOR_BGR2RGB)
-        result, _, _ = run_inference(img, nn, pre_process, post_process)
-        q_output.put((result, fps, img_orig))
+def capture_loop(ring, video_file=None):
+    if video_file:
+        vc = cv2.VideoCapture(video_file)
+    else:
+        vc = init_camera(ring.shape[1], ring.shape[0])
+
+    count_frames = 10
+    prev = deque([time.time()] * count_frames)
+
+    try:
+        while not ring.stopped:
+            slot = ring.acquire_slot()
+            if slot is None:
+                break
+
+            # capture into the shared memory slot directly when the frame size is the same.
+            frame = ring.frame(slot)
+            valid, img = vc.read(frame)
+            if not valid:
+                ring.release_slot(slot)
+                if video_file:
+                    break
+                continue
+            if img is not frame:
+                frame[:] = cv2.resize(img, (ring.shape[1], ring.shape[0]))
+
+            now = time.time()
+            prev.append(now)
+            old = prev.popleft()
+            fps = count_frames / max(now - old, 1e-9)
+            ring.publish_captured(slot, now, fps)
+    finally:
+        ring.finish_capture()
+        vc.release()
+
+
+def infer_loop(ring, model, config):
+    # load the model in this process.
+    engine = InferenceEngine(model, config)
+    try:
+        while True:
+            slot = ring.take_captured()
+            if slot is None:
+                break
+            img = cv2.cvtColor(ring.frame(slot), cv2.COLOR_BGR2RGB)
+            result = engine.predict(img)
+            ring.publish_result(slot, result)
+    finally:
+        ring.publish_result(None, None)
+
 
 def show_object_detection(img, result, fps, window_height, window_width, config):
     window_img = resize(img, size=[window_height, window_width])
@@ -115,6 +309,7 @@ def show_classification(img, result, fps, window_height, window_width, config):
 def show_semantic_segmentation(img, result, fps, window_height, window_width, config):
     orig_img = resize(img, size=[window_height, window_width])
 
+    colormap = np.array(get_color_map(len(config.CLASSES)), dtype=np.uint8)
     seg_img = label_to_color_image(result, colormap)
     seg_img = cv2.resize(seg_img, dsize=(window_width, window_height))
     window_img = cv2.addWeighted(orig_img, 1, seg_img, 0.8, 0)
@@ -126,45 +321,35 @@ def show_semantic_segmentation(img, result, fps, window_height, window_width, co
 def show_keypoint_detection(img, result, fps, window_height, window_width, config):
     window_img = resize(img, size=[window_height, window_width])
 
+    input_height, input_width = config.IMAGE_SIZE
     window_img = visualize_keypoint_detection(window_img, result[0], (input_height, input_width))
     window_img = add_fps(window_img, fps)
 
     window_name = "Keypoint Detection Demo"
     cv2.imshow(window_name, window_img)
 
-def capture_loop(q_input):
-    camera_width = 320
-    camera_height = 240
+def _print_benchmark(num_frames, num_dropped, seconds, latencies):
+    print("frames: {}, dropped frames: {}, {:.2f} sec, {:.2f} fps".format(
+        num_frames, num_dropped, seconds, num_frames / max(seconds, 1e-9)))
+    if latencies:
+        latencies = np.array(latencies) * 1000
+        print("end-to-end latency [ms]: mean {:.1f}, p50 {:.1f}, p90 {:.1f}, p99 {:.1f}".format(
+            np.mean(latencies), np.percentile(latencies, 50), np.percentile(latencies, 90),
+            np.percentile(latencies, 99)))
 
-    vc = init_camera(camera_width, camera_height)
 
-    count_frames = 10
-    prev_1 = time.clock()
-    prev = deque([prev_1] * count_frames)
-
-    while True:
-        valid, img = vc.read()
-        if valid:
-            now = time.clock()
-            prev.append(now)
-            old = prev.popleft()
-            fps = count_frames / (now - old)
-            q_input.put((img, fps))
+def run_impl(model, config, video_file=None, headless=False, frame_skip="latest", num_slots=6):
+    window_width = 320
+    window_height = 240
 
-def run_impl(config):
-    # Set variables
-    q_input = Queue(2)
-    q_output = Queue(4)
+    ring = FrameRing(num_slots, CAMERA_HEIGHT, CAMERA_WIDTH, frame_skip=frame_skip)
 
-    p_capture = Process(target=capture_loop, args=(q_input,))
+    p_capture = Process(target=capture_loop, args=(ring, video_file))
     p_capture.start()
 
-    p_infer = Process(target=infer_loop, args=(q_input, q_output))
+    p_infer = Process(target=infer_loop, args=(ring, model, config))
     p_infer.start()
 
-    window_width = 320
-    window_height = 240
-
     show_handles_table = {
         "IMAGE.OBJECT_DETECTION": show_object_detection,
         "IMAGE.CLASSIFICATION": show_classification,
@@ -173,46 +358,44 @@ def run_impl(config):
     }
     show_handle = show_handles_table[config.TASK]
 
+    num_frames = 0
+    latencies = []
+    start = time.time()
+
     #  ----------- Beginning of Main Loop ---------------
-    while True:
-        if not q_output.empty():
-            result, fps, img = q_output.get()
-            show_handle(img, result, fps, window_height, window_width, config)
-            key = cv2.waitKey(1)    # Wait for 1ms
-            if key == 27:           # ESC to quit
-                sleep(1.0)          # Wait for worker's current task is finished
-                p_capture.terminate()
-                p_infer.terminate()
-                return
+    try:
+        while True:
+            # block until a result comes, wake up regularly to handle window events.
+            item = ring.take_result(timeout=0.1)
+            if item is not None:
+                slot, result = item
+                if slot is None:
+                    break
+
+                if not headless:
+                    show_handle(ring.frame(slot), result, ring.fps(slot), window_height, window_width, config)
+                latencies.append(time.time() - ring.timestamp(slot))
+                num_frames += 1
+                ring.release_slot(slot)
+
+            if not headless:
+                key = cv2.waitKey(1)    # Wait for 1ms
+                if key == 27:           # ESC to quit
+                    break
     # --------------------- End of main Loop -----------------------
+    finally:
+        ring.stop()
+        ring.drain_results(p_infer)
+        p_capture.join()
+        p_infer.join()
 
+    if headless:
+        _print_benchmark(num_frames, ring.num_dropped, time.time() - start, latencies)
 
-def run(model, config_file):
-    global nn, pre_process, post_process
-    filename, file_extension = os.path.splitext(model)
-    supported_files = ['.so', '.pb']
-
-    if file_extension not in supported_files:
-        raise Exception("""
-            Unknown file type. Got %s%s.
-            Please check the model file (-m).
-            Only .pb (protocol buffer) or .so (shared object) file is supported.
-            """ % (filename, file_extension))
 
+def run(model, config_file, video_file=None, headless=False, frame_skip="latest"):
     config = load_yaml(config_file)
-    pre_process = build_pre_process(config.PRE_PROCESSOR)
-    post_process = build_post_process(config.POST_PROCESSOR)
-
-    if file_extension == '.so':  # Shared library
-        nn = NNLib()
-        nn.load(model)
-
-    elif file_extension == '.pb':  # Protocol Buffer file
-        # only load tensorflow if user wants to use GPU
-        from lmnet.tensorflow_graph_runner import TensorflowGraphRunner
-        nn = TensorflowGraphRunner(model)
-
-    run_impl(config)
+    run_impl(model, config, video_file=video_file, headless=headless, frame_skip=frame_skip)
 
 
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
@@ -234,9 +417,31 @@ def run(model, config_file):
     help=u"Config file Path",
     default="../models/meta.yaml",
 )
-def main(model, config_file):
+@click.option(
+    "-v",
+    "--video_file",
+    type=click.Path(exists=True),
+    help=u"Video file to read frames from instead of the camera",
+    default=None,
+)
+@click.option(
+    "--headless",
+    is_flag=True,
+    help=u"Don't show windows, print frame rate and latency at the end",
+    default=False,
+)
+@click.option(
+    "--frame_skip",
+    type=click.Choice(FRAME_SKIP_POLICIES),
+    help=u"""
+        latest: infer the newest frame and drop older ones, for one frame latency.
+        none: infer every frame.
+    """,
+    default="latest",
+)
+def main(model, config_file, video_file, headless, frame_skip):
     _check_deprecated_arguments()
-    run(model, config_file)
+    run(model, config_file, video_file=video_file, headless=headless, frame_skip=frame_skip)
 
 
 def _check_deprecated_arguments():
@@ -0,0 +1,174 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from blueoil.cmd import convert
+from blueoil.cmd.convert import (
+    BUILD_DIR_NAME,
+    MAKE_LIST,
+    group_targets,
+    make_all,
+    prepare_build_directory,
+    select_targets,
+)
+
+TEMPLATE_MAKEFILE = str(
+    Path(__file__).resolve().parents[2] / "dlk" / "python" / "dlk" / "templates" / "Makefile"
+)
+
+MAKEFILE = """\
+lm_x86:           CXX = g++
+lm_x86:           FLAGS += $(INCLUDES) -O3 -std=c++14 -pthread -g
+lm_x86:           CXXFLAGS +=
+
+lib_x86:           CXX = g++
+lib_x86:           FLAGS += $(INCLUDES) -O3 -std=c++14 -fPIC -fvisibility=hidden -pthread -g
+lib_x86:           CXXFLAGS +=
+
+ar_x86:           AR = ar
+ar_x86:           CXX = g++
+ar_x86:           FLAGS += $(INCLUDES)   -O3 -std=c++14 -fPIC -fvisibility=hidden -pthread -g
+ar_x86:           LDFLAGS += -rcs
+
+lib_arm:           CXX = arm-linux-gnueabihf-g++
+lib_arm:           FLAGS += $(INCLUDES) -O3 -std=c++14 -fPIC -DUSE_NEON -fvisibility=hidden -pthread -g
+lib_arm:           CXXFLAGS +=
+"""
+
+
+class FakeMake:
+    """Replace `subprocess.run` of make and strip.
+
+    `make <target>` writes the output file of the target into the working directory,
+    except for the targets in `failures` which exit with their return code.
+    """
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.outputs = dict(MAKE_LIST)
+        self.calls = []
+
+    def __call__(self, args, cwd=None, env=None, **kwargs):
+        self.calls.append((tuple(args), cwd, env))
+        if args[0] != "make":
+            return subprocess.CompletedProcess(args, 0)
+
+        target = args[1]
+        if target in self.failures:
+            return subprocess.CompletedProcess(args, self.failures[target])
+        with open(os.path.join(cwd, self.outputs[target]), "w") as f:
+            f.write(target)
+        return subprocess.CompletedProcess(args, 0)
+
+    def make_calls(self):
+        return [(args, cwd, env) for args, cwd, env in self.calls if args[0] == "make"]
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    project_dir = tmp_path / "project.prj"
+    (project_dir / "src").mkdir(parents=True)
+    (project_dir / "Makefile").write_text(MAKEFILE)
+    (project_dir / "src" / "network.cpp").write_text("int main() { return 0; }\n")
+    return str(project_dir)
+
+
+def test_select_targets():
+    assert select_targets() == MAKE_LIST
+    assert select_targets([]) == MAKE_LIST
+
+    # targets are in the order of MAKE_LIST, and may be comma separated.
+    assert select_targets(["lib_x86"]) == [["lib_x86", "lib_x86.so"]]
+    assert select_targets(["lib_x86, lm_x86", "lib_x86"]) == [["lm_x86", "lm_x86.elf"], ["lib_x86", "lib_x86.so"]]
+    assert select_targets(["ar_fpga,", "lib_arm"]) == [["lib_arm", "lib_arm.so"], ["ar_fpga", "libdlk_fpga.a"]]
+
+
+def test_select_targets_unknown():
+    with pytest.raises(ValueError, match="lib_unknown"):
+        select_targets(["lib_x86,lib_unknown"])
+
+
+def test_group_targets(project_dir):
+    makefile_path = os.path.join(project_dir, "Makefile")
+    make_list = select_targets(["lm_x86,lib_x86,ar_x86,lib_arm"])
+
+    # lib_x86 and ar_x86 compile the same objects, lm_x86 defines a different FLAGS.
+    assert group_targets(makefile_path, make_list) == [
+        [["lm_x86", "lm_x86.elf"]],
+        [["lib_x86", "lib_x86.so"], ["ar_x86", "libdlk_x86.a"]],
+        [["lib_arm", "lib_arm.so"]],
+    ]
+
+
+def test_group_targets_template_makefile():
+    groups = group_targets(TEMPLATE_MAKEFILE, MAKE_LIST)
+
+    # every target is made once, and the order of MAKE_LIST is kept in the groups.
+    targets = [target for group in groups for target, _ in group]
+    assert sorted(targets) == sorted(target for target, _ in MAKE_LIST)
+    for group in groups:
+        assert group == [pair for pair in MAKE_LIST if pair in group]
+
+    # the shared library and the archive of a platform are compiled once.
+    assert [["lib_x86", "lib_x86.so"], ["ar_x86", "libdlk_x86.a"]] in groups
+    # `lm_*` targets are never grouped with the others because of their CXXFLAGS.
+    for group in groups:
+        lm_targets = [target for target, _ in group if target.startswith("lm_")]
+        assert not lm_targets or len(group) == 1
+
+
+def test_prepare_build_directory(project_dir):
+    build_dir = prepare_build_directory(project_dir, "lib_x86")
+
+    assert build_dir == os.path.join(project_dir, BUILD_DIR_NAME, "lib_x86")
+    assert sorted(os.listdir(build_dir)) == ["Makefile", "src"]
+    assert os.path.samefile(os.path.join(build_dir, "src", "network.cpp"),
+                            os.path.join(project_dir, "src", "network.cpp"))
+
+    # build directories don't contain the other build directories.
+    other_dir = prepare_build_directory(project_dir, "lib_arm")
+    assert sorted(os.listdir(other_dir)) == ["Makefile", "src"]
+
+    # objects compiled in a build directory don't appear in the project nor in the other build directories.
+    Path(build_dir, "src", "network.o").write_text("object")
+    assert not os.path.exists(os.path.join(project_dir, "src", "network.o"))
+    assert not os.path.exists(os.path.join(other_dir, "src", "network.o"))
+
+    # the build directory is recreated from scratch.
+    assert prepare_build_directory(project_dir, "lib_x86") == build_dir
+    assert not os.path.exists(os.path.join(build_dir, "src", "network.o"))
+
+
+def test_make_all(monkeypatch, tmp_path, project_dir):
+    fake_make = FakeMake()
+    monkeypatch.setattr(convert.subprocess, "run", fake_make)
+    monkeypatch.delenv("CXXFLAGS", raising=False)
+    output_dir = tmp_path / "lib"
+    output_dir.mkdir()
+
+    make_all(project_dir, str(output_dir), ["lm_x86,lib_x86,ar_x86"], jobs=4)
+
+    assert sorted(os.listdir(str(output_dir))) == ["lib_x86.so", "libdlk_x86.a", "lm_x86.elf"]
+    assert not os.path.exists(os.path.join(project_dir, BUILD_DIR_NAME))
+
+    cwds = {args[1]: cwd for args, cwd, _ in fake_make.make_calls()}
+    assert cwds["lib_x86"] == cwds["ar_x86"] != cwds["lm_x86"]
+    envs = {args[1]: env for args, _, env in fake_make.make_calls()}
+    assert envs["lm_x86"]["CXXFLAGS"] == " -DFUNC_TIME_MEASUREMENT"
+    assert envs["lib_x86"]["CXXFLAGS"] == ""
+
+
+def test_make_all_failure(monkeypatch, tmp_path, project_dir):
+    fake_make = FakeMake(failures={"lib_x86": 2})
+    monkeypatch.setattr(convert.subprocess, "run", fake_make)
+    output_dir = tmp_path / "lib"
+    output_dir.mkdir()
+
+    with pytest.raises(RuntimeError, match="lib_x86"):
+        make_all(project_dir, str(output_dir), ["lm_x86,lib_x86,ar_x86,lib_arm"], jobs=4)
+
+    # the other targets of the failed group and the other groups are still made.
+    assert sorted(os.listdir(str(output_dir))) == ["lib_arm.so", "libdlk_x86.a", "lm_x86.elf"]
+    assert not os.path.exists(os.path.join(project_dir, BUILD_DIR_NAME))